@@ -12,16 +12,116 @@ EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 RERANKER_MODEL = "BAAI/bge-reranker-v2-m3"
 
 SEMANTIC_CHUNKER_THRESHOLD = 90
+# Découpage sémantique groupé (voir rag_engine/chunking.py). Sortie identique à SemanticChunker
+# avec SEMANTIC_CHILD_TARGET_CHARS = 0 (ou SEMANTIC_CHUNKER_BATCHED = False)
+SEMANTIC_CHUNKER_BATCHED = True
+SEMANTIC_CHILD_TARGET_CHARS = 1000  # Parents plus courts : un seul enfant, sans embeddings (0 = désactivé)
+SEMANTIC_EMBED_BATCH_SIZE = 512     # Phrases embeddées par appel au modèle
+
+# Parseur du pipeline Vision : "llamaparse" (LlamaCloud) ou "local" (pypdf, sans réseau)
+VISION_PARSER = os.getenv("VISION_PARSER", "llamaparse")
+PARSE_MAX_WORKERS = 4  # Fichiers envoyés au parseur en parallèle lors d'une ingestion par lots
+
+# Routage des PDF (voir rag_engine/complexity.py) : pages scannées ou riches en tableaux -> Vision
+USE_SMART_ROUTER = True
+ROUTER_MIN_CHARS_PER_KPT2 = 0.5      # Sous ce seuil (caractères / 1000 pt²) une page avec image est considérée scannée
+ROUTER_MIN_RULINGS = 12              # Rectangles/segments tracés à partir desquels une page est un tableau
+ROUTER_NUMERIC_LINE_RATIO = 0.3      # Part de lignes numériques à partir de laquelle une page est un tableau
+ROUTER_VISION_WHOLE_DOC_RATIO = 0.5  # Au-delà, tout le document part en Vision
+
+# Inférence CPU (embeddings + reranker) : "torch", "torch-int8", "onnx" ou "auto" (auto-benchmark au démarrage).
+# "auto" charge et chronomètre chaque backend (export ONNX compris) tant que cache/ n'est pas conservé entre
+# deux déploiements : à réserver aux hôtes dont le cache persiste, ou à lancer une fois pour choisir la valeur
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # 0 = valeur par défaut de PyTorch
+RERANK_BATCH_SIZE = 16
+RERANK_MAX_LENGTH = 512
+EMBED_BATCH_SIZE = 32
+
+# Serveur d'inférence partagé (multi-workers) : si défini, les workers utilisent des clients légers
+INFERENCE_SERVER_SOCKET = os.getenv("INFERENCE_SERVER_SOCKET")  # ex: /tmp/rag_inference.sock
+# La socket transporte des objets picklés : sans clé fournie, le serveur en génère une aléatoire
+# et l'écrit dans `<socket>.key` (lisible par son seul utilisateur), où les workers la lisent
+INFERENCE_SERVER_AUTHKEY = os.getenv("INFERENCE_SERVER_AUTHKEY", "").encode("utf-8")
+INFERENCE_SERVER_MAX_BATCH = 64
+INFERENCE_SERVER_MAX_WAIT_MS = 5
 
 CHUNK_SIZE = 4000 
 CHUNK_OVERLAP = 200
 
 SEARCH_K = 10 
+DEGRADED_SEARCH_K = 4  # SEARCH_K réduit quand le délai de la requête est court
 USE_RERANKER = True
 USE_HYBRID_SEARCH = True
+# Moteur BM25 : "array" (postings creux NumPy/SciPy, voir rag_engine/bm25.py) ou "rank_bm25" (historique)
+BM25_BACKEND = os.getenv("BM25_BACKEND", "array")
+BM25_K1 = 1.5
+BM25_B = 0.75
 
 MIN_RELEVANCE_SCORE = 0
 
+# Reranking en cascade (voir CascadeRerankCompressor) : évite le grand cross-encoder quand c'est inutile
+USE_RERANK_CASCADE = False
+CASCADE_SMALL_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Multilingue, ~118M paramètres
+CASCADE_ACCEPT_RANK = 2        # Étage 1 : rang max dans BM25 ET dans le vectoriel
+CASCADE_ACCEPT_MARGIN = 0.15   # Étage 1 : marge relative de score de fusion sur les autres candidats
+CASCADE_ACCEPT_SCORE = 5.0     # Étage 1 : relevance_score minimal des documents acceptés (logit nettement pertinent)
+CASCADE_SMALL_MARGIN = 2.0     # Étage 2 : écart de logit requis à la frontière du top_n
+CASCADE_SMALL_MIN_SCORE = 0    # Étage 2 : seuil de pertinence du petit modèle
+CASCADE_BIG_SLICE = 8          # Étage 3 : nombre de candidats envoyés au grand modèle
+
+# Cache des scores du reranker (clé : modèle et backend + requête normalisée + hash du passage)
+RERANK_CACHE_SIZE = 50000
+RERANK_DISK_CACHE_MAX_ROWS = 1_000_000  # Au-delà, les entrées lues le moins récemment sont supprimées
+USE_RERANK_DISK_CACHE = True
+
+# Contrôle d'admission et délais de /chat (voir rag_engine/admission.py)
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "4"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+CHAT_DEADLINE_S = 30
+DEGRADE_REDUCE_K_BELOW_S = 20      # Budget restant sous lequel SEARCH_K est réduit
+DEGRADE_SKIP_RERANK_BELOW_S = 12   # ... sous lequel le reranking est sauté
+DEGRADE_SKIP_CONDENSE_BELOW_S = 8  # ... sous lequel la reformulation de la question est sautée
+
+# Executors dédiés du chemin async (voir rag_engine/aio.py)
+MODEL_EXECUTOR_WORKERS = int(os.getenv("MODEL_EXECUTOR_WORKERS", "2"))  # Reranking
+EMBED_EXECUTOR_WORKERS = int(os.getenv("EMBED_EXECUTOR_WORKERS", "1"))  # Embedding de la requête (passe courte)
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", "2"))      # Scoring BM25
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "16"))       # Docstore, Chroma, index ANN
+LOOP_LAG_INTERVAL_MS = 50  # Période de mesure du retard de la boucle d'événements (/metrics)
+
+# Traitement par lots (/chat/batch)
+BATCH_MAX_QUESTIONS = 1000
+BATCH_LLM_CONCURRENCY = 8
+BATCH_RETRIEVAL_CHUNK = 50  # Questions recherchées par place d'admission (priorité basse, cède aux requêtes /chat)
+
+# Namespaces (corpus séparés par équipe) : chacun a sa collection, son docstore et son index BM25
+DEFAULT_NAMESPACE = "default"  # Utilise les emplacements historiques ci-dessous
+MAX_LOADED_NAMESPACES = int(os.getenv("MAX_LOADED_NAMESPACES", "4"))  # Namespaces gardés en mémoire (LRU)
+
+# Profilage à la demande (voir rag_engine/profiling.py) : désactivé tant qu'aucun jeton admin n'est défini
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN")  # En-tête X-Admin-Token des endpoints /admin/*
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Part des requêtes profilées d'office
+PROFILE_SAMPLE_PATHS = ["/chat"]
+PROFILE_SAMPLE_INTERVAL_MS = 5
+PROFILE_MAX_CONCURRENT = 2     # Profils de requêtes simultanés (un thread d'échantillonnage chacun)
+PROFILE_MAX_WINDOW_S = 60
+PROFILE_KEEP = 20              # Profils et instantanés mémoire conservés
+TRACEMALLOC_FRAMES = 25
+
+# Base vectorielle : "chroma" (défaut) ou "local" (index ANN en processus, voir rag_engine/ann_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+COLLECTION_NAME = "full_documents"
+ANN_INDEX_TYPE = "hnsw"  # "hnsw" (hnswlib) ou "ivf" (NumPy)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64  # Plus haut = meilleur rappel, latence plus élevée
+IVF_NLIST = 256
+IVF_NPROBE = 16
+# Champs indexés pour le pré-filtrage (index ANN local et BM25)
+METADATA_FILTER_FIELDS = ["source", "pipeline", "header_path_1", "header_path_2", "header_path_3"]
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(BASE_DIR)) 
 
@@ -30,4 +130,15 @@ PERSIST_DIR = os.path.join(PROJECT_ROOT, "chroma_db")
 DOC_STORE_DIR = os.path.join(PROJECT_ROOT, "doc_store") 
 CACHE_DIR = os.path.join(PROJECT_ROOT, "cache") 
 LLM_CACHE_DB = os.path.join(CACHE_DIR, "llm_cache.db")
+RERANK_CACHE_DB = os.path.join(CACHE_DIR, "rerank_cache.db")
+INFERENCE_AUTOTUNE_FILE = os.path.join(CACHE_DIR, "inference_backend.json")
 EMBEDDINGS_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings_cache")
+PARSE_CACHE_DIR = os.path.join(CACHE_DIR, "parse_cache")
+ANN_INDEX_DIR = os.path.join(PROJECT_ROOT, "ann_index")
+BM25_INDEX_PATH = os.path.join(PROJECT_ROOT, "bm25_index.pkl")
+DOC_MAP_DB = os.path.join(PROJECT_ROOT, "doc_map.db")  # Correspondance source -> parents -> enfants
+NAMESPACES_DIR = os.path.join(PROJECT_ROOT, "namespaces")  # Un sous-dossier par namespace (hors défaut)
+
+# Démarrage : archive de snapshot à restaurer si le docstore est vide, warmup en arrière-plan
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+BACKGROUND_WARMUP = os.getenv("BACKGROUND_WARMUP", "1") == "1"
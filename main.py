@@ -3,39 +3,93 @@ import os
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Header
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import uvicorn
 from sqlalchemy.orm import Session
-from rag_engine.service import setup_rag_system
-from database import init_db, get_db
+from rag_engine.service import setup_rag_system, warmup_retriever, SetupCancelled
+from database import init_db, get_db, SessionLocal
 from models import ChatSession, ChatMessage
 from langchain_core.messages import HumanMessage, AIMessage
-from schemas import ChatRequest, ChatResponse, ChatSessionSchema, ChatMessageSchema
-from typing import List
+from schemas import ChatRequest, ChatResponse, ChatSessionSchema, ChatMessageSchema, BatchChatRequest
+from typing import List, Optional
 from fastapi import UploadFile, File
 import shutil
-from config import DATA_DIR
+from config import DATA_DIR, BACKGROUND_WARMUP, CHAT_DEADLINE_S, BATCH_MAX_QUESTIONS, DEFAULT_NAMESPACE
+from rag_engine.batch import BatchAnswerer
+import asyncio
+import threading
+import json
+import time
 from rag_engine.loader import load_and_split_documents
-from rag_engine.vector_store import index_documents
+from rag_engine.vector_store import get_rerank_stats, _extract_bm25
+from rag_engine.documents import delete_source, replace_source, list_sources, vacuum
+from rag_engine.filters import build_where_filter, retrieval_filter
+from rag_engine.coalescing import SingleFlight, make_flight_key
+from rag_engine.admission import AdmissionController, AdmissionRejected, plan_degradation, degradation_scope
+from rag_engine.namespaces import NamespaceManager, FanOutRetriever, namespace_paths, namespace_exists, list_namespaces
+from rag_engine.profiling import profiler
+from rag_engine.aio import LoopLagMonitor, executor_stats
 
 rag_system = None
 retriever = None
+rag_status = {"status": "starting", "detail": None}
+batch_answerers = {}  # Un BatchAnswerer par combinaison de namespaces
+namespace_manager = None
+# Regroupe les questions identiques posées en même temps (une seule exécution de la chaîne)
+chat_flight = SingleFlight()
+# Retard de la boucle d'événements (travail bloquant exécuté dans la boucle)
+loop_lag = LoopLagMonitor()
+# Limite la concurrence devant la chaîne RAG (429 + Retry-After quand la file est pleine)
+admission = AdmissionController()
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    init_db()
-    global rag_system, retriever
-    print("🚀 Démarrage de l'API RAG...")
+def too_many_requests(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+# Signale au thread de configuration que l'API s'arrête
+startup_stop = threading.Event()
+
+async def initialize_rag():
+    """Charge le système RAG hors de la boucle d'événements puis préchauffe les modèles."""
+    global rag_system, retriever, namespace_manager
     try:
-        rag_system, retriever = setup_rag_system()
+        chain, loaded_retriever = await asyncio.to_thread(setup_rag_system, startup_stop)
+        if startup_stop.is_set():
+            return
+        await asyncio.to_thread(warmup_retriever, loaded_retriever)
+        namespace_manager = NamespaceManager(loaded_retriever, chain)
+        rag_system, retriever = chain, loaded_retriever
+        rag_status["status"] = "ready"
         print("✅ Système RAG initialisé avec succès")
+    except SetupCancelled as e:
+        print(f"🛑 {e}")
     except Exception as e:
+        rag_status["status"] = "error"
+        rag_status["detail"] = str(e)
         print(f"❌ Erreur lors de l'initialisation du RAG: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    print("🚀 Démarrage de l'API RAG...")
+    loop_lag.start()
+    warmup_task = None
+    if BACKGROUND_WARMUP:
+        # L'API répond immédiatement ; /health indique quand le RAG est prêt
+        warmup_task = asyncio.create_task(initialize_rag())
+    else:
+        await initialize_rag()
     
     yield
     
+    if warmup_task is not None and not warmup_task.done():
+        # Annuler la tâche ne stoppe pas le thread : il s'arrête à la prochaine étape de la configuration
+        startup_stop.set()
+        warmup_task.cancel()
+    loop_lag.stop()
+    
     print("🛑 Arrêt de l'API RAG...")
 
 app = FastAPI(title="RAG API", description="API pour le système RAG", lifespan=lifespan)
@@ -48,6 +102,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profil CPU de la requête si demandé par un admin (?profile=1 ou X-Profile: 1) ou tiré au sort."""
+    requested = (request.query_params.get("profile") == "1" or request.headers.get("X-Profile") == "1") \
+        and profiler.is_admin(request.headers.get("X-Admin-Token"))
+    sampler = profiler.start_request(request.url.path, requested)
+    if sampler is None:
+        return await call_next(request)
+    try:
+        # Réponses en streaming : seul le début (jusqu'aux en-têtes) est profilé
+        response = await call_next(request)
+    finally:
+        profile_id = profiler.finish(sampler, f"{request.method} {request.url.path}")
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Endpoints /admin/* : invisibles (404) si le profilage est désactivé, 403 sans le bon jeton."""
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Jeton admin invalide")
+
 @app.get("/sessions", response_model=List[ChatSessionSchema])
 def get_sessions(db: Session = Depends(get_db)):
     """Récupère la liste de toutes les sessions de chat, triées par épinglage puis date"""
@@ -89,10 +166,30 @@ def get_session_messages(session_id: int, db: Session = Depends(get_db)):
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, db: Session = Depends(get_db)):
-    global rag_system
+    global rag_system, retriever
     if not rag_system:
         raise HTTPException(status_code=503, detail="Le système RAG n'est pas encore prêt")
 
+    deadline = time.monotonic() + (request.deadline_ms / 1000 if request.deadline_ms else CHAT_DEADLINE_S)
+    namespaces = request.namespaces or [DEFAULT_NAMESPACE]
+    try:
+        data_dirs = [namespace_paths(name).data_dir for name in namespaces]
+        where = build_where_filter(request.sources, request.header_path_prefix, data_dirs)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    unknown = [name for name in namespaces if not namespace_exists(name)]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Namespace inconnu : {', '.join(unknown)}")
+
+    # Refus immédiat si la file est pleine (avant d'écrire en base)
+    try:
+        admission.reject_if_saturated()
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
+
+    # En multi-workers, récupère l'index BM25 mis à jour par un autre worker
+    await namespace_manager.async_sync_bm25(namespaces)
+
     session = None
     if request.session_id:
         session = db.query(ChatSession).filter(ChatSession.id == request.session_id).first()
@@ -119,10 +216,24 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
             elif msg["role"] == "assistant":
                 chat_history.append(AIMessage(content=msg["content"]))
 
-        response = await rag_system.ainvoke({
-            "input": request.question,
-            "chat_history": chat_history
-        })
+        async def run_chain():
+            # Namespaces chargés à la demande (hors file d'admission : chargement disque, pas d'inférence)
+            chain = await asyncio.to_thread(namespace_manager.get_chain, namespaces)
+            async with admission.admit(timeout_s=max(0.0, deadline - time.monotonic())):
+                # Dégradations choisies selon le budget restant après l'attente en file
+                degradation = plan_degradation(deadline - time.monotonic())
+                # Le filtre est appliqué dans Chroma et BM25 avant le calcul des scores
+                with retrieval_filter(where), degradation_scope(degradation):
+                    response = await chain.ainvoke({
+                        "input": request.question,
+                        "chat_history": chat_history
+                    })
+                return response, degradation.applied
+
+        flight_key = make_flight_key(request.question, request.history, where, namespaces, request.deadline_ms)
+        response, degradations = await chat_flight.run(flight_key, run_chain)
+        if degradations:
+            print(f"⏳ Dégradations appliquées : {', '.join(degradations)}")
 
         context_docs = response.get("context", [])
         context_texts = [doc.page_content for doc in context_docs]
@@ -146,33 +257,223 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
         return ChatResponse(
             answer=response["answer"],
             context=context_texts,
-            session_id=session.id
+            session_id=session.id,
+            degradations=degradations
         )
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
     except Exception as e:
         print(f"Erreur lors du chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    global retriever
-    if not retriever:
+def persist_batch_result(question: str, answer: str) -> int:
+    """Enregistre une question/réponse d'un lot comme une session (session DB propre : appelée hors de la boucle)."""
+    with SessionLocal() as db:
+        session = ChatSession(title=question[:50] + "...")
+        db.add(session)
+        db.flush()
+        db.add(ChatMessage(session_id=session.id, role="user", content=question))
+        db.add(ChatMessage(session_id=session.id, role="assistant", content=answer))
+        db.commit()
+        return session.id
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    Répond à une liste de questions (sans historique) et renvoie les résultats en NDJSON,
+    une ligne par question, dans l'ordre d'arrivée des réponses.
+    """
+    if not rag_system:
         raise HTTPException(status_code=503, detail="Le système RAG n'est pas encore prêt")
-    
-    file_path = os.path.join(DATA_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
+    if not request.questions:
+        raise HTTPException(status_code=422, detail="Aucune question fournie")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=422, detail=f"Maximum {BATCH_MAX_QUESTIONS} questions par lot")
+    names = sorted(set(request.namespaces or [DEFAULT_NAMESPACE]))
+    try:
+        data_dirs = [namespace_paths(name).data_dir for name in names]
+        where = build_where_filter(request.sources, request.header_path_prefix, data_dirs)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    unknown = [name for name in names if not namespace_exists(name)]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Namespace inconnu : {', '.join(unknown)}")
+
+    try:
+        admission.reject_if_saturated()
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
+
+    await namespace_manager.async_sync_bm25(names)
+    try:
+        targets = [await asyncio.to_thread(namespace_manager.get_retriever, name) for name in names]
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Namespace inconnu : {e.args[0]}")
+    answerer = batch_answerers.get(tuple(names))
+    if answerer is None or any(a is not b for a, b in zip(answerer.retrievers, targets)):
+        target = targets[0] if len(targets) == 1 else FanOutRetriever(retrievers=targets, names=names)
+        answerer = batch_answerers[tuple(names)] = BatchAnswerer(target)
+
+    async def stream_results():
+        async for result in answerer.stream(request.questions, where, request.max_concurrency, admission):
+            if request.persist and "answer" in result:
+                result["session_id"] = await asyncio.to_thread(persist_batch_result, result["question"], result["answer"])
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.get("/health")
+def health():
+    """État de préparation du système RAG (503 tant que les modèles ne sont pas chargés)"""
+    status_code = 200 if rag_status["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=rag_status)
+
+@app.get("/metrics")
+def get_metrics():
+    """Compteurs de performance des composants du RAG"""
+    return {
+        "rerank": get_rerank_stats(retriever) if retriever else None,
+        "coalescing": chat_flight.get_stats(),
+        "admission": admission.get_stats(),
+        "namespaces": namespace_manager.get_stats() if namespace_manager else None,
+        "profiling": profiler.get_stats(),
+        "event_loop_lag": loop_lag.get_stats(),
+        "executors": executor_stats(),
+    }
+
+def _folded(content: str, name: str) -> PlainTextResponse:
+    """Profil au format "collapsed stacks" (flamegraph.pl, speedscope, inferno)."""
+    return PlainTextResponse(content, headers={"Content-Disposition": f'attachment; filename="{name}.folded"'})
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def get_profiles():
+    """Profils CPU disponibles (requêtes profilées et fenêtres d'échantillonnage)"""
+    return profiler.list_profiles()
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def download_profile(profile_id: str):
+    """Télécharge un profil CPU"""
+    content = profiler.get_profile(profile_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Profil non trouvé")
+    return _folded(content, f"profile-{profile_id}")
+
+@app.post("/admin/profiles/cpu", dependencies=[Depends(require_admin)])
+async def profile_cpu_window(seconds: float = 10, include_idle: bool = False):
+    """Échantillonne tout le processus pendant `seconds` puis renvoie le profil"""
+    profile_id = await profiler.cpu_window(seconds, include_idle)
+    return _folded(profiler.get_profile(profile_id), f"profile-{profile_id}")
+
+@app.post("/admin/memory/snapshots", dependencies=[Depends(require_admin)])
+def take_memory_snapshot():
+    """Instantané tracemalloc (le premier démarre le traçage des allocations)"""
+    return {"id": profiler.take_snapshot()}
+
+@app.get("/admin/memory/diff", dependencies=[Depends(require_admin)])
+def memory_diff(from_id: str, to_id: Optional[str] = None, limit: int = 30,
+                key_type: str = "lineno", format: str = "json"):
+    """Variation des allocations entre deux instantanés (`to_id` absent : maintenant)"""
+    if key_type not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=422, detail="key_type : lineno, filename ou traceback")
+    try:
+        if format == "collapsed":
+            return _folded(profiler.memory_collapsed(from_id, to_id), f"memory-{from_id}")
+        return profiler.memory_diff(from_id, to_id, limit, key_type)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Instantané non trouvé")
+
+@app.delete("/admin/memory", dependencies=[Depends(require_admin)])
+def stop_memory_tracing():
+    """Arrête tracemalloc et oublie les instantanés"""
+    profiler.stop_memory()
+    return {"message": "Traçage mémoire arrêté"}
+
+def _save_upload(file: UploadFile, filename: str, data_dir: str = DATA_DIR) -> str:
+    """Écrit le fichier reçu à côté de sa destination (fichier caché, ignoré par le loader)."""
+    upload_path = os.path.join(data_dir, f".uploading-{filename}")
+    with open(upload_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
+    return upload_path
+
+def _discard_upload(upload_path: str) -> None:
+    """Supprime le fichier reçu s'il n'a pas été promu (erreur de traitement ou d'indexation)."""
+    if os.path.exists(upload_path):
+        os.remove(upload_path)
+
+async def _namespace_target(namespace: str, create: bool = False):
+    """(retriever, dossier de données) d'un namespace, chargé à la demande."""
+    if not retriever:
+        raise HTTPException(status_code=503, detail="Le système RAG n'est pas encore prêt")
+    try:
+        paths = namespace_paths(namespace)
+        target = await asyncio.to_thread(namespace_manager.get_retriever, namespace, create)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Namespace inconnu : {namespace}")
+    return target, paths.data_dir
+
+@app.post("/upload")
+async def upload_file(file: UploadFile = File(...), namespace: str = DEFAULT_NAMESPACE):
+    target, data_dir = await _namespace_target(namespace, create=True)
     
-    print(f"📁 Fichier uploadé : {file.filename}")
-    
-    from rag_engine.router import DocumentRouter
-    router = DocumentRouter()
-    documents = router.route_and_process(file_path)
+    filename = os.path.basename(file.filename)
+    upload_path = _save_upload(file, filename, data_dir)
+    print(f"📁 Fichier uploadé : {filename} (namespace '{namespace}')")
     
-    if documents:
-        index_documents(retriever, documents)
-        return {"message": f"Document '{file.filename}' ajouté avec succès. {len(documents)} fragments indexés."}
-    else:
-        return {"message": f"Échec du traitement du document '{file.filename}'."}
+    # Un document déjà indexé sous ce nom est remplacé (pas de doublons dans les index)
+    try:
+        result = await asyncio.to_thread(replace_source, target, filename, upload_path, data_dir)
+    except ValueError:
+        return {"message": f"Échec du traitement du document '{filename}'."}
+    finally:
+        _discard_upload(upload_path)
+    if namespace != DEFAULT_NAMESPACE and _extract_bm25(target)[0] is None:
+        # Premier document du namespace : rechargement pour activer la recherche hybride
+        namespace_manager.evict(namespace)
+    return {"message": f"Document '{filename}' ajouté avec succès. {result['fragments']} fragments indexés."}
+
+@app.get("/namespaces")
+def get_namespaces():
+    """Namespaces existants et namespaces actuellement chargés en mémoire"""
+    return {
+        "namespaces": list_namespaces(),
+        "loaded": namespace_manager.get_stats()["loaded"] if namespace_manager else [],
+    }
+
+@app.get("/documents")
+async def get_documents(namespace: str = DEFAULT_NAMESPACE):
+    """Liste des documents indexés (nombre de parents et d'enfants par source)"""
+    target, _ = await _namespace_target(namespace)
+    return list_sources(target)
+
+@app.put("/documents/{source}")
+async def put_document(source: str, file: UploadFile = File(...), namespace: str = DEFAULT_NAMESPACE):
+    """Remplace un document (ou l'ajoute) : l'ancienne version est retirée de tous les index"""
+    target, data_dir = await _namespace_target(namespace, create=True)
+    filename = os.path.basename(source)
+    upload_path = _save_upload(file, filename, data_dir)
+    try:
+        return await asyncio.to_thread(replace_source, target, filename, upload_path, data_dir)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        _discard_upload(upload_path)
+
+@app.delete("/documents/{source}")
+async def delete_document(source: str, namespace: str = DEFAULT_NAMESPACE):
+    """Supprime un document du docstore, de la base vectorielle, de BM25 et des caches"""
+    target, data_dir = await _namespace_target(namespace)
+    try:
+        return await asyncio.to_thread(delete_source, target, source, True, data_dir)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+
+@app.post("/documents/vacuum")
+async def vacuum_documents(namespace: str = DEFAULT_NAMESPACE):
+    """Compaction : purge les données orphelines et récupère l'espace disque"""
+    target, _ = await _namespace_target(namespace)
+    return await asyncio.to_thread(vacuum, target)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
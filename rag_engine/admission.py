@@ -0,0 +1,187 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from config import (
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    DEGRADE_REDUCE_K_BELOW_S,
+    DEGRADE_SKIP_RERANK_BELOW_S,
+    DEGRADE_SKIP_CONDENSE_BELOW_S,
+    DEGRADED_SEARCH_K,
+    SEARCH_K,
+)
+
+
+class AdmissionRejected(Exception):
+    """Levée quand la file d'attente est pleine : le client doit réessayer après `retry_after` secondes."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Serveur saturé, réessayez dans {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Degradation:
+    """
+    Dégradations appliquées à une requête pour tenir son délai.
+
+    Chaque étape supprimée réduit la qualité de la réponse mais évite l'expiration de la requête.
+    """
+    search_k: Optional[int] = None
+    skip_rerank: bool = False
+    skip_condensation: bool = False
+    applied: List[str] = field(default_factory=list)
+
+    def scale_k(self, k: int) -> int:
+        """Réduit un nombre de candidats proportionnellement à DEGRADED_SEARCH_K / SEARCH_K."""
+        if self.search_k is None:
+            return k
+        return max(1, k * self.search_k // SEARCH_K)
+
+
+_NO_DEGRADATION = Degradation()
+_current_degradation: ContextVar[Degradation] = ContextVar("degradation", default=_NO_DEGRADATION)
+
+
+def get_degradation() -> Degradation:
+    """Dégradations actives pour la requête en cours."""
+    return _current_degradation.get()
+
+
+@contextmanager
+def degradation_scope(degradation: Degradation):
+    token = _current_degradation.set(degradation)
+    try:
+        yield degradation
+    finally:
+        _current_degradation.reset(token)
+
+
+def plan_degradation(remaining_s: float) -> Degradation:
+    """Choisit les dégradations en fonction du budget restant (de la plus légère à la plus forte)."""
+    degradation = Degradation()
+    if remaining_s < DEGRADE_REDUCE_K_BELOW_S:
+        degradation.search_k = DEGRADED_SEARCH_K
+        degradation.applied.append("reduced_search_k")
+    if remaining_s < DEGRADE_SKIP_RERANK_BELOW_S:
+        degradation.skip_rerank = True
+        degradation.applied.append("skipped_rerank")
+    if remaining_s < DEGRADE_SKIP_CONDENSE_BELOW_S:
+        degradation.skip_condensation = True
+        degradation.applied.append("skipped_condensation")
+    return degradation
+
+
+class AdmissionController:
+    """
+    Contrôle d'admission devant la chaîne RAG.
+
+    Admission Control: Limite le nombre de requêtes traitées simultanément et la taille de la
+    file d'attente. Au-delà, les requêtes sont refusées immédiatement (429 + Retry-After)
+    au lieu de s'accumuler derrière le reranker et d'expirer toutes ensemble.
+    """
+
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY, max_queue: int = ADMISSION_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self.admitted = 0
+        self.shed = 0
+        self.background_admitted = 0
+        self._queue_waits: deque = deque(maxlen=1000)
+        self._service_times: deque = deque(maxlen=100)
+
+    def is_saturated(self) -> bool:
+        return self._running >= self.max_concurrency and self._waiting >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Estimation du temps avant qu'une place se libère (durée de service moyenne × profondeur de file)."""
+        with self._lock:
+            mean_service = sum(self._service_times) / len(self._service_times) if self._service_times else 1.0
+        return max(1, math.ceil(mean_service * (self._waiting + 1) / self.max_concurrency))
+
+    def reject_if_saturated(self) -> None:
+        if self.is_saturated():
+            with self._lock:
+                self.shed += 1
+            raise AdmissionRejected(self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self, timeout_s: Optional[float] = None):
+        """
+        Attend une place (au plus `timeout_s`) puis exécute le bloc. Retourne le temps d'attente.
+        """
+        self.reject_if_saturated()
+        start = time.monotonic()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=timeout_s)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.shed += 1
+            raise AdmissionRejected(self.retry_after())
+        finally:
+            self._waiting -= 1
+
+        wait = time.monotonic() - start
+        with self._lock:
+            self.admitted += 1
+            self._queue_waits.append(wait)
+        self._running += 1
+        try:
+            yield wait
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+            with self._lock:
+                self._service_times.append(time.monotonic() - start - wait)
+
+    @asynccontextmanager
+    async def admit_background(self):
+        """
+        Place de priorité basse (lots) : occupe un slot du même sémaphore, mais le rend
+        tant que des requêtes interactives attendent en file. Jamais refusée : un lot attend.
+        """
+        while True:
+            await self._semaphore.acquire()
+            if self._waiting == 0:
+                break
+            self._semaphore.release()
+            await asyncio.sleep(0.05)
+        self._running += 1
+        with self._lock:
+            self.background_admitted += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            total = self.admitted + self.shed
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "waiting": self._waiting,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "background_admitted": self.background_admitted,
+                "shed_rate": round(self.shed / total, 3) if total else 0.0,
+                "queue_wait_ms": {
+                    "mean": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+                    "p95": round(1000 * waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0,
+                },
+            }
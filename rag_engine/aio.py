@@ -0,0 +1,167 @@
+import asyncio
+import contextvars
+import functools
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import MODEL_EXECUTOR_WORKERS, EMBED_EXECUTOR_WORKERS, CPU_EXECUTOR_WORKERS, IO_EXECUTOR_WORKERS, LOOP_LAG_INTERVAL_MS
+
+# Executors dédiés du chemin async : la taille de chacun borne la concurrence de son type de travail,
+# indépendamment de l'executor par défaut de la boucle (partagé avec tout le reste)
+EXECUTOR_SIZES = {
+    "model": MODEL_EXECUTOR_WORKERS,  # Reranking (passes longues)
+    "embed": EMBED_EXECUTOR_WORKERS,  # Embedding de la requête : ne fait pas la queue derrière les rerankings
+    "cpu": CPU_EXECUTOR_WORKERS,      # Calculs Python/NumPy : scoring BM25
+    "io": IO_EXECUTOR_WORKERS,        # Stores : docstore, Chroma, index ANN
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        if kind not in _executors:
+            _executors[kind] = ThreadPoolExecutor(max_workers=EXECUTOR_SIZES[kind], thread_name_prefix=f"rag-{kind}")
+        return _executors[kind]
+
+
+async def run_in(kind: str, func: Callable, *args, **kwargs) -> Any:
+    """Exécute `func` sur l'executor `kind` en propageant le contexte (filtre, dégradations de la requête)."""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(kind), functools.partial(ctx.run, func, *args, **kwargs)
+    )
+
+
+async def amget(docstore, keys: Sequence[str]) -> List[Any]:
+    """`mget` du docstore (LocalFileStore : lecture de fichiers + unpickling) hors de la boucle d'événements."""
+    if not keys:
+        return []
+    return await run_in("io", docstore.mget, list(keys))
+
+
+async def asimilarity_search(vectorstore, query: str, **kwargs) -> List[Any]:
+    """
+    Recherche vectorielle asynchrone : l'embedding de la requête passe par l'executor "embed",
+    la requête à la base (Chroma, index ANN) par celui des I/O.
+    """
+    embeddings = getattr(vectorstore, "embeddings", None)
+    if embeddings is None:
+        return await run_in("io", vectorstore.similarity_search, query, **kwargs)
+    embedding = await run_in("embed", embeddings.embed_query, query)
+    return await run_in("io", vectorstore.similarity_search_by_vector, embedding, **kwargs)
+
+
+def executor_stats() -> Dict[str, Dict[str, int]]:
+    with _executors_lock:
+        return {
+            kind: {"workers": executor._max_workers, "queued": executor._work_queue.qsize()}
+            for kind, executor in _executors.items()
+        }
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LoopLagMonitor:
+    """
+    Retard de la boucle d'événements : une tâche dort `interval_s` et mesure de combien son réveil
+    est en retard. Un retard élevé signifie que du travail bloquant s'exécute dans la boucle.
+    """
+
+    def __init__(self, interval_s: float = LOOP_LAG_INTERVAL_MS / 1000, window: int = 1000):
+        self.interval_s = interval_s
+        self._lags: deque = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            self._lags.append(max(0.0, time.perf_counter() - start - self.interval_s))
+
+    def start(self) -> "LoopLagMonitor":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def reset(self) -> None:
+        self._lags.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        lags = list(self._lags)
+        return {
+            "samples": len(lags),
+            "p50_ms": round(1000 * _percentile(lags, 0.5), 2),
+            "p99_ms": round(1000 * _percentile(lags, 0.99), 2),
+            "max_ms": round(1000 * max(lags, default=0.0), 2),
+        }
+
+
+async def lag_benchmark(retriever, queries: Sequence[str], concurrency: int = 16, mode: str = "async") -> Dict[str, Any]:
+    """
+    Lance `queries` avec `concurrency` recherches simultanées et mesure le débit, la latence
+    et le retard de la boucle d'événements.
+
+    `mode` : "async" (`ainvoke`, chemin natif) ou "thread" (`invoke` dans un thread, l'ancien chemin).
+    """
+    monitor = LoopLagMonitor(interval_s=0.005, window=100000).start()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(query: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            if mode == "async":
+                await retriever.ainvoke(query)
+            else:
+                await asyncio.to_thread(retriever.invoke, query)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    elapsed = time.perf_counter() - start
+    monitor.stop()
+    result = {
+        "mode": mode,
+        "concurrency": concurrency,
+        "queries": len(queries),
+        "qps": round(len(queries) / elapsed, 1),
+        "p50_ms": round(1000 * _percentile(latencies, 0.5), 1),
+        "p95_ms": round(1000 * _percentile(latencies, 0.95), 1),
+        **{f"loop_lag_{key}": value for key, value in monitor.get_stats().items() if key != "samples"},
+    }
+    print(f"   {result}")
+    return result
+
+
+def main():
+    """Usage : python -m rag_engine.aio --benchmark [concurrence] [nombre de requêtes]"""
+    if len(sys.argv) not in (2, 3, 4) or sys.argv[1] != "--benchmark":
+        print(main.__doc__)
+        sys.exit(1)
+    from .inference import _SAMPLE_QUERIES
+    from .service import setup_rag_system
+
+    concurrency = int(sys.argv[2]) if len(sys.argv) >= 3 else 16
+    count = int(sys.argv[3]) if len(sys.argv) == 4 else 200
+    _, retriever = setup_rag_system()
+    queries = [_SAMPLE_QUERIES[i % len(_SAMPLE_QUERIES)] + f" ({i})" for i in range(count)]
+    for mode in ("thread", "async"):
+        asyncio.run(lag_benchmark(retriever, queries, concurrency, mode))
+
+
+if __name__ == "__main__":
+    main()
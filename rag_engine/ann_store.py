@@ -0,0 +1,746 @@
+import io
+import json
+import os
+import pickle
+import threading
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from .filters import MetadataPostings
+
+# Import conditionnel
+try:
+    import hnswlib
+    HAS_HNSWLIB = True
+except ImportError:
+    HAS_HNSWLIB = False
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalANNVectorStore(VectorStore):
+    """
+    Base vectorielle locale (en processus) avec index ANN réglable.
+
+    ANN (Approximate Nearest Neighbors): Recherche des plus proches voisins qui accepte une
+    petite perte de rappel en échange d'une latence bien plus faible qu'une recherche exhaustive.
+
+    - "hnsw" : graphe HNSW (hnswlib), réglé par `M` (connectivité) et `ef_search` (rappel/latence).
+    - "ivf"  : partitionnement k-means en NumPy, réglé par `nlist` et `nprobe`.
+
+    Les vecteurs sont persistés en `.npy` et rechargés en mémoire mappée (mmap) pour un
+    démarrage quasi instantané ; les enregistrements (ids, textes, métadonnées) en JSON.
+    En écriture, les vecteurs sont ajoutés dans un tampon à capacité doublée, et un job
+    d'indexation n'écrit le disque qu'une fois (`deferred_persist`). Les filtres de métadonnées (`source`, `pipeline`...) sont
+    appliqués AVANT la recherche (pré-filtrage), via des index inversés sur `filter_fields`.
+
+    La persistance est incrémentale : les nouvelles lignes sont ajoutées en place à `vectors.npy`
+    et au journal `records_appended.jsonl` ; seuls `compact` et les migrations de métadonnées
+    réécrivent tout l'index.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        index_dir: str,
+        index_type: str = "hnsw",
+        M: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        nlist: int = 256,
+        nprobe: int = 16,
+        filter_fields: Sequence[str] = ("source", "pipeline"),
+        brute_force_threshold: int = 2048,
+    ):
+        if index_type == "hnsw" and not HAS_HNSWLIB:
+            print("⚠️ hnswlib non disponible. Fallback sur l'index IVF (NumPy).")
+            index_type = "ivf"
+        if index_type not in ("hnsw", "ivf"):
+            raise ValueError(f"Type d'index ANN inconnu : {index_type}")
+
+        self._embedding = embedding
+        self.index_dir = index_dir
+        self.index_type = index_type
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.filter_fields = list(filter_fields)
+        self.brute_force_threshold = brute_force_threshold
+
+        self._lock = threading.RLock()
+        self._vectors: Optional[np.ndarray] = None
+        self._buffer: Optional[np.ndarray] = None  # Tampon d'écriture dont `_vectors` est une vue
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._deleted = np.zeros(0, dtype=bool)
+        self._postings = MetadataPostings(self.filter_fields)
+        self._hnsw = None
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._defer_depth = 0
+        self._dirty = False
+        # Lignes déjà sur disque : `persist` n'ajoute que les suivantes, sauf réécriture complète
+        self._persisted_rows = 0
+        self._rewrite_needed = False
+        self._ivf_rewrite_needed = False
+
+        if os.path.exists(os.path.join(index_dir, "meta.json")):
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return int((~self._deleted).sum())
+
+    # ------------------------------------------------------------------ #
+    # Écriture
+    # ------------------------------------------------------------------ #
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_vectors(vectors, texts, metadatas, ids)
+
+    def add_vectors(
+        self,
+        vectors: Any,
+        texts: List[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        persist: bool = True,
+    ) -> List[str]:
+        """Ajoute des vecteurs déjà calculés (utilisé pour le chargement en masse)."""
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = _normalize(vectors)
+
+        with self._lock:
+            # Un id déjà présent est remplacé (sémantique "upsert" comme Chroma)
+            existing = [i for i in ids if i in self._id_to_row]
+            if existing:
+                self._mark_deleted(existing)
+
+            start = len(self._ids)
+            self._append_vectors(vectors)
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(texts), dtype=bool)])
+
+            for offset, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                row = start + offset
+                self._ids.append(doc_id)
+                self._texts.append(text)
+                self._metadatas.append(dict(metadata or {}))
+                self._id_to_row[doc_id] = row
+                self._postings.add(row, metadata or {})
+
+            self._add_to_ann(vectors, start)
+            if persist:
+                self._persist_or_defer()
+        return ids
+
+    def _append_vectors(self, vectors: np.ndarray) -> None:
+        """Ajout en O(lot) amorti : le tampon double de capacité au lieu d'un `vstack` de tout l'index."""
+        count = len(self._ids)
+        needed = count + len(vectors)
+        if self._buffer is None or len(self._buffer) < needed:
+            buffer = np.empty((max(needed, 2 * count, 1024), vectors.shape[1]), dtype=np.float32)
+            if count:
+                # Premier ajout après un chargement mmap (lecture seule) ou tampon plein : une seule copie
+                buffer[:count] = self._vectors[:count]
+            self._buffer = buffer
+        self._buffer[count:needed] = vectors
+        self._vectors = self._buffer[:needed]
+
+    def update_metadatas(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> int:
+        """Remplace les métadonnées de vecteurs existants (migrations) et reconstruit les postings."""
+        with self._lock:
+            updated = 0
+            for doc_id, metadata in zip(ids, metadatas):
+                row = self._id_to_row.get(doc_id)
+                if row is not None:
+                    self._metadatas[row] = dict(metadata)
+                    updated += 1
+            if updated:
+                self._postings = MetadataPostings(self.filter_fields)
+                for row, metadata in enumerate(self._metadatas):
+                    self._postings.add(row, metadata)
+                self._rewrite_needed = True
+                self._persist_or_defer()
+        return updated
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            self._mark_deleted([i for i in ids if i in self._id_to_row])
+            self._persist_or_defer()
+        return True
+
+    @contextmanager
+    def deferred_persist(self):
+        """
+        Regroupe les écritures d'un job d'indexation ou de suppression : `persist` n'est appelé
+        qu'une fois, à la sortie du bloc le plus externe (même en cas d'erreur).
+        """
+        with self._lock:
+            self._defer_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._defer_depth -= 1
+                if self._defer_depth == 0 and self._dirty:
+                    self.persist()
+
+    def _persist_or_defer(self) -> None:
+        if self._defer_depth:
+            self._dirty = True
+        else:
+            self.persist()
+
+    def _mark_deleted(self, ids: List[str]) -> None:
+        for doc_id in ids:
+            row = self._id_to_row.pop(doc_id)
+            self._deleted[row] = True
+            if self._hnsw is not None:
+                self._hnsw.mark_deleted(row)
+
+    # ------------------------------------------------------------------ #
+    # Index ANN
+    # ------------------------------------------------------------------ #
+
+    def _add_to_ann(self, vectors: np.ndarray, start: int) -> None:
+        labels = np.arange(start, start + len(vectors))
+        if self.index_type == "hnsw":
+            if self._hnsw is None:
+                self._hnsw = hnswlib.Index(space="ip", dim=vectors.shape[1])
+                self._hnsw.init_index(
+                    max_elements=max(1024, len(self._ids)),
+                    ef_construction=self.ef_construction,
+                    M=self.M,
+                )
+            elif self._hnsw.get_max_elements() < len(self._ids):
+                self._hnsw.resize_index(max(len(self._ids), 2 * self._hnsw.get_max_elements()))
+            self._hnsw.add_items(vectors, labels)
+        else:
+            if self._centroids is None and len(self._ids) >= 4 * self.nlist:
+                self.train_ivf()
+            elif self._centroids is not None:
+                assignments = np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+                self._assignments = np.concatenate([self._assignments, assignments])
+            else:
+                self._assignments = np.concatenate(
+                    [self._assignments, np.full(len(vectors), -1, dtype=np.int32)]
+                )
+
+    def train_ivf(self, iterations: int = 10, seed: int = 0) -> None:
+        """Entraîne les centroïdes IVF (k-means sphérique) sur les vecteurs actifs."""
+        with self._lock:
+            live = np.flatnonzero(~self._deleted)
+            nlist = min(self.nlist, len(live))
+            if nlist == 0:
+                return
+            rng = np.random.default_rng(seed)
+            sample = live if len(live) <= 64 * nlist else rng.choice(live, 64 * nlist, replace=False)
+            data = np.asarray(self._vectors[sample])
+            centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assign = np.argmax(data @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = data[assign == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+            self._centroids = centroids
+            self._ivf_rewrite_needed = True
+            self._assignments = np.argmax(
+                np.asarray(self._vectors) @ centroids.T, axis=1
+            ).astype(np.int32)
+
+    # ------------------------------------------------------------------ #
+    # Recherche
+    # ------------------------------------------------------------------ #
+
+    def _candidate_mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Calcule le masque des lignes autorisées par le filtre (None = pas de filtre)."""
+        if not where:
+            return None
+        return self._postings.mask(where, self._metadatas) & ~self._deleted
+
+    def _search_rows(
+        self, query_vector: np.ndarray, k: int, where: Optional[Dict[str, Any]]
+    ) -> List[Tuple[int, float]]:
+        with self._lock:
+            if not self._ids:
+                return []
+            mask = self._candidate_mask(where)
+            allowed = np.flatnonzero(mask) if mask is not None else None
+
+            # Filtre très sélectif ou petit corpus : recherche exacte sur les candidats
+            if allowed is not None and len(allowed) <= self.brute_force_threshold:
+                return self._exact(query_vector, k, allowed)
+            if len(self._ids) <= self.brute_force_threshold:
+                return self._exact(query_vector, k, np.flatnonzero(~self._deleted))
+
+            if self.index_type == "hnsw":
+                return self._search_hnsw(query_vector, k, mask)
+            return self._search_ivf(query_vector, k, mask)
+
+    def _exact(self, query_vector: np.ndarray, k: int, rows: np.ndarray) -> List[Tuple[int, float]]:
+        if len(rows) == 0:
+            return []
+        scores = np.asarray(self._vectors[rows]) @ query_vector
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def _search_hnsw(self, query_vector: np.ndarray, k: int, mask: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        live = self._hnsw.get_current_count() - int(self._deleted.sum())
+        k = min(k, live)
+        if k <= 0:
+            return []
+        self._hnsw.set_ef(max(self.ef_search, k))
+        row_filter = (lambda label: bool(mask[label])) if mask is not None else None
+        try:
+            labels, distances = self._hnsw.knn_query(query_vector, k=k, filter=row_filter)
+        except RuntimeError:
+            # Filtre trop restrictif pour le graphe : recherche exacte sur les candidats
+            allowed = ~self._deleted if mask is None else mask
+            return self._exact(query_vector, k, np.flatnonzero(allowed))
+        # Espace "ip" de hnswlib : distance = 1 - produit scalaire
+        return [(int(l), float(1.0 - d)) for l, d in zip(labels[0], distances[0])]
+
+    def _search_ivf(self, query_vector: np.ndarray, k: int, mask: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        allowed = ~self._deleted if mask is None else mask
+        if self._centroids is None:
+            return self._exact(query_vector, k, np.flatnonzero(allowed))
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = np.argpartition(-(self._centroids @ query_vector), nprobe - 1)[:nprobe]
+        rows = np.flatnonzero(np.isin(self._assignments, probes) & allowed)
+        return self._exact(query_vector, k, rows)
+
+    def _rows_to_documents(self, rows: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        results = []
+        for row, similarity in rows:
+            doc = Document(
+                page_content=self._texts[row],
+                metadata=dict(self._metadatas[row]),
+                id=self._ids[row],
+            )
+            # Distance cosinus, comme Chroma
+            results.append((doc, 1.0 - similarity))
+        return results
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        query_vector = _normalize(self._embedding.embed_query(query))[0]
+        return self._rows_to_documents(self._search_rows(query_vector, k, filter))
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        query_vector = _normalize(embedding)[0]
+        return [doc for doc, _ in self._rows_to_documents(self._search_rows(query_vector, k, filter))]
+
+    def similarity_search_by_vectors(
+        self, embeddings: Sequence[List[float]], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Document]]:
+        """
+        Recherche groupée pour plusieurs requêtes : un seul produit matriciel en recherche exacte,
+        ou une seule requête HNSW pour tout le lot.
+        """
+        queries = _normalize(embeddings)
+        with self._lock:
+            if not self._ids:
+                return [[] for _ in queries]
+            mask = self._candidate_mask(filter)
+            rows = np.flatnonzero(mask if mask is not None else ~self._deleted)
+
+            if len(rows) <= self.brute_force_threshold:
+                results = []
+                if len(rows) == 0:
+                    return [[] for _ in queries]
+                scores = np.asarray(self._vectors[rows]) @ queries.T
+                top_k = min(k, len(rows))
+                for column in scores.T:
+                    top = np.argpartition(-column, top_k - 1)[:top_k]
+                    top = top[np.argsort(-column[top])]
+                    results.append([(int(rows[i]), float(column[i])) for i in top])
+            elif self.index_type == "hnsw" and mask is None:
+                self._hnsw.set_ef(max(self.ef_search, k))
+                labels, distances = self._hnsw.knn_query(queries, k=min(k, len(rows)))
+                results = [
+                    [(int(l), float(1.0 - d)) for l, d in zip(row_labels, row_distances)]
+                    for row_labels, row_distances in zip(labels, distances)
+                ]
+            else:
+                results = [self._search_rows(q, k, filter) for q in queries]
+
+        return [[doc for doc, _ in self._rows_to_documents(r)] for r in results]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self._cosine_relevance_score_fn
+
+    def iter_records(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """(id, texte, métadonnées) des vecteurs actifs."""
+        with self._lock:
+            live = np.flatnonzero(~self._deleted)
+            records = [(self._ids[r], self._texts[r], self._metadatas[r]) for r in live]
+        return iter(records)
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        with self._lock:
+            rows = [self._id_to_row[i] for i in ids if i in self._id_to_row]
+            return [doc for doc, _ in self._rows_to_documents([(r, 1.0) for r in rows])]
+
+    def compact(self) -> int:
+        """
+        Supprime physiquement les vecteurs marqués comme supprimés (tombstones) puis reconstruit
+        l'index ANN et les postings. Retourne le nombre de vecteurs récupérés.
+        """
+        with self._lock:
+            if self._vectors is None:
+                return 0
+            live = np.flatnonzero(~self._deleted)
+            removed = len(self._ids) - len(live)
+            if removed == 0:
+                return 0
+
+            self._vectors = np.asarray(self._vectors)[live]
+            self._buffer = None
+            self._ids = [self._ids[r] for r in live]
+            self._texts = [self._texts[r] for r in live]
+            self._metadatas = [self._metadatas[r] for r in live]
+            self._deleted = np.zeros(len(live), dtype=bool)
+            self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._postings = MetadataPostings(self.filter_fields)
+            for row, metadata in enumerate(self._metadatas):
+                self._postings.add(row, metadata)
+
+            if len(live):
+                self._rebuild_ann()
+            else:
+                self._hnsw = None
+                self._centroids = None
+                self._assignments = np.zeros(0, dtype=np.int32)
+            # Fichiers d'index que `persist` ne réécrira pas : ils décriraient les anciennes lignes
+            stale = []
+            if self._hnsw is None:
+                stale.append("hnsw.bin")
+            if self._centroids is None:
+                stale += ["ivf_centroids.npy", "ivf_assignments.npy"]
+            for name in stale:
+                path = os.path.join(self.index_dir, name)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._rewrite_needed = True
+            self.persist()
+        print(f"🧹 Index ANN compacté : {removed} vecteurs supprimés, {len(self._ids)} restants")
+        return removed
+
+    # ------------------------------------------------------------------ #
+    # Persistance
+    # ------------------------------------------------------------------ #
+
+    def persist(self) -> None:
+        """
+        Écrit l'index sur disque puis le recharge en mmap.
+
+        Les lignes ajoutées depuis la dernière écriture sont ajoutées en place (O(lot)) ; l'index
+        n'est réécrit en entier (remplacement atomique) qu'après `compact`, une migration de
+        métadonnées ou au premier enregistrement. Les tombstones (1 octet par ligne) et le
+        graphe HNSW (hnswlib ne sait pas sauvegarder partiellement) restent réécrits.
+        """
+        with self._lock:
+            if self._vectors is None:
+                return
+            os.makedirs(self.index_dir, exist_ok=True)
+            vectors_path = os.path.join(self.index_dir, "vectors.npy")
+            appended = self._persisted_rows > 0 and not self._rewrite_needed and os.path.exists(vectors_path)
+            if appended:
+                appended = self._append_rows("vectors.npy", self._vectors, self._persisted_rows)
+            if appended:
+                self._append_records(self._persisted_rows)
+            else:
+                self._save_npy("vectors.npy", np.asarray(self._vectors, dtype=np.float32))
+                # Enregistrements en JSON + tombstones en .npy : rien n'est désérialisé par pickle au chargement
+                self._atomic_write("records.json", json.dumps({
+                    "ids": self._ids,
+                    "texts": self._texts,
+                    "metadatas": self._metadatas,
+                }, ensure_ascii=False).encode("utf-8"))
+                log_path = os.path.join(self.index_dir, "records_appended.jsonl")
+                if os.path.exists(log_path):
+                    os.remove(log_path)
+            self._vectors = np.load(vectors_path, mmap_mode="r")
+            self._buffer = None
+
+            self._save_npy("deleted.npy", self._deleted)
+            if self.index_type == "hnsw" and self._hnsw is not None:
+                hnsw_path = os.path.join(self.index_dir, "hnsw.bin")
+                self._hnsw.save_index(hnsw_path + ".tmp")
+                os.replace(hnsw_path + ".tmp", hnsw_path)
+            if self.index_type == "ivf" and self._centroids is not None:
+                ivf_appended = (
+                    appended
+                    and not self._ivf_rewrite_needed
+                    and os.path.exists(os.path.join(self.index_dir, "ivf_centroids.npy"))
+                    and self._append_rows("ivf_assignments.npy", self._assignments, self._persisted_rows)
+                )
+                if not ivf_appended:
+                    self._save_npy("ivf_centroids.npy", self._centroids)
+                    self._save_npy("ivf_assignments.npy", self._assignments)
+
+            self._atomic_write("meta.json", json.dumps({
+                "index_type": self.index_type,
+                "dim": int(self._vectors.shape[1]) if len(self._vectors) else 0,
+                "count": len(self._ids),
+                "M": self.M,
+                "ef_construction": self.ef_construction,
+            }).encode("utf-8"))
+            self._dirty = False
+            self._rewrite_needed = False
+            self._ivf_rewrite_needed = False
+            self._persisted_rows = len(self._ids)
+            legacy_path = os.path.join(self.index_dir, "records.pkl")
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+
+    def _append_rows(self, name: str, array: np.ndarray, start: int) -> bool:
+        """
+        Ajoute `array[start:]` en place à la fin d'un `.npy` qui contient exactement `start` lignes.
+
+        Les données sont écrites avant l'en-tête : une interruption laisse un fichier dont l'en-tête
+        décrit encore l'ancien nombre de lignes. Retourne False si le fichier ne s'y prête pas
+        (forme ou type différents) : l'appelant le réécrit alors en entier.
+        """
+        path = os.path.join(self.index_dir, name)
+        if not os.path.exists(path):
+            return False
+        rows = np.ascontiguousarray(array[start:])
+        with open(path, "r+b") as f:
+            version = np.lib.format.read_magic(f)
+            if version != (1, 0):
+                return False
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            data_offset = f.tell()
+            if fortran_order or dtype != rows.dtype or shape[0] != start or shape[1:] != rows.shape[1:]:
+                return False
+            header = io.BytesIO()
+            np.lib.format.write_array_header_1_0(header, {
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": False,
+                "shape": (start + len(rows),) + tuple(shape[1:]),
+            })
+            # L'en-tête écrit par NumPy réserve de la place pour faire grandir la première dimension
+            if len(header.getvalue()) != data_offset:
+                return False
+            row_bytes = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+            f.seek(data_offset + start * row_bytes)
+            f.truncate()
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(header.getvalue())
+        return True
+
+    def _append_records(self, start: int) -> None:
+        """Ajoute les enregistrements `start:` au journal JSON Lines, relu après `records.json`."""
+        path = os.path.join(self.index_dir, "records_appended.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            for row in range(start, len(self._ids)):
+                f.write(json.dumps({
+                    "id": self._ids[row],
+                    "text": self._texts[row],
+                    "metadata": self._metadatas[row],
+                }, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _save_npy(self, name: str, array: np.ndarray) -> None:
+        path = os.path.join(self.index_dir, name)
+        np.save(path + ".tmp.npy", array)
+        os.replace(path + ".tmp.npy", path)
+
+    def _atomic_write(self, name: str, payload: bytes) -> None:
+        path = os.path.join(self.index_dir, name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+
+    def _load(self) -> None:
+        with open(os.path.join(self.index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("index_type") != self.index_type:
+            print(f"⚠️ Index '{meta.get('index_type')}' trouvé sur disque, reconstruction en '{self.index_type}'.")
+
+        self._vectors = np.load(os.path.join(self.index_dir, "vectors.npy"), mmap_mode="r")
+        records_path = os.path.join(self.index_dir, "records.json")
+        if os.path.exists(records_path):
+            with open(records_path, encoding="utf-8") as f:
+                records = json.load(f)
+            records["deleted"] = np.load(os.path.join(self.index_dir, "deleted.npy"))
+        else:
+            # Index écrit par une version précédente (records.pkl) : migré en JSON à la fin du chargement
+            with open(os.path.join(self.index_dir, "records.pkl"), "rb") as f:
+                records = pickle.load(f)
+        self._ids = records["ids"]
+        self._texts = records["texts"]
+        self._metadatas = records["metadatas"]
+        self._read_appended_records()
+        # Écriture incrémentale interrompue : on ne garde que les lignes présentes partout
+        count = min(len(self._ids), len(self._vectors))
+        if count < max(len(self._ids), len(self._vectors)):
+            print(f"⚠️ Index ANN partiellement écrit : {count} lignes conservées.")
+            del self._ids[count:], self._texts[count:], self._metadatas[count:]
+            self._vectors = self._vectors[:count]
+            self._rewrite_needed = True
+        deleted = np.asarray(records["deleted"], dtype=bool)[:count]
+        self._deleted = np.concatenate([deleted, np.zeros(count - len(deleted), dtype=bool)])
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids) if not self._deleted[row]}
+        for row, metadata in enumerate(self._metadatas):
+            self._postings.add(row, metadata)
+
+        hnsw_path = os.path.join(self.index_dir, "hnsw.bin")
+        centroids_path = os.path.join(self.index_dir, "ivf_centroids.npy")
+        if self.index_type == "hnsw" and meta.get("index_type") == "hnsw" and os.path.exists(hnsw_path):
+            self._hnsw = hnswlib.Index(space="ip", dim=meta["dim"])
+            self._hnsw.load_index(hnsw_path, max_elements=max(1024, len(self._ids)))
+            if self._hnsw.get_current_count() != len(self._ids):
+                self._rebuild_ann()
+        elif self.index_type == "ivf" and os.path.exists(centroids_path):
+            self._centroids = np.load(centroids_path)
+            self._assignments = np.load(os.path.join(self.index_dir, "ivf_assignments.npy"))
+            if len(self._assignments) != len(self._ids):
+                self._rebuild_ann()
+                self._ivf_rewrite_needed = True
+        elif self._ids:
+            self._rebuild_ann()
+        self._persisted_rows = len(self._ids)
+        if not os.path.exists(records_path):
+            print("🔁 Migration des enregistrements de l'index ANN (records.pkl -> records.json)")
+            self._rewrite_needed = True
+            self.persist()
+        print(f"📦 Index ANN chargé (mmap) : {len(self)} vecteurs, type {self.index_type}")
+
+    def _read_appended_records(self) -> None:
+        path = os.path.join(self.index_dir, "records_appended.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Dernière ligne tronquée par une interruption
+                self._ids.append(record["id"])
+                self._texts.append(record["text"])
+                self._metadatas.append(record["metadata"])
+
+    def _rebuild_ann(self) -> None:
+        self._hnsw = None
+        self._centroids = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        if self.index_type == "ivf":
+            self._assignments = np.full(len(self._ids), -1, dtype=np.int32)
+            if len(self) >= 4 * self.nlist:
+                self.train_ivf()
+            return
+        self._add_to_ann(np.asarray(self._vectors), 0)
+        for row in np.flatnonzero(self._deleted):
+            self._hnsw.mark_deleted(int(row))
+
+    # ------------------------------------------------------------------ #
+    # Constructeurs
+    # ------------------------------------------------------------------ #
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "LocalANNVectorStore":
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_chroma(
+        cls,
+        persist_directory: str,
+        collection_name: str,
+        embedding: Embeddings,
+        batch_size: int = 5000,
+        **kwargs: Any,
+    ) -> "LocalANNVectorStore":
+        """
+        Chargement en masse depuis un répertoire Chroma existant (sans recalculer les embeddings).
+        """
+        import chromadb
+
+        store = cls(embedding=embedding, **kwargs)
+        collection = chromadb.PersistentClient(path=persist_directory).get_collection(collection_name)
+        total = collection.count()
+        print(f"📥 Import de {total} vecteurs depuis Chroma ({collection_name})...")
+
+        for offset in range(0, total, batch_size):
+            batch = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            store.add_vectors(
+                np.asarray(batch["embeddings"], dtype=np.float32),
+                batch["documents"],
+                batch["metadatas"],
+                batch["ids"],
+                persist=False,
+            )
+        if store.index_type == "ivf":
+            store.train_ivf()
+        store.persist()
+        print(f"✅ Import terminé : {len(store)} vecteurs dans {store.index_dir}")
+        return store
+
+
+def deferred_persist(vectorstore):
+    """`deferred_persist` de l'index ANN local ; sans effet pour les autres bases (Chroma persiste seul)."""
+    if isinstance(vectorstore, LocalANNVectorStore):
+        return vectorstore.deferred_persist()
+    return nullcontext()
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from config import EMBEDDING_MODEL, SEARCH_K, BATCH_LLM_CONCURRENCY, BATCH_RETRIEVAL_CHUNK
+from .chain import create_llm, create_qa_chain
+from .filters import retrieval_filter
+from .inference import get_embeddings
+from .namespaces import FanOutRetriever
+from .vector_store import _extract_parent_retriever, _extract_compressor, _extract_bm25
+
+
+def _dense_search_many(vectorstore, vectors: List[List[float]], k: int, where: Optional[Dict[str, Any]]) -> List[List[Document]]:
+    """
+    Recherche vectorielle de tous les vecteurs via l'API publique des bases.
+
+    L'index ANN local (et toute base exposant `similarity_search_by_vectors`) traite le lot en un
+    seul appel ; les autres (Chroma) passent par `similarity_search_by_vector`, un vecteur à la fois.
+    """
+    if hasattr(vectorstore, "similarity_search_by_vectors"):
+        return vectorstore.similarity_search_by_vectors(vectors, k=k, filter=where)
+    return [vectorstore.similarity_search_by_vector(vector, k=k, filter=where) for vector in vectors]
+
+
+def _copies(documents: List[Document]) -> List[Document]:
+    # Un même parent peut apparaître pour plusieurs questions : le reranking écrit dans ses métadonnées
+    return [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in documents]
+
+
+class BatchAnswerer:
+    """
+    Réponse à N questions indépendantes (évaluation, rapports) en mutualisant le travail :
+
+    1. Un seul appel à l'encodeur pour toutes les questions.
+    2. Recherche vectorielle groupée, un seul `mget` du docstore pour tous les parents.
+    3. Reranking de toutes les paires dans les mêmes lots du modèle.
+    4. Appels LLM en parallèle, avec une concurrence bornée.
+
+    Les questions sont traitées sans historique (pas de reformulation).
+    `retriever` peut être un `FanOutRetriever` (plusieurs namespaces) : chaque namespace traite
+    le lot en entier, puis les résultats de chaque question sont fusionnés comme pour /chat.
+    """
+
+    def __init__(self, retriever, max_concurrency: int = BATCH_LLM_CONCURRENCY):
+        self.retriever = retriever
+        self.max_concurrency = max_concurrency
+        self.qa_chain = create_qa_chain(create_llm())
+
+    @property
+    def retrievers(self) -> List[Any]:
+        """Retrievers des namespaces interrogés."""
+        if isinstance(self.retriever, FanOutRetriever):
+            return list(self.retriever.retrievers)
+        return [self.retriever]
+
+    def retrieve_many(self, questions: List[str], where: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        """Recherche hybride + reranking pour toutes les questions."""
+        if not isinstance(self.retriever, FanOutRetriever):
+            return self._retrieve_namespace(self.retriever, questions, where)
+        per_namespace = [self._retrieve_namespace(r, questions, where) for r in self.retriever.retrievers]
+        return [self.retriever._merge([results[i] for results in per_namespace]) for i in range(len(questions))]
+
+    def _retrieve_namespace(self, retriever, questions: List[str],
+                            where: Optional[Dict[str, Any]]) -> List[List[Document]]:
+        parent_retriever = _extract_parent_retriever(retriever)
+        if parent_retriever is None:
+            raise ValueError("Impossible de trouver le ParentDocumentRetriever sous-jacent")
+
+        # 1. Encodage de toutes les questions en un seul appel
+        vectors = get_embeddings(EMBEDDING_MODEL).embed_documents(questions)
+
+        # 2. Recherche vectorielle groupée puis remontée aux parents (un seul mget)
+        k = parent_retriever.search_kwargs.get("k", 4)
+        children_lists = _dense_search_many(parent_retriever.vectorstore, vectors, k, where)
+        id_key = parent_retriever.id_key
+        parent_ids_per_query = []
+        for children in children_lists:
+            ids = []
+            for child in children:
+                doc_id = child.metadata.get(id_key)
+                if doc_id and doc_id not in ids:
+                    ids.append(doc_id)
+            parent_ids_per_query.append(ids)
+
+        unique_ids = list({doc_id for ids in parent_ids_per_query for doc_id in ids})
+        parents = dict(zip(unique_ids, parent_retriever.docstore.mget(unique_ids)))
+        dense_lists = [
+            _copies([parents[i] for i in ids if parents.get(i) is not None])
+            for ids in parent_ids_per_query
+        ]
+
+        # 3. BM25 (un seul produit matriciel requêtes x documents avec le moteur "array") + fusion
+        ensemble, position = _extract_bm25(retriever)
+        if ensemble is not None:
+            bm25 = ensemble.retrievers[position]
+            with retrieval_filter(where):
+                if hasattr(bm25, "invoke_many"):
+                    bm25_lists = bm25.invoke_many(questions)
+                else:
+                    bm25_lists = [bm25.invoke(q) for q in questions]
+            bm25_lists = [_copies(docs) for docs in bm25_lists]
+            candidates = [
+                ensemble.weighted_reciprocal_rank([bm25_docs, dense_docs])
+                for bm25_docs, dense_docs in zip(bm25_lists, dense_lists)
+            ]
+        else:
+            candidates = dense_lists
+
+        # 4. Reranking groupé
+        compressor = _extract_compressor(retriever)
+        if compressor is None:
+            return [docs[:SEARCH_K] for docs in candidates]
+        if hasattr(compressor, "compress_documents_batch"):
+            return compressor.compress_documents_batch(list(zip(questions, candidates)))
+        return [compressor.compress_documents(docs, q) for q, docs in zip(questions, candidates)]
+
+    async def _retrieve_admitted(self, questions: List[str], where: Optional[Dict[str, Any]],
+                                 admission) -> List[List[Document]]:
+        """
+        Recherche par tranches de BATCH_RETRIEVAL_CHUNK questions, chacune admise en priorité basse :
+        un lot ne monopolise pas les places des requêtes /chat.
+        """
+        contexts: List[List[Document]] = []
+        for start in range(0, len(questions), BATCH_RETRIEVAL_CHUNK):
+            chunk = questions[start:start + BATCH_RETRIEVAL_CHUNK]
+            async with admission.admit_background():
+                contexts.extend(await asyncio.to_thread(self.retrieve_many, chunk, where))
+        return contexts
+
+    async def stream(self, questions: List[str], where: Optional[Dict[str, Any]] = None,
+                     max_concurrency: Optional[int] = None, admission=None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Produit les résultats au fur et à mesure que les réponses du LLM arrivent.
+
+        `admission` (AdmissionController de l'API) : la recherche et le reranking passent par ses places.
+        """
+        start = time.time()
+        if admission is None:
+            contexts = await asyncio.to_thread(self.retrieve_many, questions, where)
+        else:
+            contexts = await self._retrieve_admitted(questions, where, admission)
+        print(f"📚 Recherche groupée de {len(questions)} questions en {time.time() - start:.2f}s")
+
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def answer(index: int) -> Dict[str, Any]:
+            question, docs = questions[index], contexts[index]
+            result = {
+                "index": index,
+                "question": question,
+                "context": [doc.page_content for doc in docs],
+                "sources": [doc.metadata.get("source") for doc in docs],
+            }
+            async with semaphore:
+                try:
+                    result["answer"] = await self.qa_chain.ainvoke({
+                        "input": question,
+                        "chat_history": [],
+                        "context": docs,
+                    })
+                except Exception as e:
+                    result["error"] = str(e)
+            return result
+
+        for next_result in asyncio.as_completed([answer(i) for i in range(len(questions))]):
+            yield await next_result
+
+
+def main():
+    """Usage : python -m rag_engine.batch questions.txt reponses.ndjson (une question par ligne)"""
+    if len(sys.argv) != 3:
+        print(main.__doc__)
+        sys.exit(1)
+    from .service import setup_rag_system
+
+    with open(sys.argv[1], encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    _, retriever = setup_rag_system()
+    answerer = BatchAnswerer(retriever)
+
+    async def run():
+        with open(sys.argv[2], "w", encoding="utf-8") as out:
+            async for result in answerer.stream(questions):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import pickle
+import random
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from config import METADATA_FILTER_FIELDS, BM25_K1, BM25_B
+from .admission import get_degradation
+from .aio import run_in, amget
+from .filters import MetadataPostings, get_retrieval_filter
+
+# Import conditionnel
+try:
+    from scipy import sparse
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+# Élisions françaises : "l'assurance" -> "assurance", "qu'il" -> "il"
+_ELISION = re.compile(r"\b(?:[cdjlmnst]|qu|jusqu|lorsqu|puisqu|quoiqu)['’]", re.IGNORECASE)
+_TOKEN = re.compile(r"[^\W_]+")
+
+STOPWORDS = frozenset("""
+    a au aux avec ce ces cette dans de des du elle en et eux il ils je la le les leur leurs lui ma mais me
+    meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sont sur ta te tes toi
+    ton tu un une vos votre vous y est etre ete avoir ont sans sous si dont ni car donc or cet
+    the an and are as at be by for from has have in is it its of on or that this to was were will with
+    """.split())
+
+
+def _fold(text: str) -> str:
+    """Minuscules sans accents : "Échéance" et "echeance" donnent le même terme."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+# Version de `tokenize`, persistée avec l'index BM25 : un index construit par une autre version est reconstruit
+TOKENIZER_VERSION = 2
+
+# Pluriels en -aux trop courts pour la règle générale
+_IRREGULAR_PLURALS = {"baux": "bail", "eaux": "eau"}
+
+
+def _light_stem(token: str) -> str:
+    """
+    Racinisation légère (pluriels FR/EN) : assez pour "contrats" == "contrat", sans sur-racinisation.
+
+    Le singulier d'un pluriel en -aux est ambigu ("travaux" -> "travail", "journaux" -> "journal",
+    "bureaux" -> "bureau") : les formes -aux, -ail, -al et -au sont ramenées à une même racine en -a.
+    """
+    if token in _IRREGULAR_PLURALS:
+        return _IRREGULAR_PLURALS[token]
+    if len(token) > 4 and token.endswith("aux"):
+        return token[:-2]
+    if len(token) > 3 and token[-1] in "sx" and token[-2] not in "su" and not token.isdigit():
+        token = token[:-1]
+    if len(token) > 4 and token.endswith("ail"):
+        return token[:-2]
+    if len(token) > 4 and token.endswith(("al", "au")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenisation français/anglais : élisions, accents, mots vides, pluriels. Les nombres sont conservés."""
+    text = _ELISION.sub(" ", text)
+    return [_light_stem(t) for t in _TOKEN.findall(_fold(text)) if t not in STOPWORDS]
+
+
+def _bm25_weights(tf, k1: float, b: float):
+    """Poids BM25 (termes x documents) à partir des fréquences brutes."""
+    coo = tf.tocoo()
+    n_docs = tf.shape[1]
+    doc_len = np.asarray(tf.sum(axis=0), dtype=np.float32).ravel()
+    avgdl = float(doc_len.mean()) if n_docs and doc_len.mean() > 0 else 1.0
+
+    # IDF toujours positif (variante Lucene) : un terme très fréquent ne pénalise pas le score
+    df = np.diff(tf.indptr).astype(np.float32)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    weights = idf[coo.row] * coo.data * (k1 + 1) / (coo.data + k1 * (1 - b + b * doc_len[coo.col] / avgdl))
+    return sparse.csr_matrix((weights, (coo.row, coo.col)), shape=tf.shape, dtype=np.float32)
+
+
+class ArrayBM25Retriever(BaseRetriever):
+    """
+    BM25 vectorisé sur des postings creux (SciPy CSR), en remplacement de BM25Retriever (rank_bm25).
+
+    Les poids BM25 de chaque (terme, document) sont précalculés à la construction : une requête
+    se réduit à la somme de quelques lignes de la matrice, puis à un top-k par `argpartition`.
+    Seuls les identifiants des parents (et les champs filtrables) sont gardés en mémoire ;
+    les documents retournés sont relus dans le docstore.
+    """
+    k: int = 4
+    filter_fields: List[str] = list(METADATA_FILTER_FIELDS)
+    _docstore: Any = PrivateAttr(default=None)
+    _doc_ids: List[str] = PrivateAttr(default_factory=list)
+    _metadatas: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+    _vocab: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _weights: Any = PrivateAttr(default=None)  # CSR (termes x documents)
+    _tf: Any = PrivateAttr(default=None)  # Fréquences brutes (mise à jour incrémentale)
+    _k1: float = PrivateAttr(default=BM25_K1)
+    _b: float = PrivateAttr(default=BM25_B)
+    _postings: Optional[MetadataPostings] = PrivateAttr(default=None)
+    _loaded_mtime: float = PrivateAttr(default=0.0)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, str, Dict[str, Any]]], docstore=None,
+                     k1: float = BM25_K1, b: float = BM25_B, **kwargs) -> "ArrayBM25Retriever":
+        """Construit l'index à partir de (id du parent, texte, métadonnées), en un seul passage."""
+        retriever = cls(**kwargs)
+        retriever._k1, retriever._b = k1, b
+        retriever._tf = retriever._count_records(records)
+        retriever._weights = _bm25_weights(retriever._tf, k1, b)
+        retriever._docstore = docstore
+        return retriever
+
+    def _count_records(self, records: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        """Fréquences brutes (termes x nouveaux documents) ; complète le vocabulaire, les ids et les métadonnées."""
+        vocab = self._vocab
+        term_ids: List[np.ndarray] = []
+        term_freqs: List[np.ndarray] = []
+        for doc_id, text, metadata in records:
+            counts = Counter(tokenize(text))
+            term_ids.append(np.fromiter((vocab.setdefault(t, len(vocab)) for t in counts), dtype=np.int32, count=len(counts)))
+            term_freqs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            self._doc_ids.append(doc_id)
+            self._metadatas.append({f: metadata[f] for f in self.filter_fields if f in metadata})
+
+        if term_ids:
+            rows = np.concatenate(term_ids)
+            tf = np.concatenate(term_freqs)
+        else:
+            rows, tf = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        cols = np.repeat(np.arange(len(term_ids), dtype=np.int32), [len(t) for t in term_ids])
+        return sparse.csr_matrix((tf, (rows, cols)), shape=(len(vocab), len(term_ids)), dtype=np.float32)
+
+    @property
+    def can_update(self) -> bool:
+        """Faux pour un index persisté par une version précédente (sans fréquences brutes)."""
+        # Attribut privé absent des pickles antérieurs
+        return getattr(self, "_tf", None) is not None
+
+    def updated(self, records: Iterable[Tuple[str, str, Dict[str, Any]]],
+                removed_ids: Iterable[str]) -> "ArrayBM25Retriever":
+        """
+        Nouvel index avec les parents ajoutés (`records`) et retirés (`removed_ids`).
+
+        Seuls les nouveaux textes sont tokenisés ; IDF et longueur moyenne sont recalculés
+        sur les fréquences brutes conservées. L'index courant n'est pas modifié (requêtes en cours).
+        """
+        removed = set(removed_ids)
+        keep = np.fromiter((i for i, doc_id in enumerate(self._doc_ids) if doc_id not in removed), dtype=np.int64)
+        retriever = type(self)(k=self.k, filter_fields=self.filter_fields)
+        retriever._k1, retriever._b = self._k1, self._b
+        retriever._vocab = dict(self._vocab)
+        retriever._doc_ids = [self._doc_ids[i] for i in keep]
+        retriever._metadatas = [self._metadatas[i] for i in keep]
+        kept = self._tf[:, keep]
+        added = retriever._count_records(records)
+        kept.resize((len(retriever._vocab), kept.shape[1]))
+        retriever._tf = sparse.hstack([kept, added], format="csr", dtype=np.float32)
+        retriever._weights = _bm25_weights(retriever._tf, retriever._k1, retriever._b)
+        retriever._docstore = self._docstore
+        return retriever
+
+    @classmethod
+    def from_documents(cls, documents: Sequence[Document], ids: Sequence[str], docstore=None,
+                       **kwargs) -> "ArrayBM25Retriever":
+        return cls.from_records(
+            ((doc_id, doc.page_content, doc.metadata) for doc_id, doc in zip(ids, documents)),
+            docstore=docstore, **kwargs,
+        )
+
+    def attach(self, docstore) -> "ArrayBM25Retriever":
+        """Rattache le docstore (non sérialisé avec l'index)."""
+        self._docstore = docstore
+        return self
+
+    @property
+    def num_docs(self) -> int:
+        return len(self._doc_ids)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        private = dict(state.get("__pydantic_private__") or {})
+        private["_docstore"] = None
+        private["_postings"] = None
+        return {**state, "__pydantic_private__": private}
+
+    def _get_postings(self) -> MetadataPostings:
+        if self._postings is None:
+            postings = MetadataPostings(self.filter_fields)
+            for row, metadata in enumerate(self._metadatas):
+                postings.add(row, metadata)
+            self._postings = postings
+        return self._postings
+
+    def score(self, query: str, columns: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Scores BM25 de la requête (0 si aucun terme en commun) : tous les documents,
+        ou seulement les lignes `columns` (dans cet ordre).
+        """
+        size = self.num_docs if columns is None else len(columns)
+        counts = Counter(self._vocab[t] for t in tokenize(query) if t in self._vocab)
+        if not counts or size == 0:
+            return np.zeros(size, dtype=np.float32)
+        rows = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        repeats = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        weights = self._weights[rows]
+        if columns is not None:
+            weights = weights[:, columns]
+        return np.asarray(weights.T @ repeats).ravel()
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """(ligne, score) des k meilleurs documents, restreints au filtre de la requête."""
+        return self.top_k_many([query], k)[0]
+
+    def top_k_many(self, queries: Sequence[str], k: int) -> List[List[Tuple[int, float]]]:
+        """
+        `top_k` de plusieurs requêtes en un seul produit matriciel creux (requêtes x documents).
+
+        Le filtre est appliqué d'abord : seules les colonnes autorisées et les lignes des termes
+        présents dans au moins une requête sont multipliées.
+        """
+        where = get_retrieval_filter()
+        allowed = np.flatnonzero(self._get_postings().mask(where, self._metadatas)) if where else None
+        counts = [Counter(self._vocab[t] for t in tokenize(q) if t in self._vocab) for q in queries]
+        terms = sorted({term for c in counts for term in c})
+        if not terms or (allowed is not None and len(allowed) == 0):
+            return [[] for _ in queries]
+
+        position = {term: i for i, term in enumerate(terms)}
+        rows = np.repeat(np.arange(len(counts)), [len(c) for c in counts])
+        cols = np.fromiter((position[t] for c in counts for t in c), dtype=np.int64, count=len(rows))
+        data = np.fromiter((n for c in counts for n in c.values()), dtype=np.float32, count=len(rows))
+        query_matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(queries), len(terms)))
+        weights = self._weights[np.asarray(terms)]
+        if allowed is not None:
+            weights = weights[:, allowed]
+        scores = (query_matrix @ weights).tocsr()
+
+        results = []
+        for i in range(len(queries)):
+            row = scores.getrow(i)
+            columns, values = row.indices, row.data
+            keep = values > 0
+            columns, values = columns[keep], values[keep]
+            if len(columns) > k:
+                best = np.argpartition(-values, k - 1)[:k]
+                columns, values = columns[best], values[best]
+            # Tri des k gagnants seulement (égalités : ordre d'indexation)
+            order = np.lexsort((columns, -values))
+            docs = columns if allowed is None else allowed[columns]
+            results.append([(int(docs[j]), float(values[j])) for j in order])
+        return results
+
+    def invoke_many(self, queries: Sequence[str]) -> List[List[Document]]:
+        """Documents des meilleurs résultats de chaque requête (un seul `mget` pour tout le lot)."""
+        if not self._doc_ids:
+            return [[] for _ in queries]
+        if self._docstore is None:
+            raise ValueError("ArrayBM25Retriever sans docstore : appeler attach(docstore) après chargement")
+        tops = self.top_k_many(queries, get_degradation().scale_k(self.k))
+        ids = list({self._doc_ids[row] for top in tops for row, _ in top})
+        docs = dict(zip(ids, self._docstore.mget(ids)))
+        # Un parent supprimé entre-temps est ignoré
+        return [
+            [docs[self._doc_ids[row]] for row, _ in top if docs[self._doc_ids[row]] is not None]
+            for top in tops
+        ]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if not self._doc_ids:
+            return []
+        if self._docstore is None:
+            raise ValueError("ArrayBM25Retriever sans docstore : appeler attach(docstore) après chargement")
+        top = self.top_k(query, get_degradation().scale_k(self.k))
+        docs = self._docstore.mget([self._doc_ids[row] for row, _ in top])
+        # Un parent supprimé entre-temps est ignoré
+        return [doc for doc in docs if doc is not None]
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        if not self._doc_ids:
+            return []
+        if self._docstore is None:
+            raise ValueError("ArrayBM25Retriever sans docstore : appeler attach(docstore) après chargement")
+        top = await run_in("cpu", self.top_k, query, get_degradation().scale_k(self.k))
+        docs = await amget(self._docstore, [self._doc_ids[row] for row, _ in top])
+        return [doc for doc in docs if doc is not None]
+
+
+def _synthetic_corpus(docstore, size: int, seed: int = 0) -> List[Tuple[str, Document]]:
+    """Corpus de `size` parents : ceux du docstore rééchantillonnés, ou du texte aléatoire s'il est vide."""
+    rng = random.Random(seed)
+    keys = list(docstore.yield_keys()) if docstore is not None else []
+    originals = [doc for doc in docstore.mget(keys) if doc] if keys else []
+    if not originals:
+        words = [f"terme{i}" for i in range(20000)]
+        originals = [
+            Document(page_content=" ".join(rng.choices(words, k=300)), metadata={"source": f"doc{i % 50}.pdf"})
+            for i in range(200)
+        ]
+    return [(f"bench-{i}", originals[i % len(originals)]) for i in range(size)]
+
+
+def benchmark(sizes: Sequence[int] = (1000, 10000, 50000), n_queries: int = 200, k: int = 20,
+              docstore=None) -> List[Dict[str, Any]]:
+    """
+    Compare BM25Retriever (rank_bm25) et ArrayBM25Retriever à plusieurs tailles de corpus :
+    temps de construction, latence des requêtes (p50/p95), taille sérialisée et recouvrement du top-k.
+
+    Les corpus sont construits à partir des parents du docstore (rééchantillonnés jusqu'à la taille
+    voulue) et les requêtes sont des extraits de ces parents.
+    """
+    from langchain_core.stores import InMemoryStore
+    from .vector_store import FilteredBM25Retriever
+
+    results = []
+    for size in sizes:
+        corpus = _synthetic_corpus(docstore, size)
+        rng = random.Random(size)
+        queries = []
+        for _, doc in rng.sample(corpus, min(n_queries, len(corpus))):
+            words = doc.page_content.split()
+            start = rng.randrange(max(1, len(words) - 6))
+            queries.append(" ".join(words[start:start + 6]))
+        store = InMemoryStore()
+        store.mset(corpus)
+        row = {"docs": size}
+
+        for name, build in (
+            ("rank_bm25", lambda: FilteredBM25Retriever.from_documents([doc for _, doc in corpus], k=k)),
+            ("array", lambda: ArrayBM25Retriever.from_documents(
+                [doc for _, doc in corpus], [i for i, _ in corpus], docstore=store, k=k)),
+        ):
+            start = time.perf_counter()
+            retriever = build()
+            row[f"{name}_build_s"] = round(time.perf_counter() - start, 2)
+            row[f"{name}_pickle_mb"] = round(len(pickle.dumps(retriever)) / 1e6, 1)
+            latencies, tops = [], []
+            for query in queries:
+                start = time.perf_counter()
+                tops.append([d.page_content for d in retriever.invoke(query)])
+                latencies.append(time.perf_counter() - start)
+            row[f"{name}_p50_ms"] = round(1000 * float(np.percentile(latencies, 50)), 2)
+            row[f"{name}_p95_ms"] = round(1000 * float(np.percentile(latencies, 95)), 2)
+            row[f"_{name}_tops"] = tops
+
+        # Recouvrement des résultats (tokenisations différentes : l'accord n'est pas total)
+        overlaps = [
+            len(set(a) & set(b)) / max(1, len(set(a)))
+            for a, b in zip(row.pop("_rank_bm25_tops"), row.pop("_array_tops"))
+        ]
+        row["overlap_at_k"] = round(float(np.mean(overlaps)), 3) if overlaps else 0.0
+        row["speedup_p50"] = round(row["rank_bm25_p50_ms"] / max(row["array_p50_ms"], 1e-3), 1)
+        print(f"   {row}")
+        results.append(row)
+    return results
+
+
+def main():
+    """Usage : python -m rag_engine.bm25 --benchmark [1000,10000,50000] | "requête" (tokenisation)"""
+    if len(sys.argv) >= 2 and sys.argv[1] == "--benchmark":
+        from .vector_store import get_docstore
+        sizes = [int(s) for s in sys.argv[2].split(",")] if len(sys.argv) == 3 else (1000, 10000, 50000)
+        benchmark(sizes, docstore=get_docstore())
+    elif len(sys.argv) == 2:
+        print(tokenize(sys.argv[1]))
+    else:
+        print(main.__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
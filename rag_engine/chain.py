@@ -1,35 +1,35 @@
 from langchain_groq import ChatGroq
-from langchain_classic.chains import create_retrieval_chain, create_history_aware_retriever
+from langchain_classic.chains import create_retrieval_chain
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableBranch, RunnableLambda
 from config import LLM_MODEL, GROQ_API_KEY
+from .admission import get_degradation
 
-def create_rag_chain(retriever):
+def _inline(func):
     """
-    Crée une chaîne RAG avec gestion de l'historique de conversation.
+    Lambda triviale exécutée directement dans la boucle d'événements en async
+    (une lambda synchrone serait envoyée dans un thread de l'executor par défaut).
+    """
+    async def afunc(x):
+        return func(x)
+    return RunnableLambda(func, afunc=afunc)
+
+def create_llm():
+    """
+    Crée le LLM de génération.
     
     Streaming: Mode de transmission où la réponse du modèle est envoyée morceau par morceau (token par token) dès qu'elle est générée, permettant un affichage progressif et plus réactif pour l'utilisateur.
     """
     # Activation du streaming pour une meilleure réactivité (si supporté par l'interface)
-    llm = ChatGroq(model=LLM_MODEL, temperature=0.1, streaming=True, api_key=GROQ_API_KEY)
+    return ChatGroq(model=LLM_MODEL, temperature=0.1, streaming=True, api_key=GROQ_API_KEY)
 
-    # 1. Chaîne pour reformuler la question en fonction de l'historique
-    contextualize_q_system_prompt = """Compte tenu de l'historique de la conversation et de la dernière question de l'utilisateur 
-    qui pourrait faire référence au contexte de l'historique de la conversation, formulez une question autonome 
-    qui peut être comprise sans l'historique de la conversation. Ne répondez pas à la question, 
-    reformulez-la simplement si nécessaire, sinon renvoyez-la telle quelle."""
-    
-    contextualize_q_prompt = ChatPromptTemplate.from_messages([
-        ("system", contextualize_q_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ])
-    
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
-    )
-
-    # 2. Chaîne pour répondre à la question (QA)
+def create_qa_chain(llm):
+    """
+    Chaîne de réponse seule : (question, historique, documents de contexte) -> réponse.
+    Utilisée directement par le traitement par lots, qui fait sa propre recherche.
+    """
     qa_system_prompt = """Tu es un assistant expert en analyse de documents.
     Utilise les morceaux de contexte récupérés suivants pour répondre à la question.
     Si tu ne connais pas la réponse, dis simplement que tu ne sais pas.
@@ -44,7 +44,38 @@ def create_rag_chain(retriever):
         ("human", "{input}"),
     ])
 
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+    return create_stuff_documents_chain(llm, qa_prompt)
+
+def create_rag_chain(retriever):
+    """
+    Crée une chaîne RAG avec gestion de l'historique de conversation.
+    """
+    llm = create_llm()
+
+    # 1. Chaîne pour reformuler la question en fonction de l'historique
+    contextualize_q_system_prompt = """Compte tenu de l'historique de la conversation et de la dernière question de l'utilisateur 
+    qui pourrait faire référence au contexte de l'historique de la conversation, formulez une question autonome 
+    qui peut être comprise sans l'historique de la conversation. Ne répondez pas à la question, 
+    reformulez-la simplement si nécessaire, sinon renvoyez-la telle quelle."""
+    
+    contextualize_q_prompt = ChatPromptTemplate.from_messages([
+        ("system", contextualize_q_system_prompt),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ])
+    
+    # Équivalent de create_history_aware_retriever, avec la possibilité de sauter la reformulation
+    # (appel LLM supplémentaire) quand le délai de la requête est trop court
+    history_aware_retriever = RunnableBranch(
+        (
+            _inline(lambda x: not x.get("chat_history", False) or get_degradation().skip_condensation),
+            _inline(lambda x: x["input"]) | retriever,
+        ),
+        contextualize_q_prompt | llm | StrOutputParser() | retriever,
+    ).with_config(run_name="chat_retriever_chain")
+
+    # 2. Chaîne pour répondre à la question (QA)
+    question_answer_chain = create_qa_chain(llm)
     
     # 3. Chaîne finale combinant les deux
     rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
@@ -0,0 +1,181 @@
+import copy
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_experimental.text_splitter import SemanticChunker, combine_sentences
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
+
+from config import SEMANTIC_CHUNKER_BATCHED, SEMANTIC_CHILD_TARGET_CHARS, SEMANTIC_EMBED_BATCH_SIZE
+
+
+def adjacent_cosine_distances(vectors: np.ndarray) -> np.ndarray:
+    """Distance cosinus entre chaque vecteur et le suivant (même convention que SemanticChunker : 0 si norme nulle)."""
+    norms = np.linalg.norm(vectors, axis=1)
+    dots = np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarity = dots / (norms[:-1] * norms[1:])
+    similarity[~np.isfinite(similarity)] = 0.0
+    return 1 - similarity
+
+
+class SemanticTextSplitter(TextSplitter):
+    """
+    Wrapper qui adapte SemanticChunker à l'interface TextSplitter.
+    Permet d'utiliser le découpage sémantique avec ParentDocumentRetriever.
+
+    SemanticChunker: Découpe le texte aux endroits où le sens change significativement,
+    en utilisant les embeddings pour détecter les transitions sémantiques.
+
+    Mode groupé (`batched`, défaut) : les phrases de plusieurs parents sont embeddées ensemble
+    (par lots de `embed_batch_size`), les distances sont calculées en NumPy vectorisé et les
+    découpes sont produites au fil de l'eau (`iter_split_texts`). Les parents plus courts que
+    `child_target_chars` forment un seul enfant, sans passage par le modèle.
+    Avec `child_target_chars=0`, la sortie est celle de SemanticChunker (aux arrondis flottants près) ;
+    `batched=False` utilise SemanticChunker tel quel.
+    """
+
+    def __init__(self, embeddings, breakpoint_threshold_type: str = "percentile",
+                 breakpoint_threshold_amount: int = 90, batched: bool = SEMANTIC_CHUNKER_BATCHED,
+                 child_target_chars: int = SEMANTIC_CHILD_TARGET_CHARS,
+                 embed_batch_size: int = SEMANTIC_EMBED_BATCH_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self._embeddings = embeddings
+        self._semantic_chunker = SemanticChunker(
+            embeddings=embeddings,
+            breakpoint_threshold_type=breakpoint_threshold_type,
+            breakpoint_threshold_amount=breakpoint_threshold_amount
+        )
+        self.batched = batched
+        self.child_target_chars = child_target_chars
+        self.embed_batch_size = embed_batch_size
+        self._short_text_splitter = (
+            RecursiveCharacterTextSplitter(chunk_size=child_target_chars, chunk_overlap=0)
+            if child_target_chars > 0 else None
+        )
+
+    def split_text(self, text: str) -> List[str]:
+        """Découpe le texte en utilisant SemanticChunker."""
+        if not self.batched:
+            # SemanticChunker travaille avec des Documents, on crée un doc temporaire
+            docs = self._semantic_chunker.create_documents([text])
+            return [doc.page_content for doc in docs]
+        return next(self.iter_split_texts([text]))
+
+    def _prepare(self, text: str) -> Tuple[Optional[List[dict]], Optional[List[str]]]:
+        """(phrases à embedder, None) ou (None, découpe déjà connue)."""
+        if self._short_text_splitter is not None and len(text) <= self.child_target_chars:
+            return None, self._short_text_splitter.split_text(text)
+        chunker = self._semantic_chunker
+        single_sentences = re.split(chunker.sentence_split_regex, text)
+        # Mêmes cas limites que SemanticChunker (percentile / gradient impossibles)
+        if len(single_sentences) == 1 or (chunker.breakpoint_threshold_type == "gradient" and len(single_sentences) == 2):
+            return None, single_sentences
+        sentences = [{"sentence": s, "index": i} for i, s in enumerate(single_sentences)]
+        return combine_sentences(sentences, chunker.buffer_size), None
+
+    def _chunks(self, sentences: List[dict], distances: np.ndarray) -> List[str]:
+        """Regroupe les phrases aux points de rupture (même règle que SemanticChunker.split_text)."""
+        chunker = self._semantic_chunker
+        if chunker.number_of_chunks is not None:
+            threshold, breakpoint_array = chunker._threshold_from_clusters(distances.tolist()), distances
+        else:
+            threshold, breakpoint_array = chunker._calculate_breakpoint_threshold(distances.tolist())
+
+        chunks = []
+        start_index = 0
+        for index in np.flatnonzero(np.asarray(breakpoint_array) > threshold):
+            combined_text = " ".join(d["sentence"] for d in sentences[start_index:index + 1])
+            if chunker.min_chunk_size is not None and len(combined_text) < chunker.min_chunk_size:
+                continue
+            chunks.append(combined_text)
+            start_index = index + 1
+        if start_index < len(sentences):
+            chunks.append(" ".join(d["sentence"] for d in sentences[start_index:]))
+        return chunks
+
+    def _flush(self, group: List[Tuple[Optional[List[dict]], Optional[List[str]]]]) -> Iterator[List[str]]:
+        to_embed = [s["combined_sentence"] for sentences, _ in group if sentences for s in sentences]
+        vectors = np.asarray(self._embeddings.embed_documents(to_embed), dtype=np.float64) if to_embed else None
+        offset = 0
+        for sentences, chunks in group:
+            if sentences is None:
+                yield chunks
+                continue
+            yield self._chunks(sentences, adjacent_cosine_distances(vectors[offset:offset + len(sentences)]))
+            offset += len(sentences)
+
+    def iter_split_texts(self, texts: Iterable[str]) -> Iterator[List[str]]:
+        """
+        Découpe de chaque texte, dans l'ordre, produite dès que son lot d'embeddings est calculé.
+        Un lot regroupe les phrases de plusieurs textes (au moins `embed_batch_size`, sauf le dernier).
+        """
+        if not self.batched:
+            yield from (self.split_text(text) for text in texts)
+            return
+        group, pending = [], 0
+        for text in texts:
+            item = self._prepare(text)
+            group.append(item)
+            pending += len(item[0]) if item[0] else 0
+            if pending >= self.embed_batch_size:
+                yield from self._flush(group)
+                group, pending = [], 0
+        if group:
+            yield from self._flush(group)
+
+    def iter_split_documents(self, documents: Iterable[Document]) -> Iterator[List[Document]]:
+        """Équivalent groupé de `split_documents([doc])` pour chaque document."""
+        documents = list(documents)
+        for doc, chunks in zip(documents, self.iter_split_texts(doc.page_content for doc in documents)):
+            yield [Document(page_content=chunk, metadata=copy.deepcopy(doc.metadata)) for chunk in chunks]
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        return [child for children in self.iter_split_documents(documents) for child in children]
+
+
+def compare(texts: Sequence[str], embeddings, **kwargs) -> Dict[str, Any]:
+    """
+    Compare SemanticChunker (un parent à la fois) et le mode groupé sur les mêmes textes :
+    temps de découpe et part des parents découpés à l'identique.
+    """
+    legacy = SemanticTextSplitter(embeddings, batched=False, **kwargs)
+    batched = SemanticTextSplitter(embeddings, batched=True, **kwargs)
+    exact = SemanticTextSplitter(embeddings, batched=True, child_target_chars=0, **kwargs)
+
+    results: Dict[str, Any] = {"parents": len(texts)}
+    outputs = {}
+    for name, splitter in (("legacy", legacy), ("batched", batched), ("batched_exact", exact)):
+        start = time.perf_counter()
+        outputs[name] = list(splitter.iter_split_texts(texts))
+        results[f"{name}_s"] = round(time.perf_counter() - start, 2)
+        results[f"{name}_children"] = sum(len(chunks) for chunks in outputs[name])
+    for name in ("batched", "batched_exact"):
+        same = sum(a == b for a, b in zip(outputs["legacy"], outputs[name]))
+        results[f"{name}_identical"] = round(same / max(1, len(texts)), 3)
+    for key, value in results.items():
+        print(f"   {key}: {value}")
+    return results
+
+
+def main():
+    """Usage : python -m rag_engine.chunking --compare [nombre de parents] (parents lus dans le docstore)"""
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != "--compare":
+        print(main.__doc__)
+        sys.exit(1)
+    from config import EMBEDDING_MODEL, SEMANTIC_CHUNKER_THRESHOLD
+    from .inference import get_embeddings
+    from .vector_store import get_docstore
+
+    limit = int(sys.argv[2]) if len(sys.argv) == 3 else 200
+    docstore = get_docstore()
+    keys = [key for _, key in zip(range(limit), docstore.yield_keys())]
+    texts = [doc.page_content for doc in docstore.mget(keys) if doc]
+    compare(texts, get_embeddings(EMBEDDING_MODEL), breakpoint_threshold_amount=SEMANTIC_CHUNKER_THRESHOLD)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .reranker import normalize_query
+
+
+def make_flight_key(question: str, history: List[dict], where: Optional[Dict[str, Any]] = None,
+                    namespaces: Optional[List[str]] = None, deadline_ms: Optional[int] = None) -> str:
+    """
+    Clé de dé-duplication : question normalisée + empreinte de l'historique (+ filtres, namespaces
+    et délai éventuels). Deux requêtes avec la même clé produisent la même réponse.
+
+    Le délai fait partie de la clé : une requête qui suit reçoit les dégradations et l'éventuel
+    refus d'admission de la première, ce qui n'est juste que pour un même délai.
+    """
+    history_fingerprint = [(msg.get("role"), msg.get("content")) for msg in history]
+    payload = json.dumps(
+        [normalize_query(question), history_fingerprint, where, sorted(set(namespaces or [])), deadline_ms],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Regroupement des requêtes identiques en cours ("single-flight").
+
+    Single-flight: Tant qu'un calcul est en cours pour une clé, les requêtes suivantes avec la
+    même clé attendent ce calcul au lieu d'en relancer un. Le calcul tourne dans sa propre
+    tâche : l'annulation d'un appelant (client déconnecté) ne l'interrompt pas pour les autres.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        with self._lock:
+            self.requests += 1
+            if task is None:
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marque l'exception comme lue si tous les appelants ont été annulés
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "computations": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._inflight),
+                "coalesced_rate": round(self.coalesced / self.requests, 3) if self.requests else 0.0,
+            }
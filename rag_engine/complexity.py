@@ -0,0 +1,234 @@
+import csv
+import re
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from config import (
+    ROUTER_MIN_CHARS_PER_KPT2,
+    ROUTER_MIN_RULINGS,
+    ROUTER_NUMERIC_LINE_RATIO,
+    ROUTER_VISION_WHOLE_DOC_RATIO,
+)
+
+# Opérateurs de tracé comptés : rectangle ("re") et segment ("l") ; un trait est "m" suivi de "l"
+_RULING_OPS = (b"re", b"l")
+_NUMERIC_TOKEN = re.compile(r"^[+\-]?[\d.,%€$]*\d[\d.,%€$]*$")
+
+
+@dataclass
+class PageSignals:
+    """Signaux bon marché extraits d'une page par pypdf (aucun rendu, aucun modèle)."""
+    page: int
+    chars: int
+    chars_per_kpt2: float   # Caractères extraits pour 1000 pt² de surface de page
+    images: int
+    rulings: int            # Rectangles et segments tracés (bordures de tableaux)
+    numeric_line_ratio: float
+
+    @property
+    def is_scanned(self) -> bool:
+        return self.images > 0 and self.chars_per_kpt2 < ROUTER_MIN_CHARS_PER_KPT2
+
+    @property
+    def is_table_heavy(self) -> bool:
+        return self.rulings >= ROUTER_MIN_RULINGS or self.numeric_line_ratio >= ROUTER_NUMERIC_LINE_RATIO
+
+    @property
+    def needs_vision(self) -> bool:
+        return self.is_scanned or self.is_table_heavy
+
+
+@dataclass
+class RoutingPlan:
+    """Répartition des pages d'un PDF entre les pipelines Texte et Vision (indices à partir de 0)."""
+    text_pages: List[int] = field(default_factory=list)
+    vision_pages: List[int] = field(default_factory=list)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.text_pages) + len(self.vision_pages)
+
+    def segments(self) -> List[Tuple[str, List[int]]]:
+        """Tranches de pages consécutives d'un même pipeline ("text" ou "vision"), dans l'ordre du document."""
+        vision = set(self.vision_pages)
+        segments: List[Tuple[str, List[int]]] = []
+        for page in sorted(self.text_pages + self.vision_pages):
+            kind = "vision" if page in vision else "text"
+            if segments and segments[-1][0] == kind:
+                segments[-1][1].append(page)
+            else:
+                segments.append((kind, [page]))
+        return segments
+
+
+def _count_images(page) -> int:
+    resources = page.get("/Resources")
+    if resources is None:
+        return 0
+    xobjects = resources.get_object().get("/XObject")
+    if xobjects is None:
+        return 0
+    xobjects = xobjects.get_object()
+    return sum(1 for name in xobjects if xobjects[name].get_object().get("/Subtype") == "/Image")
+
+
+def _count_rulings(page) -> int:
+    """
+    Rectangles et segments tracés, comptés sur les opérations décodées du flux de contenu :
+    un "l" ou un "re" à l'intérieur d'une chaîne de texte n'est pas un opérateur.
+    """
+    from pypdf.generic import ContentStream
+
+    contents = page.get_contents()
+    if contents is None:
+        return 0
+    try:
+        operations = ContentStream(contents, page.pdf).operations
+    except Exception:
+        return 0
+    return sum(1 for _, operator in operations if operator in _RULING_OPS)
+
+
+def _numeric_line_ratio(text: str) -> float:
+    """Part des lignes composées surtout de nombres (colonnes de tableaux sans bordures)."""
+    lines = [line.split() for line in text.splitlines() if len(line.split()) >= 3]
+    if len(lines) < 5:
+        return 0.0
+    numeric = sum(1 for tokens in lines if sum(bool(_NUMERIC_TOKEN.match(t)) for t in tokens) * 2 >= len(tokens))
+    return numeric / len(lines)
+
+
+def analyze_page(page, page_number: int) -> PageSignals:
+    text = page.extract_text() or ""
+    chars = len(text.strip())
+    box = page.mediabox
+    area = max(float(box.width) * float(box.height), 1.0)
+    return PageSignals(
+        page=page_number,
+        chars=chars,
+        chars_per_kpt2=chars / (area / 1000),
+        images=_count_images(page),
+        rulings=_count_rulings(page),
+        numeric_line_ratio=_numeric_line_ratio(text),
+    )
+
+
+def analyze_pdf(file_path: str) -> List[PageSignals]:
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    return [analyze_page(page, i) for i, page in enumerate(reader.pages)]
+
+
+def plan_routing(signals: List[PageSignals]) -> RoutingPlan:
+    """
+    Pages scannées ou riches en tableaux -> Vision, le reste -> Texte.
+
+    Au-delà de ROUTER_VISION_WHOLE_DOC_RATIO pages Vision, le document entier part en Vision :
+    la hiérarchie des titres reste cohérente et on évite de découper un document déjà complexe.
+    """
+    plan = RoutingPlan()
+    for s in signals:
+        (plan.vision_pages if s.needs_vision else plan.text_pages).append(s.page)
+    if signals and len(plan.vision_pages) / len(signals) >= ROUTER_VISION_WHOLE_DOC_RATIO:
+        return RoutingPlan(vision_pages=[s.page for s in signals])
+    return plan
+
+
+def _measure_ingest(file_paths: List[str]) -> Dict[str, float]:
+    """
+    Temps d'ingestion mesurés : tout en Vision, puis routage page par page (analyse comprise).
+    Chaque passe a son propre cache de parsing vide : aucune ne profite du travail de l'autre.
+    """
+    from .pipelines.parsers import ParseCache
+    from .pipelines.vision_pipeline import VisionPipeline
+    from .router import DocumentRouter
+
+    with tempfile.TemporaryDirectory() as all_vision_cache, tempfile.TemporaryDirectory() as routed_cache:
+        vision = VisionPipeline(cache=ParseCache(all_vision_cache))
+        start = time.perf_counter()
+        for file_path in file_paths:
+            vision.process(file_path)
+        all_vision_s = time.perf_counter() - start
+
+        router = DocumentRouter()
+        router.vision_pipeline = VisionPipeline(cache=ParseCache(routed_cache))
+        start = time.perf_counter()
+        for file_path in file_paths:
+            router.route_and_process(file_path)
+        routed_s = time.perf_counter() - start
+    return {"all_vision_s": round(all_vision_s, 1), "routed_s": round(routed_s, 1),
+            "saved_s": round(all_vision_s - routed_s, 1)}
+
+
+def benchmark(labels_path: str, measure: bool = False) -> Dict:
+    """
+    Mesure la précision du routage sur un jeu annoté.
+
+    `labels_path` : CSV `file,page,label` (page à partir de 0, label "text" ou "vision").
+    Avec `measure`, ingère aussi chaque fichier deux fois (tout en Vision, puis routé) avec le
+    parseur configuré et rapporte le temps réellement économisé (appels au parseur facturés).
+    """
+    labels: Dict[str, Dict[int, str]] = {}
+    with open(labels_path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            labels.setdefault(row["file"], {})[int(row["page"])] = row["label"].strip()
+
+    confusion: Dict[Tuple[str, str], int] = {}
+    analysis_s = 0.0
+    total_pages = 0
+    vision_pages = 0
+    for file_path, expected in labels.items():
+        start = time.perf_counter()
+        plan = plan_routing(analyze_pdf(file_path))
+        analysis_s += time.perf_counter() - start
+        routed = {p: "text" for p in plan.text_pages}
+        routed.update({p: "vision" for p in plan.vision_pages})
+        total_pages += plan.page_count
+        vision_pages += len(plan.vision_pages)
+        for page, label in expected.items():
+            key = (label, routed.get(page, "text"))
+            confusion[key] = confusion.get(key, 0) + 1
+
+    evaluated = sum(confusion.values())
+    correct = confusion.get(("text", "text"), 0) + confusion.get(("vision", "vision"), 0)
+    missed = confusion.get(("vision", "text"), 0)
+    result = {
+        "files": len(labels),
+        "pages": total_pages,
+        "evaluated_pages": evaluated,
+        "accuracy": round(correct / evaluated, 3) if evaluated else 0.0,
+        "vision_recall": round(1 - missed / max(1, missed + confusion.get(("vision", "vision"), 0)), 3),
+        "confusion": {f"{label}->{routed}": n for (label, routed), n in sorted(confusion.items())},
+        "pages_sent_to_vision": vision_pages,
+        "analysis_ms_per_page": round(1000 * analysis_s / max(1, total_pages), 2),
+    }
+    if measure:
+        result["measured_ingest"] = _measure_ingest(list(labels))
+    for key, value in result.items():
+        print(f"   {key}: {value}")
+    return result
+
+
+def main():
+    """Usage : python -m rag_engine.complexity fichier.pdf | --benchmark labels.csv [--measure]"""
+    if len(sys.argv) in (3, 4) and sys.argv[1] == "--benchmark":
+        if len(sys.argv) == 4 and sys.argv[3] != "--measure":
+            print(main.__doc__)
+            sys.exit(1)
+        benchmark(sys.argv[2], measure=len(sys.argv) == 4)
+    elif len(sys.argv) == 2:
+        signals = analyze_pdf(sys.argv[1])
+        for s in signals:
+            print(f"   page {s.page}: {'vision' if s.needs_vision else 'texte'} {s}")
+        plan = plan_routing(signals)
+        print(f"🚦 Texte : {len(plan.text_pages)} pages, Vision : {len(plan.vision_pages)} pages")
+    else:
+        print(main.__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+from config import PERSIST_DIR, DATA_DIR
+from .ann_store import LocalANNVectorStore, deferred_persist
+from .filters import normalize_source, header_path_levels, HEADER_PATH_SEPARATOR
+from .pipelines.parsers import ParseCache
+from .registry import get_registry, iter_vector_records, live_file_hashes_all
+from .vector_store import _extract_parent_retriever, index_documents, refresh_bm25
+
+# Une seule modification du corpus à la fois (suppression, remplacement, compaction)
+_write_lock = threading.Lock()
+
+
+def _parent_retriever(retriever):
+    parent_retriever = _extract_parent_retriever(retriever)
+    if parent_retriever is None:
+        raise ValueError("Impossible de trouver le ParentDocumentRetriever sous-jacent")
+    return parent_retriever
+
+
+def _registry(parent_retriever):
+    return parent_retriever.registry or get_registry()
+
+
+def _delete_parents(parent_retriever, parent_ids: List[str]) -> int:
+    """
+    Supprime des parents et leurs enfants de tous les stores.
+
+    Ordre : journal -> docstore -> base vectorielle -> table de correspondance.
+    Dès la suppression des parents, les enfants restants ne remontent plus rien
+    (le `mget` du docstore renvoie None) ; une interruption est rejouée par `resume_pending_deletes`.
+    """
+    if not parent_ids:
+        return 0
+    registry = _registry(parent_retriever)
+    child_ids = registry.child_ids(parent_ids)
+    registry.begin_delete(parent_ids)
+    parent_retriever.docstore.mdelete(parent_ids)
+    with deferred_persist(parent_retriever.vectorstore):
+        for start in range(0, len(child_ids), 5000):
+            parent_retriever.vectorstore.delete(ids=child_ids[start:start + 5000])
+    registry.commit_delete(parent_ids)
+    return len(child_ids)
+
+
+def _drop_parse_cache(file_hash) -> None:
+    # Un même contenu peut être indexé sous un autre nom (ou dans un autre namespace) :
+    # on ne purge que s'il n'est plus utilisé
+    if file_hash and file_hash not in live_file_hashes_all():
+        ParseCache().drop(file_hash)
+
+
+def _ensure_backfilled(parent_retriever) -> None:
+    registry = _registry(parent_retriever)
+    if registry.count_parents() == 0 and next(iter(parent_retriever.docstore.yield_keys()), None) is not None:
+        registry.backfill(parent_retriever.docstore, parent_retriever.vectorstore, parent_retriever.id_key)
+
+
+def prepare_registry(retriever) -> None:
+    """
+    Au démarrage : construit la table de correspondance pour un index existant
+    et termine les suppressions interrompues.
+    """
+    _ensure_backfilled(_parent_retriever(retriever))
+    resume_pending_deletes(retriever)
+
+
+def resume_pending_deletes(retriever) -> int:
+    parent_retriever = _parent_retriever(retriever)
+    pending = _registry(parent_retriever).pending_deletes()
+    if pending:
+        print(f"♻️  Reprise de {len(pending)} suppressions interrompues...")
+        with _write_lock:
+            _delete_parents(parent_retriever, pending)
+            refresh_bm25(retriever)
+    return len(pending)
+
+
+def list_sources(retriever) -> List[Dict[str, Any]]:
+    return _registry(_parent_retriever(retriever)).list_sources()
+
+
+def delete_source(retriever, source: str, remove_file: bool = True, data_dir: str = DATA_DIR) -> Dict[str, Any]:
+    """
+    Supprime un document : parents (docstore), enfants (base vectorielle), BM25 et cache de parsing.
+    Lève KeyError si la source n'est pas indexée.
+    """
+    source = normalize_source(source, data_dir)
+    parent_retriever = _parent_retriever(retriever)
+    registry = _registry(parent_retriever)
+
+    with _write_lock:
+        parent_ids = registry.parent_ids(source)
+        if not parent_ids:
+            raise KeyError(source)
+        start = time.time()
+        file_hash = registry.file_hash(source)
+        removed_children = _delete_parents(parent_retriever, parent_ids)
+        refresh_bm25(retriever)
+        _drop_parse_cache(file_hash)
+        if remove_file and os.path.isfile(source):
+            os.remove(source)
+
+    print(f"🗑️  Document supprimé : {os.path.basename(source)} ({len(parent_ids)} parents, "
+          f"{removed_children} enfants, {time.time() - start:.2f}s)")
+    return {"source": source, "removed_parents": len(parent_ids), "removed_children": removed_children}
+
+
+def replace_source(retriever, source: str, uploaded_path: str, data_dir: str = DATA_DIR) -> Dict[str, Any]:
+    """
+    Remplace (ou ajoute) un document à partir d'un fichier déjà écrit sur disque.
+
+    Le nouveau contenu est traité AVANT de toucher à l'index, puis indexé avant la suppression
+    de l'ancien : une requête concurrente voit l'ancienne ou la nouvelle version, jamais aucune.
+    Le fichier reçu ne remplace l'ancien qu'une fois indexé ; en cas d'échec il est supprimé.
+    Lève ValueError si le fichier ne produit aucun fragment (l'ancienne version est conservée).
+    """
+    from .router import DocumentRouter
+
+    source = normalize_source(source, data_dir)
+    parent_retriever = _parent_retriever(retriever)
+    registry = _registry(parent_retriever)
+
+    try:
+        documents = DocumentRouter().route_and_process(uploaded_path)
+        if not documents:
+            raise ValueError(f"Échec du traitement du document '{os.path.basename(source)}'")
+        for doc in documents:
+            doc.metadata["source"] = source
+
+        with _write_lock:
+            old_parent_ids = registry.parent_ids(source)
+            old_file_hash = registry.file_hash(source)
+            index_documents(retriever, documents)
+            if uploaded_path != source:
+                os.replace(uploaded_path, source)
+                registry.refresh_file_hash(source)
+            # Les nouveaux parents ont des ids neufs : tous les anciens parents de la source sont obsolètes
+            stale = old_parent_ids
+            removed_children = _delete_parents(parent_retriever, stale)
+            refresh_bm25(retriever)
+            if old_file_hash != registry.file_hash(source):
+                _drop_parse_cache(old_file_hash)
+    finally:
+        if uploaded_path != source and os.path.exists(uploaded_path):
+            os.remove(uploaded_path)
+
+    return {
+        "source": source,
+        "fragments": len(documents),
+        "removed_parents": len(stale),
+        "removed_children": removed_children,
+    }
+
+
+def _prune_embeddings_cache(embeddings, live_texts: List[str]) -> int:
+    """Supprime du cache d'embeddings les vecteurs qui ne correspondent plus à aucun enfant indexé."""
+    store = getattr(embeddings, "document_embedding_store", None)
+    backing = getattr(store, "store", None)
+    namespace = getattr(embeddings, "namespace", None) or ""
+    if store is None or backing is None:
+        return 0
+    live_keys = {store.key_encoder(text) for text in live_texts}
+    stale = [k for k in backing.yield_keys() if k.startswith(namespace) and k not in live_keys]
+    for start in range(0, len(stale), 1000):
+        backing.mdelete(stale[start:start + 1000])
+    return len(stale)
+
+
+def vacuum(retriever) -> Dict[str, Any]:
+    """
+    Compaction : supprime les données orphelines (enfants sans parent, parents hors de la table de
+    correspondance, entrées de cache des fichiers supprimés) et récupère l'espace disque
+    (tombstones de l'index ANN local, VACUUM SQLite de Chroma).
+    """
+    start = time.time()
+    parent_retriever = _parent_retriever(retriever)
+    registry = _registry(parent_retriever)
+    vectorstore = parent_retriever.vectorstore
+    docstore = parent_retriever.docstore
+    id_key = parent_retriever.id_key
+    stats: Dict[str, Any] = {}
+    # Sans table de correspondance, tout le docstore serait considéré comme orphelin
+    _ensure_backfilled(parent_retriever)
+
+    with _write_lock:
+        pending = registry.pending_deletes()
+        _delete_parents(parent_retriever, pending)
+        stats["resumed_deletes"] = len(pending)
+
+        known_parents = registry.all_parent_ids()
+        orphan_parents = [k for k in docstore.yield_keys() if k not in known_parents]
+        if orphan_parents:
+            docstore.mdelete(orphan_parents)
+        stats["orphan_parents"] = len(orphan_parents)
+
+        orphan_children, live_texts = [], []
+        for child_id, text, metadata in iter_vector_records(vectorstore, include_texts=True):
+            if metadata.get(id_key) not in known_parents:
+                orphan_children.append(child_id)
+            elif text is not None:
+                live_texts.append(text)
+        with deferred_persist(vectorstore):
+            for i in range(0, len(orphan_children), 5000):
+                vectorstore.delete(ids=orphan_children[i:i + 5000])
+        stats["orphan_children"] = len(orphan_children)
+
+        if isinstance(vectorstore, LocalANNVectorStore):
+            stats["compacted_vectors"] = vectorstore.compact()
+        else:
+            chroma_db = os.path.join(PERSIST_DIR, "chroma.sqlite3")
+            if os.path.exists(chroma_db):
+                try:
+                    with sqlite3.connect(chroma_db) as conn:
+                        conn.execute("VACUUM")
+                    stats["chroma_vacuum"] = True
+                except sqlite3.Error as e:
+                    print(f"⚠️ VACUUM de Chroma impossible : {e}")
+                    stats["chroma_vacuum"] = False
+
+        stats["pruned_parse_cache"] = ParseCache().prune(live_file_hashes_all())
+        stats["pruned_embeddings"] = _prune_embeddings_cache(vectorstore.embeddings, live_texts)
+        if orphan_parents or pending:
+            refresh_bm25(retriever)
+
+    stats["duration_s"] = round(time.time() - start, 2)
+    print(f"🧹 Compaction terminée : {stats}")
+    return stats
+
+
+def _missing_header_levels(metadata: Dict[str, Any]) -> Dict[str, str]:
+    """Niveaux `header_path_N` d'un document indexé avant le filtrage par préfixe (vide si déjà présents)."""
+    header_path = metadata.get("header_path")
+    if not header_path or "header_path_1" in metadata:
+        return {}
+    return header_path_levels(header_path.split(HEADER_PATH_SEPARATOR))
+
+
+def backfill_header_paths(retriever) -> Dict[str, Any]:
+    """
+    Migration : ajoute les métadonnées `header_path_1..3` (filtre `header_path_prefix`) aux parents
+    et aux enfants indexés par une version précédente, à partir de leur `header_path`.
+    Sans elle, un filtre par préfixe ne trouve rien dans les anciens documents. Idempotente.
+    """
+    start = time.time()
+    parent_retriever = _parent_retriever(retriever)
+    docstore = parent_retriever.docstore
+    vectorstore = parent_retriever.vectorstore
+
+    with _write_lock:
+        keys = list(docstore.yield_keys())
+        updated_parents = 0
+        for i in range(0, len(keys), 1000):
+            batch = keys[i:i + 1000]
+            updated = []
+            for key, doc in zip(batch, docstore.mget(batch)):
+                levels = _missing_header_levels(doc.metadata) if doc else {}
+                if levels:
+                    doc.metadata.update(levels)
+                    updated.append((key, doc))
+            if updated:
+                docstore.mset(updated)
+                updated_parents += len(updated)
+
+        children = []
+        for child_id, _, metadata in iter_vector_records(vectorstore):
+            levels = _missing_header_levels(metadata)
+            if levels:
+                children.append((child_id, {**metadata, **levels}))
+        for i in range(0, len(children), 5000):
+            ids, metadatas = zip(*children[i:i + 5000])
+            if isinstance(vectorstore, LocalANNVectorStore):
+                vectorstore.update_metadatas(ids, metadatas)
+            else:
+                vectorstore._collection.update(ids=list(ids), metadatas=list(metadatas))
+        # Les champs filtrables de BM25 sont lus dans les parents
+        if updated_parents:
+            refresh_bm25(retriever, full=True)
+
+    stats = {"parents": updated_parents, "children": len(children), "duration_s": round(time.time() - start, 2)}
+    print(f"🔁 Chemins de titres migrés : {stats}")
+    return stats
+
+
+def main():
+    """Usage : python -m rag_engine.documents list | delete <source> | vacuum | migrate-headers (serveur arrêté)"""
+    if len(sys.argv) < 2 or sys.argv[1] not in ("list", "delete", "vacuum", "migrate-headers") or (sys.argv[1] == "delete") != (len(sys.argv) == 3):
+        print(main.__doc__)
+        sys.exit(1)
+    from .vector_store import get_vectorstore, get_docstore, get_retriever
+
+    retriever = get_retriever(get_vectorstore(), get_docstore())
+    prepare_registry(retriever)
+    if sys.argv[1] == "list":
+        for entry in list_sources(retriever):
+            print(f"   {entry['source']} : {entry['parents']} parents, {entry['children']} enfants")
+    elif sys.argv[1] == "delete":
+        delete_source(retriever, sys.argv[2])
+    elif sys.argv[1] == "migrate-headers":
+        backfill_header_paths(retriever)
+    else:
+        vacuum(retriever)
+
+
+if __name__ == "__main__":
+    main()
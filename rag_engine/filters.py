@@ -0,0 +1,164 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from config import DATA_DIR
+
+HEADER_PATH_SEPARATOR = " > "
+HEADER_PATH_MAX_DEPTH = 3
+
+# Filtre de la requête en cours. Un ContextVar suit la requête à travers la chaîne LangChain,
+# y compris dans les threads de l'executor (LangChain copie le contexte).
+_current_filter: ContextVar[Optional[Dict[str, Any]]] = ContextVar("retrieval_filter", default=None)
+
+
+def match_filter(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Évalue un filtre de métadonnées au format `where` de Chroma sur un document.
+
+    Opérateurs supportés : égalité simple, $eq, $ne, $in, $nin, $and, $or.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_filter(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class MetadataPostings:
+    """
+    Index inversé (champ -> valeur -> lignes) utilisé pour le pré-filtrage.
+
+    Postings: Listes des documents associés à chaque valeur. Elles permettent de restreindre
+    les candidats AVANT le calcul des scores, au lieu de filtrer les résultats après coup.
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = list(fields)
+        self._postings: Dict[str, Dict[Any, List[int]]] = {f: {} for f in self.fields}
+
+    def add(self, row: int, metadata: Dict[str, Any]) -> None:
+        for field in self.fields:
+            if field in metadata:
+                self._postings[field].setdefault(metadata[field], []).append(row)
+
+    def mask(self, where: Dict[str, Any], metadatas: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Masque booléen des lignes qui satisfont le filtre."""
+        mask = self._resolve(where, len(metadatas))
+        if mask is None:
+            # Opérateur ou champ non indexé : évaluation ligne par ligne
+            mask = np.array([match_filter(m, where) for m in metadatas], dtype=bool)
+        return mask
+
+    def _resolve(self, where: Dict[str, Any], size: int) -> Optional[np.ndarray]:
+        mask = np.ones(size, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    sub_mask = self._resolve(sub, size)
+                    if sub_mask is None:
+                        return None
+                    mask &= sub_mask
+                continue
+            if key not in self._postings:
+                return None
+            if isinstance(condition, dict):
+                if set(condition) - {"$eq", "$in"}:
+                    return None
+                values = list(condition.get("$in", []))
+                if "$eq" in condition:
+                    values.append(condition["$eq"])
+            else:
+                values = [condition]
+            field_mask = np.zeros(size, dtype=bool)
+            for value in values:
+                field_mask[self._postings[key].get(value, [])] = True
+            mask &= field_mask
+        return mask
+
+
+def header_path_levels(header_parts: Sequence[str]) -> Dict[str, str]:
+    """
+    Métadonnées cumulatives du chemin de titres : ["A", "B"] -> {"header_path_1": "A", "header_path_2": "A > B"}.
+    Un filtre par préfixe de chemin devient ainsi une simple égalité, exécutable par Chroma.
+    """
+    return {
+        f"header_path_{depth}": HEADER_PATH_SEPARATOR.join(header_parts[:depth])
+        for depth in range(1, min(len(header_parts), HEADER_PATH_MAX_DEPTH) + 1)
+    }
+
+
+def normalize_source(source: str, data_dir: str = DATA_DIR) -> str:
+    """Les documents sont indexés avec leur chemin dans DATA_DIR ; on accepte aussi le simple nom de fichier."""
+    if os.path.isabs(source):
+        return source
+    return os.path.join(data_dir, os.path.basename(source))
+
+
+def build_where_filter(
+    sources: Optional[List[str]] = None,
+    header_path_prefix: Optional[str] = None,
+    data_dirs: Optional[Sequence[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Construit un filtre `where` (syntaxe Chroma) à partir des critères de la requête.
+    Le préfixe de chemin est exprimé en niveaux de titres complets (ex: "Contrat > Article 4").
+    `data_dirs` : dossiers de données des namespaces interrogés (DATA_DIR par défaut).
+    """
+    conditions = []
+    if sources:
+        normalized = list(dict.fromkeys(
+            normalize_source(s, data_dir) for s in sources for data_dir in (data_dirs or [DATA_DIR])
+        ))
+        if len(normalized) == 1:
+            conditions.append({"source": normalized[0]})
+        else:
+            conditions.append({"source": {"$in": normalized}})
+
+    if header_path_prefix:
+        parts = [p.strip() for p in header_path_prefix.split(">") if p.strip()]
+        if len(parts) > HEADER_PATH_MAX_DEPTH:
+            raise ValueError(f"Le préfixe de chemin ne peut dépasser {HEADER_PATH_MAX_DEPTH} niveaux")
+        if parts:
+            conditions.append({f"header_path_{len(parts)}": HEADER_PATH_SEPARATOR.join(parts)})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def get_retrieval_filter() -> Optional[Dict[str, Any]]:
+    """Filtre actif pour la requête en cours (None = tout le corpus)."""
+    return _current_filter.get()
+
+
+@contextmanager
+def retrieval_filter(where: Optional[Dict[str, Any]]):
+    """Restreint les recherches effectuées dans ce bloc au filtre donné."""
+    token = _current_filter.set(where)
+    try:
+        yield
+    finally:
+        _current_filter.reset(token)
@@ -0,0 +1,255 @@
+import json
+import os
+import platform
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import (
+    INFERENCE_BACKEND,
+    INFERENCE_THREADS,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    EMBED_BATCH_SIZE,
+    EMBEDDING_MODEL,
+    INFERENCE_AUTOTUNE_FILE,
+    INFERENCE_SERVER_SOCKET,
+)
+
+# Import conditionnel
+try:
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    HAS_ONNX = True
+except ImportError:
+    HAS_ONNX = False
+
+BACKENDS = ["torch", "torch-int8", "onnx"]
+
+# Textes de calibration (longueurs variées, comme nos parents de ~4000 caractères et nos questions)
+_SAMPLE_QUERIES = [
+    "Quel est le niveau de risque de ce fonds ?",
+    "Quelles sont les conditions de résiliation du contrat ?",
+]
+_SAMPLE_PASSAGES = [
+    "Le fonds présente un niveau de risque 4 sur une échelle de 7. " * n for n in (2, 10, 40, 60)
+]
+
+
+def has_cuda() -> bool:
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+
+def configure_threads(num_threads: int = INFERENCE_THREADS) -> None:
+    """Fixe le nombre de threads intra-op de PyTorch (0 = valeur par défaut de PyTorch)."""
+    if num_threads <= 0:
+        return
+    import torch
+    torch.set_num_threads(num_threads)
+    print(f"🧵 Threads d'inférence : {num_threads}")
+
+
+def _quantize_int8(model):
+    """Quantification dynamique int8 des couches Linear (poids int8, activations quantifiées à la volée)."""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class BucketedReranker:
+    """
+    Interface `compute_score` compatible FlagReranker, avec batching par longueur.
+
+    Les paires sont triées par longueur puis découpées en lots : un parent de 4000 caractères
+    n'impose plus son padding à une série de passages courts.
+    """
+
+    def __init__(self, score_batch: Callable[[List[List[str]]], Sequence[float]],
+                 batch_size: int = RERANK_BATCH_SIZE, backend: str = "torch"):
+        self._score_batch = score_batch
+        self.batch_size = batch_size
+        self.backend = backend
+
+    def compute_score(self, pairs: List[List[str]]) -> List[float]:
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        scores = [0.0] * len(pairs)
+        for start in range(0, len(order), self.batch_size):
+            batch_idx = order[start:start + self.batch_size]
+            batch_scores = self._score_batch([pairs[i] for i in batch_idx])
+            if isinstance(batch_scores, float):
+                batch_scores = [batch_scores]
+            for i, score in zip(batch_idx, batch_scores):
+                scores[i] = float(score)
+        return scores
+
+
+def _load_torch_reranker(model_name: str, int8: bool) -> BucketedReranker:
+    from FlagEmbedding import FlagReranker
+
+    # fp16 seulement sur GPU : sur CPU, il est souvent plus lent que fp32
+    reranker = FlagReranker(model_name, use_fp16=has_cuda() and not int8)
+    if int8:
+        reranker.model = _quantize_int8(reranker.model)
+
+    def score_batch(batch):
+        return reranker.compute_score(batch, batch_size=len(batch), max_length=RERANK_MAX_LENGTH)
+
+    return BucketedReranker(score_batch, backend="torch-int8" if int8 else "torch")
+
+
+def _load_onnx_reranker(model_name: str) -> BucketedReranker:
+    import torch
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+
+    def score_batch(batch):
+        inputs = tokenizer(batch, padding=True, truncation=True, max_length=RERANK_MAX_LENGTH, return_tensors="pt")
+        with torch.no_grad():
+            logits = model(**inputs).logits
+        return logits.view(-1).float().tolist()
+
+    return BucketedReranker(score_batch, backend="onnx")
+
+
+def _load_reranker_backend(model_name: str, backend: str) -> BucketedReranker:
+    if backend == "onnx":
+        return _load_onnx_reranker(model_name)
+    return _load_torch_reranker(model_name, int8=(backend == "torch-int8"))
+
+
+def _load_embeddings_backend(model_name: str, backend: str):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model_kwargs = {"backend": "onnx"} if backend == "onnx" else {}
+    # SentenceTransformer.encode trie déjà les textes par longueur avant de former les lots
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": EMBED_BATCH_SIZE},
+    )
+    if backend == "torch-int8":
+        embeddings._client = _quantize_int8(embeddings._client)
+    return embeddings
+
+
+def _available_backends() -> List[str]:
+    return [b for b in BACKENDS if b != "onnx" or HAS_ONNX]
+
+
+def _host_fingerprint() -> str:
+    return f"{platform.node()}:{platform.machine()}:{os.cpu_count()}:{INFERENCE_THREADS}"
+
+
+def _read_autotune() -> Dict[str, str]:
+    if not os.path.exists(INFERENCE_AUTOTUNE_FILE):
+        return {}
+    with open(INFERENCE_AUTOTUNE_FILE) as f:
+        return json.load(f)
+
+
+def _write_autotune(results: Dict[str, str]) -> None:
+    os.makedirs(os.path.dirname(INFERENCE_AUTOTUNE_FILE), exist_ok=True)
+    with open(INFERENCE_AUTOTUNE_FILE, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def _benchmark(run: Callable[[], object], repeats: int = 3) -> float:
+    run()  # Échauffement
+    start = time.perf_counter()
+    for _ in range(repeats):
+        run()
+    return (time.perf_counter() - start) / repeats
+
+
+def select_backend(kind: str, model_name: str, loader: Callable[[str, str], object],
+                   run: Callable[[object], object]) -> Tuple[str, Optional[object]]:
+    """
+    Choisit le backend d'inférence pour un modèle : (backend, modèle déjà chargé ou None).
+
+    En mode "auto", chaque backend disponible est chargé et chronométré sur des entrées
+    représentatives ; le plus rapide est retenu et mémorisé par hôte, le test n'est donc
+    exécuté qu'au premier démarrage. Le modèle chronométré du gagnant est retourné pour
+    ne pas être chargé une seconde fois ; les autres sont libérés au fil de l'eau.
+    """
+    if INFERENCE_BACKEND != "auto":
+        return INFERENCE_BACKEND, None
+    if has_cuda():
+        return "torch", None
+
+    key = f"{kind}:{model_name}:{_host_fingerprint()}"
+    results = _read_autotune()
+    if key in results:
+        return results[key], None
+
+    print(f"⏱️  Auto-benchmark des backends CPU pour {model_name}...")
+    best, best_model, best_time = "torch", None, float("inf")
+    for backend in _available_backends():
+        try:
+            model = loader(model_name, backend)
+            timing = _benchmark(lambda: run(model))
+            print(f"   ↳ {backend}: {timing * 1000:.1f} ms")
+        except Exception as e:
+            print(f"   ↳ {backend}: indisponible ({e})")
+            continue
+        if timing < best_time:
+            best, best_model, best_time = backend, model, timing
+        del model
+
+    print(f"   ↳ Backend retenu : {best}")
+    results[key] = best
+    _write_autotune(results)
+    return best, best_model
+
+
+@lru_cache(maxsize=None)
+def _get_inference_client():
+    from .inference_server import InferenceClient
+    return InferenceClient(INFERENCE_SERVER_SOCKET)
+
+
+def load_reranker(model_name: str, backend: Optional[str] = None, allow_remote: bool = True):
+    """
+    Charge un cross-encoder avec le backend CPU demandé (ou le plus rapide en mode "auto").
+    Si un serveur d'inférence est configuré, retourne un client léger à la place du modèle.
+    """
+    if allow_remote and INFERENCE_SERVER_SOCKET:
+        from .inference_server import RemoteReranker
+        print(f"   ↳ Reranker servi par {INFERENCE_SERVER_SOCKET}")
+        return RemoteReranker(_get_inference_client(), model_name)
+
+    configure_threads()
+    pairs = [[q, p] for q in _SAMPLE_QUERIES for p in _SAMPLE_PASSAGES]
+    model = None
+    if backend is None:
+        backend, model = select_backend(
+            "reranker", model_name, _load_reranker_backend, lambda m: m.compute_score(pairs)
+        )
+    print(f"   ↳ Backend d'inférence du reranker : {backend}")
+    return model if model is not None else _load_reranker_backend(model_name, backend)
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model_name: str = EMBEDDING_MODEL, backend: Optional[str] = None, allow_remote: bool = True):
+    """
+    Modèle d'embedding partagé (une seule instance par processus et par modèle).
+    Utilisé à la fois par la base vectorielle et par le découpage sémantique.
+    Si un serveur d'inférence est configuré, retourne un client léger à la place du modèle.
+    """
+    if allow_remote and INFERENCE_SERVER_SOCKET:
+        from .inference_server import RemoteEmbeddings
+        print(f"   ↳ Embeddings servis par {INFERENCE_SERVER_SOCKET}")
+        return RemoteEmbeddings(_get_inference_client())
+
+    configure_threads()
+    texts = _SAMPLE_QUERIES + _SAMPLE_PASSAGES
+    model = None
+    if backend is None:
+        backend, model = select_backend(
+            "embeddings", model_name, _load_embeddings_backend, lambda m: m.embed_documents(texts)
+        )
+    print(f"   ↳ Backend d'inférence des embeddings : {backend}")
+    return model if model is not None else _load_embeddings_backend(model_name, backend)
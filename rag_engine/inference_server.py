@@ -0,0 +1,242 @@
+import os
+import queue
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBEDDING_MODEL,
+    INFERENCE_SERVER_SOCKET,
+    INFERENCE_SERVER_AUTHKEY,
+    INFERENCE_SERVER_MAX_BATCH,
+    INFERENCE_SERVER_MAX_WAIT_MS,
+)
+
+
+def _key_path(socket_path: str) -> str:
+    return socket_path + ".key"
+
+
+def create_authkey(socket_path: str) -> bytes:
+    """
+    Clé d'authentification du serveur : `INFERENCE_SERVER_AUTHKEY` si définie, sinon une clé
+    aléatoire propre à ce lancement, écrite en 0600 à côté de la socket pour les workers.
+    """
+    if INFERENCE_SERVER_AUTHKEY:
+        return INFERENCE_SERVER_AUTHKEY
+    authkey = secrets.token_hex(32).encode("ascii")
+    key_path = _key_path(socket_path)
+    if os.path.exists(key_path):
+        os.remove(key_path)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    return authkey
+
+
+def read_authkey(socket_path: str) -> bytes:
+    """Clé côté worker : `INFERENCE_SERVER_AUTHKEY`, sinon celle écrite par le serveur."""
+    if INFERENCE_SERVER_AUTHKEY:
+        return INFERENCE_SERVER_AUTHKEY
+    try:
+        with open(_key_path(socket_path), "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise RuntimeError(
+            f"Clé du serveur d'inférence introuvable ({_key_path(socket_path)}) : "
+            "démarrer le serveur d'abord, ou définir INFERENCE_SERVER_AUTHKEY"
+        )
+
+
+class MicroBatcher:
+    """
+    Regroupe les requêtes concurrentes en un seul appel au modèle.
+
+    Micro-batching: Les requêtes arrivées pendant une courte fenêtre (`max_wait_ms`) sont
+    concaténées et traitées ensemble, ce qui amortit le coût fixe de chaque passe du modèle.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int = INFERENCE_SERVER_MAX_BATCH,
+                 max_wait_ms: float = INFERENCE_SERVER_MAX_WAIT_MS):
+        self._fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[tuple[List[Any], Future]]" = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, items: List[Any]) -> Future:
+        future: Future = Future()
+        self._queue.put((items, future))
+        return future
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            total = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while total < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                total += len(batch[-1][0])
+
+            flat = [item for items, _ in batch for item in items]
+            try:
+                results = list(self._fn(flat))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for items, future in batch:
+                future.set_result(results[offset:offset + len(items)])
+                offset += len(items)
+
+
+class InferenceServer:
+    """
+    Processus d'inférence partagé : possède le modèle d'embedding et les rerankers et sert
+    les workers FastAPI via une socket Unix. Les poids ne sont chargés qu'une fois, quel
+    que soit le nombre de workers.
+    """
+
+    def __init__(self, socket_path: str = INFERENCE_SERVER_SOCKET):
+        from .inference import get_embeddings
+
+        self.socket_path = socket_path
+        embeddings = get_embeddings(EMBEDDING_MODEL, allow_remote=False)
+        self._embed = MicroBatcher(embeddings.embed_documents)
+        self._rerankers: Dict[str, MicroBatcher] = {}
+        self._reranker_backends: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _get_reranker(self, model_name: str) -> MicroBatcher:
+        from .inference import load_reranker
+
+        with self._lock:
+            if model_name not in self._rerankers:
+                reranker = load_reranker(model_name, allow_remote=False)
+                self._rerankers[model_name] = MicroBatcher(reranker.compute_score)
+                self._reranker_backends[model_name] = getattr(reranker, "backend", "torch")
+            return self._rerankers[model_name]
+
+    def _dispatch(self, op: str, payload: Any) -> Any:
+        if op == "embed":
+            return self._embed.submit(payload).result()
+        if op == "rerank":
+            model_name, pairs = payload
+            return self._get_reranker(model_name).submit(pairs).result()
+        if op == "reranker_backend":
+            self._get_reranker(payload)
+            return self._reranker_backends[payload]
+        if op == "ping":
+            return "pong"
+        raise ValueError(f"Opération inconnue : {op}")
+
+    def _serve(self, conn) -> None:
+        with conn:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self._dispatch(op, payload)))
+                except Exception as e:
+                    conn.send(("error", repr(e)))
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        authkey = create_authkey(self.socket_path)
+        with Listener(self.socket_path, family="AF_UNIX", authkey=authkey) as listener:
+            print(f"🛰️  Serveur d'inférence prêt : {self.socket_path}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+
+class InferenceClient:
+    """Client léger : une connexion par thread vers le serveur d'inférence."""
+
+    def __init__(self, socket_path: str = INFERENCE_SERVER_SOCKET):
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Relue à chaque connexion : un serveur redémarré a généré une nouvelle clé
+            conn = Client(self.socket_path, family="AF_UNIX", authkey=read_authkey(self.socket_path))
+            self._local.conn = conn
+        return conn
+
+    def call(self, op: str, payload: Any) -> Any:
+        conn = self._conn()
+        try:
+            conn.send((op, payload))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # Serveur redémarré : on se reconnecte une fois
+            self._local.conn = None
+            conn = self._conn()
+            conn.send((op, payload))
+            status, result = conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Erreur du serveur d'inférence : {result}")
+        return result
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings calculés par le serveur d'inférence (interface `Embeddings` standard)."""
+
+    def __init__(self, client: InferenceClient):
+        self._client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._client.call("embed", list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._client.call("embed", [text])[0]
+
+
+class RemoteReranker:
+    """Cross-encoder distant, avec la même interface `compute_score` que FlagReranker."""
+
+    def __init__(self, client: InferenceClient, model_name: str):
+        self._client = client
+        self.model_name = model_name
+        self._backend = None
+
+    @property
+    def backend(self) -> str:
+        """Backend du modèle côté serveur (demandé une fois, au premier usage)."""
+        if self._backend is None:
+            self._backend = self._client.call("reranker_backend", self.model_name)
+        return self._backend
+
+    def compute_score(self, pairs: List[List[str]]) -> List[float]:
+        if not pairs:
+            return []
+        return self._client.call("rerank", (self.model_name, [list(p) for p in pairs]))
+
+
+def main():
+    """Usage : python -m rag_engine.inference_server"""
+    InferenceServer().serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,7 @@ def load_and_split_documents() -> List[Document]:
     
     router = DocumentRouter()
     
+    file_paths = []
     for filename in os.listdir(DATA_DIR):
         file_path = os.path.join(DATA_DIR, filename)
         
@@ -28,7 +29,7 @@ def load_and_split_documents() -> List[Document]:
             continue
             
         if os.path.isfile(file_path):
-            docs = router.route_and_process(file_path)
-            documents.extend(docs)
+            file_paths.append(file_path)
             
+    documents = router.route_and_process_many(file_paths)
     return documents
@@ -0,0 +1,269 @@
+import asyncio
+import contextvars
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from config import (
+    DEFAULT_NAMESPACE,
+    MAX_LOADED_NAMESPACES,
+    NAMESPACES_DIR,
+    SEARCH_K,
+    COLLECTION_NAME,
+    DATA_DIR,
+    DOC_STORE_DIR,
+    BM25_INDEX_PATH,
+    ANN_INDEX_DIR,
+    DOC_MAP_DB,
+    EMBEDDINGS_CACHE_DIR,
+)
+from .admission import get_degradation
+from .chain import create_rag_chain
+from .documents import prepare_registry
+from .registry import SourceRegistry
+from .vector_store import get_vectorstore, get_docstore, get_retriever, sync_bm25, async_sync_bm25, _extract_compressor
+
+_NAMESPACE_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+
+
+@dataclass(frozen=True)
+class NamespacePaths:
+    """Emplacements propres à un namespace (collection, docstore, BM25, table de correspondance...)."""
+    name: str
+    collection_name: str
+    data_dir: str
+    docstore_dir: str
+    bm25_index_path: str
+    ann_index_dir: str
+    doc_map_db: str
+    embeddings_cache_dir: str
+
+
+def validate_namespace(name: str) -> str:
+    if not _NAMESPACE_PATTERN.match(name):
+        raise ValueError(f"Nom de namespace invalide : '{name}' (minuscules, chiffres, '-' et '_')")
+    return name
+
+
+def namespace_paths(name: str) -> NamespacePaths:
+    """Le namespace par défaut conserve les emplacements historiques (aucune migration)."""
+    if name == DEFAULT_NAMESPACE:
+        return NamespacePaths(
+            name=name,
+            collection_name=COLLECTION_NAME,
+            data_dir=DATA_DIR,
+            docstore_dir=DOC_STORE_DIR,
+            bm25_index_path=BM25_INDEX_PATH,
+            ann_index_dir=ANN_INDEX_DIR,
+            doc_map_db=DOC_MAP_DB,
+            embeddings_cache_dir=EMBEDDINGS_CACHE_DIR,
+        )
+    root = os.path.join(NAMESPACES_DIR, validate_namespace(name))
+    return NamespacePaths(
+        name=name,
+        collection_name=f"ns_{name}",
+        data_dir=os.path.join(root, "data"),
+        docstore_dir=os.path.join(root, "doc_store"),
+        bm25_index_path=os.path.join(root, "bm25_index.pkl"),
+        ann_index_dir=os.path.join(root, "ann_index"),
+        doc_map_db=os.path.join(root, "doc_map.db"),
+        embeddings_cache_dir=os.path.join(root, "embeddings_cache"),
+    )
+
+
+def namespace_exists(name: str) -> bool:
+    return name == DEFAULT_NAMESPACE or os.path.isdir(os.path.join(NAMESPACES_DIR, validate_namespace(name)))
+
+
+def list_namespaces() -> List[str]:
+    names = [DEFAULT_NAMESPACE]
+    if os.path.isdir(NAMESPACES_DIR):
+        names += sorted(n for n in os.listdir(NAMESPACES_DIR) if _NAMESPACE_PATTERN.match(n))
+    return names
+
+
+def load_namespace_retriever(name: str, compressor=None):
+    """Construit le retriever complet d'un namespace (base vectorielle, docstore, BM25)."""
+    paths = namespace_paths(name)
+    os.makedirs(paths.data_dir, exist_ok=True)
+    print(f"🗃️  Chargement du namespace '{name}'...")
+    vectorstore = get_vectorstore(
+        collection_name=paths.collection_name,
+        embeddings_cache_dir=paths.embeddings_cache_dir,
+        index_dir=paths.ann_index_dir,
+    )
+    docstore = get_docstore(paths.docstore_dir)
+    retriever = get_retriever(
+        vectorstore,
+        docstore,
+        registry=SourceRegistry(paths.doc_map_db),
+        bm25_index_path=paths.bm25_index_path,
+        compressor=compressor,
+    )
+    prepare_registry(retriever)
+    return retriever
+
+
+class FanOutRetriever(BaseRetriever):
+    """
+    Interroge plusieurs namespaces en parallèle puis fusionne leurs résultats en un top-k unique.
+
+    Chaque namespace applique sa propre recherche hybride et son reranking ; les scores du reranker
+    (même modèle, même requête) sont comparables d'un namespace à l'autre. Les documents sans score
+    (reranking sauté) suivent, entrelacés rang par rang.
+    """
+    retrievers: List[BaseRetriever]
+    names: List[str]
+    k: int = SEARCH_K
+
+    def _merge(self, results: Sequence[List[Document]]) -> List[Document]:
+        tagged = [
+            [Document(page_content=d.page_content, metadata={**d.metadata, "namespace": name}, id=d.id) for d in docs]
+            for name, docs in zip(self.names, results)
+        ]
+        k = get_degradation().scale_k(self.k)
+        # Scores du reranker (comparables entre namespaces) d'abord, puis les documents sans score
+        # (reranking sauté, niveau de cascade sans score) entrelacés rang par rang
+        scored = sorted((doc for docs in tagged for doc in docs if "relevance_score" in doc.metadata),
+                        key=lambda d: d.metadata["relevance_score"], reverse=True)
+        unscored = [[doc for doc in docs if "relevance_score" not in doc.metadata] for docs in tagged]
+        merged = scored
+        for rank in range(max((len(docs) for docs in unscored), default=0)):
+            merged.extend(docs[rank] for docs in unscored if rank < len(docs))
+        return merged[:k]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        # Le contexte (filtre, dégradations) est copié dans chaque thread
+        futures = [
+            _get_fanout_executor().submit(contextvars.copy_context().run, r.invoke, query)
+            for r in self.retrievers
+        ]
+        return self._merge([f.result() for f in futures])
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        results = await asyncio.gather(*(r.ainvoke(query) for r in self.retrievers))
+        return self._merge(results)
+
+
+_fanout_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_fanout_executor() -> ThreadPoolExecutor:
+    global _fanout_executor
+    if _fanout_executor is None:
+        _fanout_executor = ThreadPoolExecutor(max_workers=max(2, MAX_LOADED_NAMESPACES + 1),
+                                              thread_name_prefix="fanout")
+    return _fanout_executor
+
+
+class NamespaceManager:
+    """
+    Namespaces chargés à la demande et gardés en mémoire dans la limite de `max_loaded`.
+
+    LRU: au-delà de la limite, le namespace utilisé le moins récemment est libéré (index BM25,
+    clients de la base vectorielle) ; il sera rechargé depuis le disque à sa prochaine utilisation.
+    Le namespace par défaut reste toujours chargé, et le reranker est partagé par tous.
+    """
+
+    def __init__(self, default_retriever, default_chain, max_loaded: int = MAX_LOADED_NAMESPACES):
+        self.max_loaded = max_loaded
+        self._default_retriever = default_retriever
+        self._default_chain = default_chain
+        self._compressor = _extract_compressor(default_retriever)
+        self._loaded: "OrderedDict[str, Any]" = OrderedDict()
+        self._chains: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def get_retriever(self, name: str, create: bool = False):
+        """Retriever d'un namespace, chargé si besoin. Lève KeyError si le namespace n'existe pas."""
+        if name == DEFAULT_NAMESPACE:
+            return self._default_retriever
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Un seul chargement par namespace, sans bloquer les autres namespaces
+        with load_lock:
+            with self._lock:
+                if name in self._loaded:
+                    return self._loaded[name]
+            if not create and not namespace_exists(name):
+                raise KeyError(name)
+            retriever = load_namespace_retriever(name, compressor=self._compressor)
+            with self._lock:
+                self._loaded[name] = retriever
+                self.loads += 1
+                while len(self._loaded) > self.max_loaded:
+                    evicted, _ = self._loaded.popitem(last=False)
+                    self._drop_chains(evicted)
+                    self.evictions += 1
+                    print(f"💤 Namespace '{evicted}' libéré de la mémoire (LRU)")
+        return retriever
+
+    def evict(self, name: str) -> None:
+        """Force le rechargement d'un namespace (ex: BM25 activé après son premier document)."""
+        with self._lock:
+            if self._loaded.pop(name, None) is not None:
+                self._drop_chains(name)
+
+    def _drop_chains(self, name: str) -> None:
+        for key in [key for key in self._chains if name in key]:
+            del self._chains[key]
+
+    def get_chain(self, names: Sequence[str]):
+        """Chaîne RAG sur un ou plusieurs namespaces (recherche parallèle et top-k fusionné)."""
+        key = tuple(sorted(set(names)))
+        if key == (DEFAULT_NAMESPACE,):
+            return self._default_chain
+        retrievers = [self.get_retriever(name) for name in key]
+        with self._lock:
+            chain = self._chains.get(key)
+        if chain is not None:
+            return chain
+
+        if len(key) == 1:
+            chain = create_rag_chain(retrievers[0])
+        else:
+            chain = create_rag_chain(FanOutRetriever(retrievers=retrievers, names=list(key)))
+        with self._lock:
+            self._chains[key] = chain
+        return chain
+
+    def sync_bm25(self, names: Sequence[str]) -> None:
+        """Recharge les index BM25 mis à jour par un autre worker (namespaces déjà chargés uniquement)."""
+        for name in names:
+            with self._lock:
+                retriever = self._default_retriever if name == DEFAULT_NAMESPACE else self._loaded.get(name)
+            if retriever is not None:
+                sync_bm25(retriever)
+
+    async def async_sync_bm25(self, names: Sequence[str]) -> None:
+        """`sync_bm25` sans bloquer la boucle d'événements (rechargement dans l'executor)."""
+        for name in names:
+            with self._lock:
+                retriever = self._default_retriever if name == DEFAULT_NAMESPACE else self._loaded.get(name)
+            if retriever is not None:
+                await async_sync_bm25(retriever)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": [DEFAULT_NAMESPACE] + list(self._loaded),
+                "max_loaded": self.max_loaded,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
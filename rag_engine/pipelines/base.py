@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
 from langchain_core.documents import Document
 
 class BasePipeline(ABC):
@@ -8,8 +8,9 @@ class BasePipeline(ABC):
     """
     
     @abstractmethod
-    def process(self, file_path: str) -> List[Document]:
+    def process(self, file_path: str, pages: Optional[List[int]] = None) -> List[Document]:
         """
         Traite un fichier et retourne une liste de documents (chunks).
+        `pages` restreint le traitement à certaines pages d'un PDF (indices à partir de 0).
         """
         pass
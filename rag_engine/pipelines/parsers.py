@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from config import LLAMA_CLOUD_API_KEY, VISION_PARSER, PARSE_CACHE_DIR
+
+# Import conditionnel
+try:
+    from llama_parse import LlamaParse
+    HAS_LLAMA_PARSE = True
+except ImportError:
+    HAS_LLAMA_PARSE = False
+
+LLAMA_PARSE_SYSTEM_PROMPT = """
+                    You are parsing a document for a RAG system.
+                    CRITICAL INSTRUCTION: completely remove and ignore the Table of Contents (Sommaire), 
+                    Index, and List of Figures. Do not output them in the result. 
+                    Focus only on the content chapters.
+                """
+
+
+class ParserUnavailable(RuntimeError):
+    """Parseur indisponible (dépendance ou clé manquante) et résultat absent du cache."""
+
+
+class BaseParser(ABC):
+    """
+    Interface des parseurs du pipeline Vision : un fichier -> une liste de pages en Markdown.
+    """
+    name: str = "base"
+
+    def config(self) -> Dict[str, Any]:
+        """Paramètres qui influencent la sortie (ils font partie de la clé du cache)."""
+        return {}
+
+    def is_available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def parse(self, file_path: str, pages: Optional[List[int]] = None) -> List[str]:
+        """`pages` : indices des pages à parser (à partir de 0), toutes si None."""
+        pass
+
+
+class LlamaParseParser(BaseParser):
+    """Parseur LlamaCloud (analyse de layout, tables en Markdown)."""
+    name = "llamaparse"
+
+    def __init__(self, api_key: Optional[str] = LLAMA_CLOUD_API_KEY, system_prompt: str = LLAMA_PARSE_SYSTEM_PROMPT):
+        self.api_key = api_key
+        self.system_prompt = system_prompt
+
+    def config(self) -> Dict[str, Any]:
+        return {"result_type": "markdown", "system_prompt": self.system_prompt}
+
+    def is_available(self) -> bool:
+        return HAS_LLAMA_PARSE and bool(self.api_key)
+
+    def parse(self, file_path: str, pages: Optional[List[int]] = None) -> List[str]:
+        # Configuration de LlamaParse pour extraire le markdown avec analyse de layout
+        options = {"target_pages": ",".join(str(p) for p in pages)} if pages is not None else {}
+        parser = LlamaParse(
+            api_key=self.api_key,
+            result_type="markdown",
+            verbose=True,
+            system_prompt=self.system_prompt,
+            **options,
+        )
+        print("   ↳ Envoi à LlamaCloud pour analyse structurelle...")
+        documents = parser.load_data(file_path)
+        if not documents:
+            raise ValueError("Aucun document extrait par LlamaParse (possiblement erreur de crédits ou fichier incompatible)")
+        # Si c'est un objet LlamaIndex, il a un attribut 'text' ou 'get_content()'
+        return [getattr(doc, "text", str(doc)) for doc in documents]
+
+
+class LocalMarkdownParser(BaseParser):
+    """
+    Substitut local de LlamaParse (tests, environnements sans accès réseau).
+
+    Extrait le texte avec pypdf et promeut en titres Markdown les lignes qui ressemblent
+    à des intitulés (« Article 4 », « 2.1 Frais », lignes courtes en majuscules).
+    Pas d'analyse de layout : les tables restent en texte brut.
+    """
+    name = "local"
+
+    _NUMBERED = re.compile(r"^(\d+(?:\.\d+){0,2})[.)]?\s+[^\W\d_]")
+    _KEYWORD = re.compile(r"^(article|chapitre|section|titre|partie)\s+[\w.]+", re.IGNORECASE)
+
+    def __init__(self, max_heading_length: int = 80):
+        self.max_heading_length = max_heading_length
+
+    def config(self) -> Dict[str, Any]:
+        return {"max_heading_length": self.max_heading_length}
+
+    def _heading_level(self, line: str) -> int:
+        if not line or len(line) > self.max_heading_length or line.endswith((".", ",", ";")):
+            return 0
+        if self._KEYWORD.match(line):
+            return 2
+        numbered = self._NUMBERED.match(line)
+        if numbered:
+            return min(3, numbered.group(1).count(".") + 1)
+        letters = [c for c in line if c.isalpha()]
+        if len(letters) >= 4 and all(c.isupper() for c in letters):
+            return 1
+        return 0
+
+    def parse(self, file_path: str, pages: Optional[List[int]] = None) -> List[str]:
+        if not file_path.lower().endswith(".pdf"):
+            with open(file_path, encoding="utf-8", errors="ignore") as f:
+                return [f.read()]
+
+        from pypdf import PdfReader
+        reader = PdfReader(file_path)
+        results = []
+        for page_num in (pages if pages is not None else range(len(reader.pages))):
+            page = reader.pages[page_num]
+            lines = []
+            for line in (page.extract_text() or "").splitlines():
+                line = line.strip()
+                level = self._heading_level(line)
+                lines.append(f"{'#' * level} {line}" if level else line)
+            results.append("\n".join(lines))
+        return results
+
+
+PARSERS = {
+    LlamaParseParser.name: LlamaParseParser,
+    LocalMarkdownParser.name: LocalMarkdownParser,
+}
+
+
+def get_parser(name: str = VISION_PARSER) -> BaseParser:
+    if name not in PARSERS:
+        raise ValueError(f"Parseur inconnu : {name} (disponibles : {', '.join(PARSERS)})")
+    return PARSERS[name]()
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    Cache adressé par contenu des résultats de parsing : clé = hash du fichier + configuration du parseur.
+
+    Un fichier ré-ingéré sans modification (même sous un autre nom) n'est pas renvoyé au parseur.
+    Une entrée par fichier JSON, écrite de façon atomique : plusieurs workers peuvent partager le répertoire.
+    Les entrées sont regroupées par hash de fichier, ce qui permet de les purger avec le document.
+    """
+
+    def __init__(self, cache_dir: str = PARSE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_hash: str, parser: BaseParser, pages: Optional[List[int]] = None) -> str:
+        config = json.dumps({"parser": parser.name, "pages": pages, **parser.config()}, sort_keys=True)
+        return hashlib.sha256(f"{file_hash}\x00{config}".encode("utf-8")).hexdigest()
+
+    def _path(self, file_hash: str, key: str) -> str:
+        return os.path.join(self.cache_dir, file_hash, f"{key}.json")
+
+    def get(self, file_hash: str, key: str) -> Optional[List[str]]:
+        path = self._path(file_hash, key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                pages = json.load(f)["pages"]
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pages
+
+    def set(self, file_hash: str, key: str, pages: List[str]) -> None:
+        path = self._path(file_hash, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": pages}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get_or_parse(self, file_path: str, parser: BaseParser, pages: Optional[List[int]] = None) -> List[str]:
+        file_hash = file_sha256(file_path)
+        key = self.make_key(file_hash, parser, pages)
+        cached = self.get(file_hash, key)
+        if cached is not None:
+            print(f"   ↳ Parsing en cache pour {os.path.basename(file_path)}")
+            return cached
+        # Le cache reste utilisable sans le parseur (clé absente, quota épuisé)
+        if not parser.is_available():
+            raise ParserUnavailable(f"Parseur {parser.name} non disponible (LlamaParse absent ou clé manquante)")
+        parsed = parser.parse(file_path, pages)
+        self.set(file_hash, key, parsed)
+        return parsed
+
+    def drop(self, file_hash: str) -> None:
+        """Supprime toutes les entrées d'un fichier (toutes configurations de parseur confondues)."""
+        shutil.rmtree(os.path.join(self.cache_dir, file_hash), ignore_errors=True)
+
+    def prune(self, live_hashes: set) -> int:
+        """Supprime les entrées des fichiers qui ne sont plus indexés. Retourne le nombre de fichiers purgés."""
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if name not in live_hashes and os.path.isdir(os.path.join(self.cache_dir, name)):
+                self.drop(name)
+                removed += 1
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
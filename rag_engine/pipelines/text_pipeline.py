@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import List, Optional
 from langchain_core.documents import Document
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -14,7 +14,7 @@ class TextPipeline(BasePipeline):
     Chunking: Processus de découpage d'un long texte en segments plus courts ("chunks") pour faciliter leur traitement et leur indexation par le modèle.
     """
     
-    def process(self, file_path: str) -> List[Document]:
+    def process(self, file_path: str, pages: Optional[List[int]] = None) -> List[Document]:
         import time
         start_time = time.time()
         print(f"🏎️  Pipeline Texte activé pour : {os.path.basename(file_path)}")
@@ -33,6 +33,7 @@ class TextPipeline(BasePipeline):
                 print(f"   ↳ PDF ouvert, {len(reader.pages)} pages détectées.")
                 
                 # Charger les pages par lots pour éviter la surcharge mémoire
+                selected = set(pages) if pages is not None else None
                 batch_size = 100
                 all_text = ""
                 for i in range(0, len(reader.pages), batch_size):
@@ -40,6 +41,8 @@ class TextPipeline(BasePipeline):
                     print(f"   ↳ Traitement des pages {i+1} à {batch_end}...")
                     batch_start = time.time()
                     for page_num in range(i, batch_end):
+                        if selected is not None and page_num not in selected:
+                            continue
                         page = reader.pages[page_num]
                         text = page.extract_text()
                         if text.strip():
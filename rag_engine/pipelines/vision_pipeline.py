@@ -1,53 +1,47 @@
 import os
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from langchain_core.documents import Document
 from .base import BasePipeline
-from config import LLAMA_CLOUD_API_KEY
-
-# Import conditionnel
-try:
-    from llama_parse import LlamaParse
-    HAS_LLAMA_PARSE = True
-except ImportError:
-    HAS_LLAMA_PARSE = False
+from .parsers import BaseParser, ParseCache, ParserUnavailable, get_parser
+from config import PARSE_MAX_WORKERS
+from ..filters import header_path_levels
 
 class VisionPipeline(BasePipeline):
     """
     Pipeline A : 'The Sniper' (Documents Visuels/Techniques)
     Utilise LlamaParse (mode premium/vision) ou une approche OCR avancée.
     Pour l'instant, on utilise LlamaParse comme proxy pour la 'Vision' car il gère très bien les tables.
+
+    Le parseur est interchangeable (voir parsers.py, ex: substitut local sans réseau) et
+    ses résultats sont mis en cache par contenu : une ré-ingestion d'un fichier inchangé est quasi gratuite.
     """
-    
-    def process(self, file_path: str) -> List[Document]:
+
+    def __init__(self, parser: Optional[BaseParser] = None, cache: Optional[ParseCache] = None):
+        self.parser = parser or get_parser()
+        self.cache = cache or ParseCache()
+
+    def process_many(self, jobs: List[Tuple[str, Optional[List[int]]]],
+                     max_workers: int = PARSE_MAX_WORKERS) -> List[List[Document]]:
+        """
+        Traite plusieurs (fichier, pages) en parallèle (parallélisme borné : les appels au parseur
+        sont surtout de l'attente réseau). Retourne les fragments de chaque tâche, dans l'ordre.
         """
-        Traite le document avec LlamaParse pour extraire la structure complexe.
+        if not jobs:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+            return list(executor.map(lambda job: self.process(*job), jobs))
+
+    def process(self, file_path: str, pages: Optional[List[int]] = None) -> List[Document]:
+        """
+        Traite le document avec le parseur configuré pour extraire la structure complexe.
         """
         print(f"🦅 Pipeline Vision (Sniper) activé pour : {os.path.basename(file_path)}")
-        
-        if not HAS_LLAMA_PARSE or not LLAMA_CLOUD_API_KEY:
-            print("⚠️ LlamaParse non disponible ou clé manquante. Fallback sur TextPipeline.")
-            from .text_pipeline import TextPipeline
-            return TextPipeline().process(file_path)
 
         try:
-            # Configuration de LlamaParse pour extraire le markdown avec analyse de layout
-            parser = LlamaParse(
-                api_key=LLAMA_CLOUD_API_KEY,
-                result_type="markdown",
-                verbose=True,
-                system_prompt="""
-                    You are parsing a document for a RAG system.
-                    CRITICAL INSTRUCTION: completely remove and ignore the Table of Contents (Sommaire), 
-                    Index, and List of Figures. Do not output them in the result. 
-                    Focus only on the content chapters.
-                """
-            )
-            
-            print("   ↳ Envoi à LlamaCloud pour analyse structurelle...")
-            documents = parser.load_data(file_path)
-            
-            if not documents:
-                raise ValueError("Aucun document extrait par LlamaParse (possiblement erreur de crédits ou fichier incompatible)")
+            # Le cache est consulté avant la disponibilité du parseur : un fichier déjà parsé
+            # garde son découpage structurel même sans LlamaParse
+            parsed_pages = self.cache.get_or_parse(file_path, self.parser, pages)
             
             from langchain_text_splitters import MarkdownHeaderTextSplitter
             
@@ -60,10 +54,7 @@ class VisionPipeline(BasePipeline):
             markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
             
             final_docs = []
-            for doc in documents:
-                # Si c'est un objet LlamaIndex, il a un attribut 'text' ou 'get_content()'
-                content = getattr(doc, "text", str(doc))
-                
+            for content in parsed_pages:
                 # Split markdown
                 md_splits = markdown_splitter.split_text(content)
                 for split in md_splits:
@@ -78,17 +69,25 @@ class VisionPipeline(BasePipeline):
                         header_path = " > ".join(header_path_parts)
                         split.page_content = f"[{header_path}]\n\n{split.page_content}"
                         split.metadata["header_path"] = header_path
+                        # Niveaux cumulatifs pour le filtrage par préfixe de chemin
+                        split.metadata.update(header_path_levels(header_path_parts))
                     
                     # On rajoute la source
                     split.metadata["source"] = file_path
                     split.metadata["pipeline"] = "vision"
                     final_docs.append(split)
             
+            if not final_docs:
+                raise ValueError(f"Aucun contenu extrait par le parseur {self.parser.name}")
             print(f"   ↳ {len(final_docs)} fragments structurels (PARENTS avec chemin hiérarchique) générés.")
             return final_docs
 
+        except ParserUnavailable as e:
+            print(f"⚠️ {e}. Fallback sur TextPipeline.")
+            from .text_pipeline import TextPipeline
+            return TextPipeline().process(file_path, pages)
         except Exception as e:
             print(f"❌ Erreur dans le pipeline vision : {e}")
             print("   ↳ Fallback sur TextPipeline pour extraction basique...")
             from .text_pipeline import TextPipeline
-            return TextPipeline().process(file_path)
+            return TextPipeline().process(file_path, pages)
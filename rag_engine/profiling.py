@@ -0,0 +1,260 @@
+import asyncio
+import hmac
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config import (
+    PROFILING_ENABLED,
+    PROFILING_ADMIN_TOKEN,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SAMPLE_PATHS,
+    PROFILE_SAMPLE_INTERVAL_MS,
+    PROFILE_MAX_CONCURRENT,
+    PROFILE_MAX_WINDOW_S,
+    PROFILE_KEEP,
+    TRACEMALLOC_FRAMES,
+)
+
+# Fonctions d'attente : un thread arrêté dans l'un de ces fichiers ne consomme pas de CPU
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "concurrent/futures/thread.py", "multiprocessing/connection.py")
+
+
+def _short_path(filename: str) -> str:
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+def _is_idle(frame) -> bool:
+    return frame.f_code.co_filename.replace("\\", "/").endswith(_IDLE_FILES)
+
+
+class StackSampler:
+    """
+    Profileur par échantillonnage : toutes les `interval_s`, relève la pile de chaque thread
+    (`sys._current_frames`) et compte les piles identiques.
+
+    Aucune instrumentation du code profilé : le surcoût ne dépend que de la fréquence d'échantillonnage.
+    Le résultat est au format "collapsed stacks" (une ligne `thread;f1;f2;...;fN nombre`), lu par
+    flamegraph.pl, speedscope ou inferno. Les threads en attente (verrous, files, sélecteur
+    de la boucle d'événements) sont ignorés sauf avec `include_idle`.
+    """
+
+    def __init__(self, interval_s: float = PROFILE_SAMPLE_INTERVAL_MS / 1000, include_idle: bool = False):
+        self.interval_s = interval_s
+        self.include_idle = include_idle
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration_s = 0.0
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _sample(self, own_ident: int) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or (not self.include_idle and _is_idle(frame)):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            self._sample(own_ident)
+
+    def start(self) -> "StackSampler":
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration_s = time.time() - self.started_at
+        return self
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class Profiler:
+    """
+    Profilage à la demande de l'API (réservé aux administrateurs, désactivé par défaut).
+
+    - Profils par requête : `?profile=1` ou en-tête `X-Profile: 1`, plus un échantillon aléatoire
+      de PROFILE_SAMPLE_RATE des requêtes sur PROFILE_SAMPLE_PATHS.
+    - Fenêtre CPU : échantillonnage de tout le processus pendant N secondes.
+    - Mémoire : instantanés tracemalloc et différence entre deux instants.
+
+    Les piles sont celles de tout le processus pendant la requête : sous charge, un profil de requête
+    contient aussi le travail concurrent (un upload en cours apparaît sous son propre thread).
+    """
+
+    def __init__(self, enabled: bool = PROFILING_ENABLED, admin_token: Optional[str] = PROFILING_ADMIN_TOKEN,
+                 sample_rate: float = PROFILE_SAMPLE_RATE, keep: int = PROFILE_KEEP):
+        self.enabled = enabled and bool(admin_token)
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self._slots = threading.Semaphore(PROFILE_MAX_CONCURRENT)
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        return self.enabled and token is not None and hmac.compare_digest(token, self.admin_token)
+
+    def _store(self, collection: "OrderedDict", entry: Dict[str, Any]) -> str:
+        entry_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            collection[entry_id] = entry
+            while len(collection) > self.keep:
+                collection.popitem(last=False)
+        return entry_id
+
+    # Profils CPU ---------------------------------------------------------------
+
+    def start_request(self, path: str, requested: bool) -> Optional[StackSampler]:
+        """Démarre le profil d'une requête si demandé (ou tiré au sort). None sinon."""
+        if not self.enabled:
+            return None
+        if not requested and not (path in PROFILE_SAMPLE_PATHS and random.random() < self.sample_rate):
+            return None
+        # Nombre de profils simultanés borné : chaque profil a son thread d'échantillonnage
+        if not self._slots.acquire(blocking=False):
+            self.skipped += 1
+            return None
+        return StackSampler().start()
+
+    def finish(self, sampler: StackSampler, label: str, kind: str = "request") -> str:
+        try:
+            sampler.stop()
+        finally:
+            if kind == "request":
+                self._slots.release()
+        return self._store(self._profiles, {
+            "kind": kind,
+            "label": label,
+            "created_at": sampler.started_at,
+            "duration_s": round(sampler.duration_s, 3),
+            "samples": sampler.samples,
+            "collapsed": sampler.collapsed(),
+        })
+
+    async def cpu_window(self, seconds: float, include_idle: bool = False) -> str:
+        """Échantillonne tout le processus pendant `seconds` (borné à PROFILE_MAX_WINDOW_S)."""
+        seconds = max(0.1, min(seconds, PROFILE_MAX_WINDOW_S))
+        sampler = StackSampler(include_idle=include_idle).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile_id = self.finish(sampler, f"window {seconds:g}s", kind="window")
+        return profile_id
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"id": profile_id, **{k: v for k, v in profile.items() if k != "collapsed"}}
+                for profile_id, profile in reversed(self._profiles.items())
+            ]
+
+    def get_profile(self, profile_id: str) -> Optional[str]:
+        with self._lock:
+            profile = self._profiles.get(profile_id)
+        return profile["collapsed"] if profile else None
+
+    # Mémoire (tracemalloc) -------------------------------------------------------
+
+    def take_snapshot(self) -> str:
+        """Instantané des allocations. Le premier appel démarre tracemalloc (surcoût tant qu'il est actif)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        return self._store(self._snapshots, {
+            "snapshot": snapshot,
+            "created_at": time.time(),
+            "traced_mb": round(current / 1e6, 1),
+            "peak_mb": round(peak / 1e6, 1),
+        })
+
+    def _get_snapshot(self, snapshot_id: Optional[str]):
+        if snapshot_id is None:
+            snapshot_id = self.take_snapshot()
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        if entry is None:
+            raise KeyError(snapshot_id)
+        return entry["snapshot"]
+
+    def memory_diff(self, from_id: str, to_id: Optional[str] = None, limit: int = 30,
+                    key_type: str = "lineno") -> List[Dict[str, Any]]:
+        """Plus fortes variations d'allocation entre deux instantanés (`to_id` absent : maintenant)."""
+        before = self._get_snapshot(from_id)
+        after = self._get_snapshot(to_id)
+        return [
+            {
+                "location": str(stat.traceback[-1] if key_type == "traceback" else stat.traceback[0]),
+                "traceback": [str(frame) for frame in stat.traceback] if key_type == "traceback" else None,
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "size_kb": round(stat.size / 1024, 1),
+                "count_diff": stat.count_diff,
+            }
+            for stat in after.compare_to(before, key_type)[:limit]
+        ]
+
+    def memory_collapsed(self, from_id: str, to_id: Optional[str] = None) -> str:
+        """Croissance mémoire par pile d'allocation (octets), au format "collapsed stacks"."""
+        before = self._get_snapshot(from_id)
+        after = self._get_snapshot(to_id)
+        lines = []
+        for stat in after.compare_to(before, "traceback"):
+            if stat.size_diff > 0:
+                # Frames de la plus ancienne à la plus récente
+                stack = ";".join(f"{_short_path(f.filename)}:{f.lineno}".replace(";", ":") for f in stat.traceback)
+                lines.append(f"{stack} {stat.size_diff}")
+        return "\n".join(lines) + "\n"
+
+    def stop_memory(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "profiles": len(self._profiles),
+                "skipped": self.skipped,
+                "memory_snapshots": len(self._snapshots),
+                "tracemalloc": tracemalloc.is_tracing(),
+            }
+
+
+profiler = Profiler()
@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import DOC_MAP_DB, NAMESPACES_DIR
+from .pipelines.parsers import file_sha256
+
+
+def iter_vector_records(vectorstore, include_texts: bool = False,
+                        batch_size: int = 5000) -> Iterator[Tuple[str, Optional[str], Dict[str, Any]]]:
+    """Parcourt (id, texte, métadonnées) de tous les enfants de la base vectorielle (Chroma ou index ANN local)."""
+    if hasattr(vectorstore, "iter_records"):
+        yield from vectorstore.iter_records()
+        return
+    include = ["metadatas"] + (["documents"] if include_texts else [])
+    offset = 0
+    while True:
+        batch = vectorstore.get(include=include, limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        texts = batch.get("documents") or [None] * len(batch["ids"])
+        for child_id, text, metadata in zip(batch["ids"], texts, batch["metadatas"]):
+            yield child_id, text, metadata or {}
+        offset += len(batch["ids"])
+
+
+class SourceRegistry:
+    """
+    Table de correspondance source -> parents -> enfants (SQLite).
+
+    Permet de supprimer ou remplacer un document sans parcourir la base vectorielle ni le docstore.
+    Les suppressions passent par un journal (`pending_deletes`) : une suppression interrompue
+    (arrêt du processus) est rejouée au démarrage suivant, les stores ne restent jamais à moitié nettoyés.
+    """
+
+    def __init__(self, db_path: str = DOC_MAP_DB):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, file_hash TEXT, updated_at REAL);
+            CREATE TABLE IF NOT EXISTS parents (parent_id TEXT PRIMARY KEY, source TEXT);
+            CREATE TABLE IF NOT EXISTS children (child_id TEXT PRIMARY KEY, parent_id TEXT);
+            CREATE TABLE IF NOT EXISTS pending_deletes (parent_id TEXT PRIMARY KEY);
+            CREATE INDEX IF NOT EXISTS idx_parents_source ON parents (source);
+            CREATE INDEX IF NOT EXISTS idx_children_parent ON children (parent_id);
+        """)
+        self._db.commit()
+
+    def record(self, parents: Sequence[Tuple[str, str]], children: Sequence[Tuple[str, str]]) -> None:
+        """Enregistre des parents (parent_id, source) et leurs enfants (child_id, parent_id)."""
+        sources = {source for _, source in parents if source}
+        with self._lock:
+            for source in sources:
+                file_hash = file_sha256(source) if os.path.isfile(source) else None
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sources (source, file_hash, updated_at) VALUES (?, ?, ?)",
+                    (source, file_hash, time.time()),
+                )
+            self._db.executemany("INSERT OR REPLACE INTO parents (parent_id, source) VALUES (?, ?)", parents)
+            self._db.executemany("INSERT OR REPLACE INTO children (child_id, parent_id) VALUES (?, ?)", children)
+            self._db.commit()
+
+    def refresh_file_hash(self, source: str) -> None:
+        """Recalcule le hash d'une source dont le fichier a été remplacé après son indexation."""
+        file_hash = file_sha256(source) if os.path.isfile(source) else None
+        with self._lock:
+            self._db.execute("UPDATE sources SET file_hash = ? WHERE source = ?", (file_hash, source))
+            self._db.commit()
+
+    def has_source(self, source: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM sources WHERE source = ?", (source,)).fetchone() is not None
+
+    def parent_ids(self, source: str) -> List[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT parent_id FROM parents WHERE source = ?", (source,)).fetchall()
+        return [row[0] for row in rows]
+
+    def child_ids(self, parent_ids: Sequence[str]) -> List[str]:
+        child_ids = []
+        with self._lock:
+            for start in range(0, len(parent_ids), 500):
+                chunk = list(parent_ids[start:start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                child_ids.extend(row[0] for row in self._db.execute(
+                    f"SELECT child_id FROM children WHERE parent_id IN ({placeholders})", chunk
+                ))
+        return child_ids
+
+    def file_hash(self, source: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT file_hash FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def list_sources(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT s.source, s.updated_at, COUNT(DISTINCT p.parent_id), COUNT(c.child_id)
+                FROM sources s
+                LEFT JOIN parents p ON p.source = s.source
+                LEFT JOIN children c ON c.parent_id = p.parent_id
+                GROUP BY s.source ORDER BY s.source
+            """).fetchall()
+        return [
+            {"source": source, "updated_at": updated_at, "parents": parents, "children": children}
+            for source, updated_at, parents, children in rows
+        ]
+
+    def all_parent_ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT parent_id FROM parents")}
+
+    def count_parents(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM parents").fetchone()[0]
+
+    # Journal des suppressions ------------------------------------------------
+
+    def begin_delete(self, parent_ids: Sequence[str]) -> None:
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO pending_deletes (parent_id) VALUES (?)",
+                                 [(p,) for p in parent_ids])
+            self._db.commit()
+
+    def pending_deletes(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT parent_id FROM pending_deletes")]
+
+    def commit_delete(self, parent_ids: Sequence[str]) -> None:
+        """Oublie les parents supprimés (et leurs enfants) et clôt le journal, en une transaction."""
+        with self._lock:
+            for start in range(0, len(parent_ids), 500):
+                chunk = list(parent_ids[start:start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                self._db.execute(f"DELETE FROM children WHERE parent_id IN ({placeholders})", chunk)
+                self._db.execute(f"DELETE FROM parents WHERE parent_id IN ({placeholders})", chunk)
+                self._db.execute(f"DELETE FROM pending_deletes WHERE parent_id IN ({placeholders})", chunk)
+            self._db.execute("DELETE FROM sources WHERE source NOT IN (SELECT DISTINCT source FROM parents)")
+            self._db.commit()
+
+    def backfill(self, docstore, vectorstore, id_key: str = "doc_id") -> int:
+        """
+        Construit la table à partir des stores existants (index créé avant la table de correspondance).
+        Coût unique : un parcours du docstore et de la base vectorielle.
+        """
+        parents = []
+        for parent_id in docstore.yield_keys():
+            doc = docstore.mget([parent_id])[0]
+            if doc is not None:
+                parents.append((parent_id, doc.metadata.get("source", "")))
+        children = [
+            (child_id, metadata[id_key])
+            for child_id, _, metadata in iter_vector_records(vectorstore)
+            if metadata.get(id_key)
+        ]
+        self.record(parents, children)
+        print(f"🗂️  Table source -> parents -> enfants construite : {len(parents)} parents, {len(children)} enfants")
+        return len(parents)
+
+
+def live_file_hashes_all() -> set:
+    """
+    Hash des fichiers indexés dans tous les namespaces : le cache de parsing est partagé
+    (adressé par contenu), une entrée n'est purgée que si plus aucun namespace ne l'utilise.
+    """
+    paths = [DOC_MAP_DB]
+    if os.path.isdir(NAMESPACES_DIR):
+        paths += [os.path.join(NAMESPACES_DIR, name, "doc_map.db") for name in os.listdir(NAMESPACES_DIR)]
+    hashes = set()
+    for path in paths:
+        if os.path.exists(path):
+            with sqlite3.connect(path) as conn:
+                hashes.update(row[0] for row in conn.execute("SELECT file_hash FROM sources WHERE file_hash IS NOT NULL"))
+    return hashes
+
+
+_shared_registry: Optional[SourceRegistry] = None
+
+
+def get_registry() -> SourceRegistry:
+    global _shared_registry
+    if _shared_registry is None:
+        _shared_registry = SourceRegistry()
+    return _shared_registry
@@ -1,9 +1,171 @@
-from typing import Sequence, Any, List, Optional
+from typing import Sequence, Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
 from langchain_core.documents import Document
 from langchain_core.documents.compressor import BaseDocumentCompressor
 from pydantic import PrivateAttr
-from FlagEmbedding import FlagReranker
+from .inference import load_reranker
+from .aio import run_in
 from config import RERANKER_MODEL, MIN_RELEVANCE_SCORE
+from config import RERANK_CACHE_SIZE, RERANK_CACHE_DB, USE_RERANK_DISK_CACHE, RERANK_DISK_CACHE_MAX_ROWS
+from config import CASCADE_SMALL_MODEL, CASCADE_ACCEPT_RANK, CASCADE_ACCEPT_MARGIN, CASCADE_ACCEPT_SCORE
+from config import CASCADE_SMALL_MARGIN, CASCADE_SMALL_MIN_SCORE, CASCADE_BIG_SLICE
+
+def normalize_query(query: str) -> str:
+    """Normalise une requête pour le cache (Unicode NFKC, casse, espaces)."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip().casefold()
+
+
+class RerankScoreCache:
+    """
+    Cache borné des scores du reranker, clé = (modèle et backend, requête normalisée, hash du contenu).
+    
+    LRU (Least Recently Used): Politique d'éviction qui supprime en premier l'entrée utilisée
+    le moins récemment quand le cache est plein.
+    Un second niveau optionnel sur disque (SQLite) survit aux redémarrages. Il est lui aussi borné
+    (`max_disk_rows`) : `accessed_at` est mis à jour à chaque lecture, et les entrées lues le moins
+    récemment sont supprimées par lots, toutes les `max_disk_rows // 10` écritures.
+    """
+
+    def __init__(self, max_size: int = RERANK_CACHE_SIZE, db_path: Optional[str] = None,
+                 max_disk_rows: int = RERANK_DISK_CACHE_MAX_ROWS):
+        self.max_size = max_size
+        self.max_disk_rows = max_disk_rows
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        self._writes_since_prune = 0
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS rerank_scores (key TEXT PRIMARY KEY, score REAL, accessed_at REAL)")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(rerank_scores)")}
+            if "accessed_at" not in columns:
+                # Cache créé par une version précédente : les anciennes entrées seront évincées en premier
+                self._db.execute("ALTER TABLE rerank_scores ADD COLUMN accessed_at REAL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_rerank_scores_accessed ON rerank_scores (accessed_at)")
+            self._prune_disk()
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_name: str, query: str, content: str) -> str:
+        """`model_name` inclut le backend ("modèle@torch-int8") : scores int8 et fp32 ne se mélangent pas."""
+        content_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model_name}\x00{normalize_query(query)}\x00{content_hash}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            self.hits += len(found)
+
+            missing = [k for k in keys if k not in found]
+            if missing and self._db is not None:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._db.execute(
+                    f"SELECT key, score FROM rerank_scores WHERE key IN ({placeholders})", missing
+                ).fetchall()
+                for key, score in rows:
+                    found[key] = score
+                    self._put(key, score)
+                if rows:
+                    self._db.execute(
+                        f"UPDATE rerank_scores SET accessed_at = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time()] + [key for key, _ in rows],
+                    )
+                    self._db.commit()
+                self.disk_hits += len(rows)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: Dict[str, float]) -> None:
+        with self._lock:
+            for key, score in items.items():
+                self._put(key, score)
+            if self._db is not None and items:
+                now = time.time()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO rerank_scores (key, score, accessed_at) VALUES (?, ?, ?)",
+                    [(key, score, now) for key, score in items.items()],
+                )
+                self._writes_since_prune += len(items)
+                if self._writes_since_prune >= max(1, self.max_disk_rows // 10):
+                    self._prune_disk()
+                self._db.commit()
+
+    def _prune_disk(self) -> None:
+        """Ramène la table sous `max_disk_rows` en supprimant les entrées lues le moins récemment."""
+        self._writes_since_prune = 0
+        excess = self._db.execute("SELECT COUNT(*) FROM rerank_scores").fetchone()[0] - self.max_disk_rows
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM rerank_scores WHERE key IN "
+                "(SELECT key FROM rerank_scores ORDER BY accessed_at LIMIT ?)", (excess,)
+            )
+            self.disk_evictions += excess
+
+    def _put(self, key: str, score: float) -> None:
+        self._entries[key] = score
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_evictions": self.disk_evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+_shared_score_cache: Optional[RerankScoreCache] = None
+
+
+def get_score_cache() -> RerankScoreCache:
+    """Cache de scores partagé par tous les rerankers (la clé inclut le nom du modèle)."""
+    global _shared_score_cache
+    if _shared_score_cache is None:
+        _shared_score_cache = RerankScoreCache(
+            max_size=RERANK_CACHE_SIZE,
+            db_path=RERANK_CACHE_DB if USE_RERANK_DISK_CACHE else None,
+        )
+    return _shared_score_cache
+
+
+# Désactive le cache de scores (lecture et écriture) pour les requêtes techniques comme le préchauffage
+_bypass_cache: ContextVar[bool] = ContextVar("rerank_bypass_cache", default=False)
+
+
+@contextmanager
+def bypass_score_cache():
+    """Les scores calculés dans ce bloc ne sont ni lus ni écrits dans le cache (mémoire et disque)."""
+    token = _bypass_cache.set(True)
+    try:
+        yield
+    finally:
+        _bypass_cache.reset(token)
+
 
 class BgeRerankCompressor(BaseDocumentCompressor):
     """
@@ -16,46 +178,108 @@ class BgeRerankCompressor(BaseDocumentCompressor):
     top_n: int = 3
     min_score: Optional[float] = MIN_RELEVANCE_SCORE
     _reranker: Any = PrivateAttr()
+    _cache: Optional[RerankScoreCache] = PrivateAttr(default=None)
+    _cache_model_key: Optional[str] = PrivateAttr(default=None)
 
     def __init__(self, model_name: str = RERANKER_MODEL, top_n: int = 3, 
-                 min_score: Optional[float] = MIN_RELEVANCE_SCORE, **kwargs):
+                 min_score: Optional[float] = MIN_RELEVANCE_SCORE,
+                 cache: Optional[RerankScoreCache] = None, **kwargs):
         super().__init__(**kwargs)
         self.model_name = model_name
         self.top_n = top_n
         self.min_score = min_score
+        self._cache = cache if cache is not None else get_score_cache()
         print(f"🚀 Initialisation du Reranker : {model_name} (Cela peut prendre un moment...)")
         print(f"   ↳ Seuil de pertinence minimum : {min_score}")
         
         try:
-            # use_fp16=True pour accélérer l'inférence sur GPU/CPU compatible
-            self._reranker = FlagReranker(model_name, use_fp16=True)
+            # Backend CPU (fp32, int8 ou ONNX) choisi par configuration ou auto-benchmark
+            self._reranker = load_reranker(model_name)
         except Exception as e:
             print(f"⚠️ ERREUR : Impossible de charger le Reranker (BGE) : {e}")
             print("   ↳ Le système continuera de fonctionner sans reranking (recherche vectorielle/hybride seule).")
             self._reranker = None
 
+    def score(self, query: str, documents: Sequence[Document]) -> List[float]:
+        """
+        Calcule les scores bruts (logits) du modèle pour chaque paire (requête, document).
+        """
+        return self.score_many([(query, documents)])[0]
+
+    def score_many(self, items: Sequence[Tuple[str, Sequence[Document]]]) -> List[List[float]]:
+        """
+        Score plusieurs requêtes à la fois : toutes les paires sont envoyées dans les mêmes lots.
+        
+        Seules les paires absentes du cache passent par `compute_score`.
+        """
+        if self._reranker is None:
+            return [[] for _ in items]
+
+        flat = [(query, doc) for query, documents in items for doc in documents]
+        if not flat:
+            return [[] for _ in items]
+
+        if self._cache_model_key is None:
+            # Un même modèle donne des scores différents selon le backend (quantification int8, ONNX)
+            self._cache_model_key = f"{self.model_name}@{getattr(self._reranker, 'backend', 'torch')}"
+        keys = [RerankScoreCache.make_key(self._cache_model_key, query, doc.page_content) for query, doc in flat]
+        cache = None if _bypass_cache.get() else self._cache
+        cached = cache.get_many(keys) if cache is not None else {}
+
+        misses = [i for i, key in enumerate(keys) if key not in cached]
+        if misses:
+            pairs = [[flat[i][0], flat[i][1].page_content] for i in misses]
+            scores = self._reranker.compute_score(pairs)
+
+            # Gérer le cas où un seul document est passé (scores est un float)
+            if isinstance(scores, float):
+                scores = [scores]
+            computed = {keys[i]: float(score) for i, score in zip(misses, scores)}
+            if cache is not None:
+                cache.set_many(computed)
+            cached = {**cached, **computed}
+
+        results, offset = [], 0
+        for _, documents in items:
+            results.append([cached[key] for key in keys[offset:offset + len(documents)]])
+            offset += len(documents)
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiques du cache de scores."""
+        return {"cache": self._cache.get_stats() if self._cache is not None else None}
+
     def compress_documents(
         self, documents: Sequence[Document], query: str, callbacks=None
     ) -> Sequence[Document]:
         """
         Rerank les documents en utilisant le modèle BGE.
         """
-        if not documents:
-            return []
-        
-        # Si le reranker n'a pas pu être chargé (ex: hors ligne), on retourne les documents bruts
+        return self.compress_documents_batch([(query, documents)])[0]
+
+    async def acompress_documents(
+        self, documents: Sequence[Document], query: str, callbacks=None
+    ) -> Sequence[Document]:
+        """Reranking sur l'executor des modèles (taille fixe) : la boucle d'événements reste libre."""
         if self._reranker is None:
             return documents
-        
-        pairs = [[query, doc.page_content] for doc in documents]
-        
+        return await run_in("model", self.compress_documents, documents, query)
+
+    def compress_documents_batch(
+        self, items: Sequence[Tuple[str, Sequence[Document]]]
+    ) -> List[Sequence[Document]]:
+        """
+        Rerank plusieurs listes (requête, candidats) en partageant les lots du modèle.
+        """
+        # Si le reranker n'a pas pu être chargé (ex: hors ligne), on retourne les documents bruts
+        if self._reranker is None:
+            return [documents for _, documents in items]
+
         # Calculer les scores de pertinence
-        scores = self._reranker.compute_score(pairs)
-        
-        # Gérer le cas où un seul document est passé (scores est un float)
-        if isinstance(scores, float):
-            scores = [scores]
+        all_scores = self.score_many(items)
+        return [self._rank(documents, scores) for (_, documents), scores in zip(items, all_scores)]
 
+    def _rank(self, documents: Sequence[Document], scores: List[float]) -> List[Document]:
         # Associer chaque document à son score
         doc_score_pairs = list(zip(documents, scores))
         
@@ -74,3 +298,178 @@ class BgeRerankCompressor(BaseDocumentCompressor):
             final_docs.append(doc)
             
         return final_docs
+
+
+class CascadeRerankCompressor(BaseDocumentCompressor):
+    """
+    Reranking en cascade : le cross-encoder complet n'est utilisé que lorsque c'est nécessaire.
+    
+    Cross-Encoder: Modèle qui lit la requête et le document ensemble pour produire un score ;
+    précis mais coûteux, son coût est proportionnel au nombre de paires évaluées.
+    
+    1. Accord BM25 + vectoriel : les candidats classés dans le top `accept_rank` des deux
+       recherches, avec une marge nette sur les suivants, sont acceptés sans cross-encoder
+       et placés en tête (`relevance_score` d'au moins `accept_score`).
+    2. Petit cross-encoder rapide sur les autres candidats, pour compléter le top_n : accepté
+       si la frontière est nette (écart de score >= `small_margin`).
+    3. Sinon, seule la tranche ambiguë (`big_slice` meilleurs candidats) passe au grand modèle.
+    
+    Nécessite les rangs par recherche posés par `RankTrackingEnsembleRetriever`
+    (sans eux, l'étage 1 est simplement ignoré).
+    """
+    top_n: int = 3
+    min_score: Optional[float] = MIN_RELEVANCE_SCORE
+    small_min_score: Optional[float] = CASCADE_SMALL_MIN_SCORE
+    accept_rank: int = CASCADE_ACCEPT_RANK
+    accept_margin: float = CASCADE_ACCEPT_MARGIN
+    accept_score: float = CASCADE_ACCEPT_SCORE
+    small_margin: float = CASCADE_SMALL_MARGIN
+    big_slice: int = CASCADE_BIG_SLICE
+    _small: Any = PrivateAttr()
+    _big: Any = PrivateAttr()
+    _stats_lock: Any = PrivateAttr()
+    _tier_counts: Dict[int, int] = PrivateAttr()
+    _tier_seconds: Dict[int, float] = PrivateAttr()
+
+    def __init__(self, small_model_name: str = CASCADE_SMALL_MODEL, big_model_name: str = RERANKER_MODEL,
+                 top_n: int = 3, min_score: Optional[float] = MIN_RELEVANCE_SCORE, **kwargs):
+        super().__init__(top_n=top_n, min_score=min_score, **kwargs)
+        print(f"🪜 Reranking en cascade : {small_model_name} -> {big_model_name}")
+        self._small = BgeRerankCompressor(model_name=small_model_name, top_n=top_n, min_score=self.small_min_score)
+        self._big = BgeRerankCompressor(model_name=big_model_name, top_n=top_n, min_score=min_score)
+        self._stats_lock = threading.Lock()
+        self._tier_counts = {1: 0, 2: 0, 3: 0}
+        self._tier_seconds = {1: 0.0, 2: 0.0, 3: 0.0}
+
+    def compress_documents(
+        self, documents: Sequence[Document], query: str, callbacks=None
+    ) -> Sequence[Document]:
+        if not documents:
+            return []
+        start = time.perf_counter()
+
+        # Étage 1 : accord des signaux bon marché
+        accepted, others = self._accept_by_agreement(documents)
+        if len(accepted) >= self.top_n or not others:
+            return self._finish(1, accepted, [], start)
+        # Les autres candidats complètent le top_n (étages 2 et 3)
+        tier, filled = self._rerank_with_models(others, query, self.top_n - len(accepted))
+        return self._finish(tier, accepted, filled, start)
+
+    async def acompress_documents(
+        self, documents: Sequence[Document], query: str, callbacks=None
+    ) -> Sequence[Document]:
+        if not documents:
+            return []
+        start = time.perf_counter()
+        # L'étage 1 reste dans la boucle (quelques comparaisons) ; les modèles passent par leur executor
+        accepted, others = self._accept_by_agreement(documents)
+        if len(accepted) >= self.top_n or not others:
+            return self._finish(1, accepted, [], start)
+        tier, filled = await run_in("model", self._rerank_with_models, others, query, self.top_n - len(accepted))
+        return self._finish(tier, accepted, filled, start)
+
+    def _rerank_with_models(self, documents: Sequence[Document], query: str,
+                            top_n: int) -> Tuple[int, List[Document]]:
+        """(étage final, `top_n` meilleurs documents) des étages 2 et 3."""
+        # Étage 2 : petit cross-encoder
+        candidates = list(documents)
+        if self._small._reranker is not None:
+            small_scores = self._small.score(query, candidates)
+            ranked = sorted(zip(candidates, small_scores), key=lambda x: x[1], reverse=True)
+            if self._big._reranker is None or self._is_clear_cut(ranked, top_n):
+                return 2, self._select(ranked, self.small_min_score, top_n)
+            candidates = [doc for doc, _ in ranked[:max(self.big_slice, top_n)]]
+
+        # Étage 3 : grand modèle sur la tranche ambiguë uniquement
+        if self._big._reranker is None:
+            return 3, candidates[:top_n]
+        big_scores = self._big.score(query, candidates)
+        ranked = sorted(zip(candidates, big_scores), key=lambda x: x[1], reverse=True)
+        return 3, self._select(ranked, self.min_score, top_n)
+
+    def _accept_by_agreement(self, documents: Sequence[Document]) -> Tuple[List[Document], List[Document]]:
+        """(documents acceptés sans cross-encoder, autres candidats) ; aucun accepté si l'accord n'est pas net."""
+        if any("retrieval_ranks" not in doc.metadata for doc in documents):
+            return [], list(documents)
+
+        agreed, others = [], []
+        for doc in documents:
+            ranks = doc.metadata["retrieval_ranks"]
+            if len(ranks) > 1 and all(rank <= self.accept_rank for rank in ranks.values()):
+                agreed.append(doc)
+            else:
+                others.append(doc)
+        if not agreed:
+            return [], others
+
+        # Marge relative entre le moins bon accepté et le meilleur des autres (score de fusion RRF)
+        worst_agreed = min(doc.metadata.get("fusion_score", 0.0) for doc in agreed)
+        best_other = max((doc.metadata.get("fusion_score", 0.0) for doc in others), default=0.0)
+        if worst_agreed <= 0 or (worst_agreed - best_other) / worst_agreed < self.accept_margin:
+            return [], list(documents)
+        return agreed[:self.top_n], others
+
+    def _is_clear_cut(self, ranked: List[Tuple[Document, float]], top_n: int) -> bool:
+        """La frontière du top_n est nette si l'écart de score au seuil est suffisant."""
+        k = min(top_n, len(ranked))
+        last_in = ranked[k - 1][1]
+        if k < len(ranked):
+            first_out = ranked[k][1]
+        elif self.small_min_score is not None:
+            first_out = self.small_min_score
+        else:
+            return True
+        return last_in - first_out >= self.small_margin
+
+    def _select(self, ranked: List[Tuple[Document, float]], min_score: Optional[float],
+                top_n: int) -> List[Document]:
+        final_docs = []
+        for doc, score in ranked:
+            if min_score is not None and score < min_score:
+                continue
+            doc.metadata["relevance_score"] = round(float(score), 3)
+            final_docs.append(doc)
+        return final_docs[:top_n]
+
+    def _finish(self, tier: int, accepted: List[Document], filled: List[Document], start: float) -> List[Document]:
+        """
+        Documents acceptés à l'étage 1 en tête, puis ceux des étages suivants.
+        Les acceptés reçoivent un score au moins égal au meilleur score des modèles (ordre conservé
+        quand les résultats sont fusionnés par score, ex: plusieurs namespaces).
+        La requête est comptée à l'étage le plus coûteux qu'elle a atteint.
+        """
+        best_filled = max((doc.metadata["relevance_score"] for doc in filled if "relevance_score" in doc.metadata),
+                          default=self.accept_score)
+        for doc in accepted:
+            doc.metadata["relevance_score"] = round(max(self.accept_score, best_filled), 3)
+            doc.metadata["rerank_tier"] = 1
+        for doc in filled:
+            doc.metadata["rerank_tier"] = tier
+        with self._stats_lock:
+            self._tier_counts[tier] += 1
+            self._tier_seconds[tier] += time.perf_counter() - start
+        return accepted + filled
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Part des requêtes traitées à chaque étage et durée moyenne par étage.
+
+        Durées en temps réel (`time.perf_counter`) : les modèles tournent dans l'executor "model",
+        un compteur CPU du thread appelant n'en verrait rien ; l'attente de l'executor est comprise.
+        """
+        with self._stats_lock:
+            total = sum(self._tier_counts.values())
+            return {
+                "cache": self._big._cache.get_stats() if self._big._cache is not None else None,
+                "requests": total,
+                "clock": "perf_counter",
+                "tiers": {
+                    tier: {
+                        "count": count,
+                        "fraction": round(count / total, 3) if total else 0.0,
+                        "mean_wall_ms": round(1000 * self._tier_seconds[tier] / count, 2) if count else 0.0,
+                    }
+                    for tier, count in self._tier_counts.items()
+                },
+            }
@@ -1,6 +1,8 @@
 import os
-from typing import List
+from typing import Dict, List
 from langchain_core.documents import Document
+from config import USE_SMART_ROUTER
+from .complexity import RoutingPlan, analyze_pdf, plan_routing
 from .pipelines.text_pipeline import TextPipeline
 from .pipelines.vision_pipeline import VisionPipeline
 
@@ -20,21 +22,76 @@ class DocumentRouter:
         """
         Analyse le document et choisit le bon pipeline.
         """
-        filename = os.path.basename(file_path)
-        
-        # Heuristique simple pour commencer (Extension)
-        if file_path.lower().endswith(".txt"):
+        if not file_path.lower().endswith(".pdf"):
             return self.text_pipeline.process(file_path)
-        
-        # Pour le moment, on force le VisionPipeline pour les PDF car c'est le but de l'upgrade
-        if file_path.lower().endswith(".pdf"):
-            print(f"🚦 Router: PDF détecté '{filename}' -> Direction Pipeline Vision")
-            return self.vision_pipeline.process(file_path)
-            
-        return self.text_pipeline.process(file_path)
 
-    def _analyze_complexity(self, file_path: str) -> bool:
+        plan = self._analyze_complexity(file_path)
+        documents = []
+        # Tranches consécutives dans l'ordre des pages : un document mixte garde son ordre
+        for kind, pages in plan.segments():
+            pipeline = self.vision_pipeline if kind == "vision" else self.text_pipeline
+            documents.extend(pipeline.process(file_path, self._pages_arg(pages, plan)))
+        return documents
+
+    def route_and_process_many(self, file_paths: List[str]) -> List[Document]:
+        """
+        Traite un lot de fichiers : les tranches Vision de tous les PDF sont envoyées en parallèle
+        au pipeline Vision, le reste est traité à la suite. L'ordre des fichiers et des pages est conservé.
         """
-        (À implémenter) Convertit la page 1 en image et demande à un LLM/Classifier.
+        plans: Dict[str, RoutingPlan] = {
+            p: self._analyze_complexity(p) for p in file_paths if p.lower().endswith(".pdf")
+        }
+        vision_jobs = [
+            ((path, i), (path, self._pages_arg(pages, plan)))
+            for path, plan in plans.items()
+            for i, (kind, pages) in enumerate(plan.segments()) if kind == "vision"
+        ]
+        vision_results = dict(zip(
+            [key for key, _ in vision_jobs],
+            self.vision_pipeline.process_many([job for _, job in vision_jobs]),
+        ))
+
+        documents = []
+        for file_path in file_paths:
+            plan = plans.get(file_path)
+            if plan is None:
+                documents.extend(self.text_pipeline.process(file_path))
+                continue
+            for i, (kind, pages) in enumerate(plan.segments()):
+                if kind == "vision":
+                    documents.extend(vision_results[(file_path, i)])
+                else:
+                    documents.extend(self.text_pipeline.process(file_path, self._pages_arg(pages, plan)))
+        return documents
+
+    @staticmethod
+    def _pages_arg(pages: List[int], plan: RoutingPlan):
+        """None quand le pipeline traite tout le document (clé de cache et appel au parseur inchangés)."""
+        return None if len(pages) == plan.page_count else pages
+
+    def _analyze_complexity(self, file_path: str) -> RoutingPlan:
         """
-        return True
+        Classifieur local et rapide (signaux pypdf, voir complexity.py) : les pages scannées
+        ou riches en tableaux vont au pipeline Vision, les pages textuelles au pipeline Texte.
+        """
+        filename = os.path.basename(file_path)
+        if not USE_SMART_ROUTER:
+            print(f"🚦 Router: PDF détecté '{filename}' -> Direction Pipeline Vision")
+            return RoutingPlan(vision_pages=list(range(self._page_count(file_path))))
+
+        try:
+            plan = plan_routing(analyze_pdf(file_path))
+        except Exception as e:
+            print(f"⚠️ Analyse de '{filename}' impossible ({e}) -> Direction Pipeline Vision")
+            return RoutingPlan(vision_pages=list(range(self._page_count(file_path))))
+
+        print(f"🚦 Router: '{filename}' -> Texte : {len(plan.text_pages)} pages, Vision : {len(plan.vision_pages)} pages")
+        return plan
+
+    @staticmethod
+    def _page_count(file_path: str) -> int:
+        from pypdf import PdfReader
+        try:
+            return len(PdfReader(file_path).pages)
+        except Exception:
+            return 1
@@ -5,14 +5,33 @@ from langchain_core.messages import HumanMessage, AIMessage
 from langchain_community.cache import SQLiteCache
 from langchain_core.globals import set_llm_cache
 import os
-from config import PERSIST_DIR, DOC_STORE_DIR, LLM_CACHE_DB, CACHE_DIR
+import threading
+import time
+from typing import Optional
+from config import PERSIST_DIR, DOC_STORE_DIR, LLM_CACHE_DB, CACHE_DIR, SNAPSHOT_PATH
+from .snapshot import import_snapshot, recover_interrupted_import
+from .documents import prepare_registry
+from .reranker import bypass_score_cache
 
-def setup_rag_system():
+
+class SetupCancelled(Exception):
+    """Arrêt demandé pendant la configuration du système RAG."""
+
+
+def _check_stop(stop_event: Optional[threading.Event], step: str) -> None:
+    if stop_event is not None and stop_event.is_set():
+        raise SetupCancelled(f"configuration interrompue avant : {step}")
+
+
+def setup_rag_system(stop_event: Optional[threading.Event] = None):
     """
     Configure et retourne le système RAG.
     
     RAG (Retrieval-Augmented Generation): Technique d'IA qui améliore les réponses d'un LLM en lui fournissant des informations pertinentes récupérées dans une base de connaissances externe avant de générer sa réponse.
     Cache: Mécanisme de stockage temporaire permettant de sauvegarder les résultats de calculs coûteux (comme les réponses du LLM) pour les réutiliser rapidement lors de requêtes identiques.
+
+    `stop_event` (arrêt de l'API) est vérifié entre les étapes : la configuration lève alors
+    `SetupCancelled`. Une étape commencée va à son terme (pas de corpus à moitié indexé).
     """
     print("🔧 Configuration du système RAG avec Groq...")
 
@@ -22,7 +41,16 @@ def setup_rag_system():
     set_llm_cache(SQLiteCache(database_path=LLM_CACHE_DB))
     print(f"🧠 Cache LLM activé : {LLM_CACHE_DB}")
 
+    # 0bis. Restauration d'un snapshot si le stockage est vide (filesystem éphémère)
+    recover_interrupted_import()
+    _check_stop(stop_event, "restauration du snapshot")
+    is_empty = not os.path.exists(DOC_STORE_DIR) or not os.listdir(DOC_STORE_DIR)
+    if is_empty and SNAPSHOT_PATH and os.path.exists(SNAPSHOT_PATH):
+        print(f"📦 Stockage vide, restauration du snapshot {SNAPSHOT_PATH}...")
+        import_snapshot(SNAPSHOT_PATH)
+
     # 1. Initialisation des composants de stockage
+    _check_stop(stop_event, "chargement des index")
     vectorstore = get_vectorstore()
     docstore = get_docstore()
     
@@ -33,6 +61,7 @@ def setup_rag_system():
     retriever = get_retriever(vectorstore, docstore)
 
     # 4. Indexation si nécessaire
+    _check_stop(stop_event, "indexation")
     if is_empty:
         print("📂 Base de documents vide. Lancement de l'ingestion...")
         documents = load_and_split_documents()
@@ -46,13 +75,32 @@ def setup_rag_system():
     else:
         print("✅ Base de documents existante chargée.")
 
+    # Table source -> parents -> enfants (suppression/remplacement de documents)
+    _check_stop(stop_event, "registre des sources")
+    prepare_registry(retriever)
+
     # 4. Création de la chaîne RAG
+    _check_stop(stop_event, "création de la chaîne")
     retrieval_chain = create_rag_chain(retriever)
 
     print("✅ Système RAG prêt !")
     return retrieval_chain, retriever
 
 
+def warmup_retriever(retriever):
+    """
+    Exécute une recherche complète (BM25, vectoriel, reranker) pour initialiser les modèles
+    avant la première vraie requête. Les scores de la requête "warmup" ne vont pas dans le cache.
+    """
+    start = time.time()
+    try:
+        with bypass_score_cache():
+            retriever.invoke("warmup")
+        print(f"🔥 Modèles préchauffés en {time.time() - start:.2f}s")
+    except Exception as e:
+        print(f"⚠️ Préchauffage incomplet : {e}")
+
+
 def main():
     """Interface interactive pour poser des questions"""
     try:
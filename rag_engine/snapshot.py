@@ -0,0 +1,263 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import time
+from typing import Dict, List, Tuple
+
+from config import (
+    PERSIST_DIR,
+    DOC_STORE_DIR,
+    BM25_INDEX_PATH,
+    DOC_MAP_DB,
+    NAMESPACES_DIR,
+    EMBEDDINGS_CACHE_DIR,
+    ANN_INDEX_DIR,
+    EMBEDDING_MODEL,
+    RERANKER_MODEL,
+)
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+BACKUP_SUFFIX = ".snapshot_old"
+
+# Nom dans l'archive -> emplacement local
+COMPONENTS = {
+    "chroma_db": PERSIST_DIR,
+    "doc_store": DOC_STORE_DIR,
+    "bm25_index.pkl": BM25_INDEX_PATH,
+    "embeddings_cache": EMBEDDINGS_CACHE_DIR,
+    "ann_index": ANN_INDEX_DIR,
+    "doc_map.db": DOC_MAP_DB,
+    "namespaces": NAMESPACES_DIR,
+}
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _HashingReader:
+    """Lecture d'un fichier qui calcule le SHA-256 des octets effectivement copiés dans l'archive."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+
+def _iter_component_files(arcname: str, path: str) -> List[Tuple[str, str]]:
+    if os.path.isfile(path):
+        return [(arcname, path)]
+    files = []
+    for root, _, filenames in os.walk(path):
+        for filename in sorted(filenames):
+            full_path = os.path.join(root, filename)
+            files.append((os.path.join(arcname, os.path.relpath(full_path, path)), full_path))
+    return files
+
+
+def export_snapshot(archive_path: str) -> Dict:
+    """
+    Regroupe la base vectorielle, le docstore, l'index BM25 et le cache d'embeddings
+    dans une archive unique, versionnée et vérifiée par sommes de contrôle (SHA-256).
+
+    L'archive n'est pas compressée : l'extraction est une simple copie et les fichiers
+    `.npy` de l'index ANN restent directement chargeables en mmap après restauration.
+    L'export se fait sous le verrou d'écriture du corpus (tous les composants au même instant),
+    et chaque somme de contrôle porte sur les octets écrits dans l'archive, lus une seule fois.
+    """
+    from .documents import _write_lock
+
+    start = time.time()
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "embedding_model": EMBEDDING_MODEL,
+        "reranker_model": RERANKER_MODEL,
+        "components": [],
+        "files": {},
+    }
+
+    tmp_path = archive_path + ".tmp"
+    with _write_lock, tarfile.open(tmp_path, "w") as tar:
+        for arcname, path in COMPONENTS.items():
+            if not os.path.exists(path):
+                continue
+            manifest["components"].append(arcname)
+            for member_name, file_path in _iter_component_files(arcname, path):
+                with open(file_path, "rb") as f:
+                    # Taille lue sur le descripteur ouvert : exactement les octets copiés et hachés
+                    info = tar.gettarinfo(arcname=member_name, fileobj=f)
+                    reader = _HashingReader(f)
+                    tar.addfile(info, reader)
+                manifest["files"][member_name] = reader.digest.hexdigest()
+
+        payload = json.dumps(manifest, indent=2).encode("utf-8")
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(payload)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(payload))
+    os.replace(tmp_path, archive_path)
+
+    print(f"📦 Snapshot exporté : {archive_path} ({len(manifest['files'])} fichiers, {time.time() - start:.2f}s)")
+    return manifest
+
+
+def _swap_journal_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(DOC_STORE_DIR)), ".snapshot_swap.json")
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _rollback(components: List[str]) -> None:
+    """Remet en place les données d'avant l'import (sauvegardes `.snapshot_old`)."""
+    for arcname in components:
+        target = COMPONENTS[arcname]
+        if os.path.exists(target + BACKUP_SUFFIX):
+            _remove(target)
+            os.replace(target + BACKUP_SUFFIX, target)
+        elif os.path.exists(target + ".snapshot_new"):
+            # Composant absent avant l'import
+            _remove(target)
+            os.remove(target + ".snapshot_new")
+        _remove(target + ".snapshot_incoming")
+
+
+def recover_interrupted_import() -> bool:
+    """
+    Annule un import interrompu pendant le remplacement des composants (arrêt du processus) :
+    l'index n'est jamais laissé à moitié ancien, à moitié nouveau. À appeler au démarrage.
+    """
+    journal_path = _swap_journal_path()
+    if not os.path.exists(journal_path):
+        return False
+    with open(journal_path) as f:
+        components = json.load(f)["components"]
+    _rollback(components)
+    os.remove(journal_path)
+    print("↩️  Import de snapshot interrompu : données précédentes restaurées")
+    return True
+
+
+def _stage_components(staging: str, components: List[str]) -> None:
+    """Place chaque composant extrait à côté de sa cible : le remplacement n'est plus qu'une suite de renommages."""
+    try:
+        for arcname in components:
+            target = COMPONENTS[arcname]
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _remove(target + ".snapshot_incoming")
+            source = os.path.join(staging, arcname)
+            if os.path.exists(source):
+                shutil.move(source, target + ".snapshot_incoming")
+            else:
+                # Répertoire vide à l'export : aucun fichier dans l'archive
+                os.makedirs(target + ".snapshot_incoming")
+    except Exception:
+        for arcname in components:
+            _remove(COMPONENTS[arcname] + ".snapshot_incoming")
+        raise
+
+
+def _swap_components(components: List[str]) -> None:
+    """
+    Remplace tous les composants, ou aucun. Chaque composant est renommé (`os.replace`, atomique
+    sur un même système de fichiers) après sauvegarde de l'ancien ; un journal permet d'annuler
+    le remplacement s'il est interrompu, une erreur l'annule immédiatement.
+    """
+    journal_path = _swap_journal_path()
+    with open(journal_path, "w") as f:
+        json.dump({"components": components}, f)
+    try:
+        for arcname in components:
+            target = COMPONENTS[arcname]
+            _remove(target + BACKUP_SUFFIX)
+            if os.path.exists(target):
+                os.replace(target, target + BACKUP_SUFFIX)
+            else:
+                open(target + ".snapshot_new", "w").close()
+            os.replace(target + ".snapshot_incoming", target)
+    except Exception:
+        _rollback(components)
+        os.remove(journal_path)
+        raise
+    # Point de validation : le journal supprimé, l'import ne peut plus être annulé
+    os.remove(journal_path)
+    for arcname in components:
+        target = COMPONENTS[arcname]
+        _remove(target + BACKUP_SUFFIX)
+        _remove(target + ".snapshot_new")
+
+
+def import_snapshot(archive_path: str) -> Dict:
+    """
+    Restaure une archive produite par `export_snapshot`.
+
+    Les fichiers sont extraits dans un répertoire temporaire et vérifiés (version, modèle
+    d'embedding, SHA-256) avant de remplacer les données existantes. Le remplacement se fait
+    sous le verrou d'écriture du corpus et porte sur tous les composants ou sur aucun.
+    """
+    from .documents import _write_lock
+
+    start = time.time()
+    recover_interrupted_import()
+    staging = os.path.join(os.path.dirname(os.path.abspath(DOC_STORE_DIR)), ".snapshot_staging")
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+
+    with tarfile.open(archive_path, "r") as tar:
+        manifest = json.load(tar.extractfile(MANIFEST_NAME))
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Version de snapshot non supportée : {manifest.get('format_version')}")
+        if manifest.get("embedding_model") != EMBEDDING_MODEL:
+            raise ValueError(
+                f"Snapshot créé avec {manifest.get('embedding_model')}, modèle configuré : {EMBEDDING_MODEL}"
+            )
+        members = [m for m in tar.getmembers() if m.name in manifest["files"]]
+        tar.extractall(staging, members=members, filter="data")
+
+    for member_name, expected in manifest["files"].items():
+        if _sha256(os.path.join(staging, member_name)) != expected:
+            shutil.rmtree(staging)
+            raise ValueError(f"Somme de contrôle invalide pour {member_name}")
+
+    try:
+        _stage_components(staging, manifest["components"])
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    with _write_lock:
+        _swap_components(manifest["components"])
+
+    print(f"📦 Snapshot restauré : {archive_path} ({len(manifest['files'])} fichiers, {time.time() - start:.2f}s)")
+    return manifest
+
+
+def main():
+    """Usage : python -m rag_engine.snapshot export|import <archive.tar>"""
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print(main.__doc__)
+        sys.exit(1)
+    if sys.argv[1] == "export":
+        export_snapshot(sys.argv[2])
+    else:
+        import_snapshot(sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,222 @@
 from langchain_community.vectorstores import Chroma
 from langchain_community.retrievers import BM25Retriever
 from langchain_classic.retrievers import ContextualCompressionRetriever, ParentDocumentRetriever, EnsembleRetriever
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_classic.retrievers.multi_vector import SearchType
 from langchain_classic.storage.file_system import LocalFileStore
 from langchain_classic.storage.encoder_backed import EncoderBackedStore
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain_text_splitters import TextSplitter
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
 from langchain_core.documents import Document
-from typing import List, Any
+from typing import List, Any, Dict, Optional
+from pydantic import PrivateAttr
+import numpy as np
 from langchain_classic.embeddings.cache import CacheBackedEmbeddings
 from config import EMBEDDING_MODEL, PERSIST_DIR, DOC_STORE_DIR, SEARCH_K, USE_RERANKER, USE_HYBRID_SEARCH, EMBEDDINGS_CACHE_DIR, SEMANTIC_CHUNKER_THRESHOLD, MIN_RELEVANCE_SCORE
-from .reranker import BgeRerankCompressor
+from config import VECTOR_BACKEND, COLLECTION_NAME, ANN_INDEX_DIR, ANN_INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, IVF_NLIST, IVF_NPROBE, METADATA_FILTER_FIELDS
+from config import USE_RERANK_CASCADE, BM25_INDEX_PATH, BM25_BACKEND
+from .reranker import BgeRerankCompressor, CascadeRerankCompressor
+from .ann_store import LocalANNVectorStore, deferred_persist
+from .bm25 import ArrayBM25Retriever, HAS_SCIPY, TOKENIZER_VERSION
+from .chunking import SemanticTextSplitter
+from .aio import run_in, amget, asimilarity_search
+from .inference import get_embeddings
+from .filters import MetadataPostings, get_retrieval_filter
+from .admission import get_degradation
+from .registry import get_registry
+from .coalescing import SingleFlight
 import os
 import shutil
 import pickle
+import uuid
 
 
-class SemanticTextSplitter(TextSplitter):
+class FilteredParentDocumentRetriever(ParentDocumentRetriever):
     """
-    Wrapper qui adapte SemanticChunker à l'interface TextSplitter.
-    Permet d'utiliser le découpage sémantique avec ParentDocumentRetriever.
-    
-    SemanticChunker: Découpe le texte aux endroits où le sens change significativement,
-    en utilisant les embeddings pour détecter les transitions sémantiques.
+    ParentDocumentRetriever qui applique le filtre de métadonnées de la requête en cours
+    directement dans la recherche vectorielle (clause `where` de Chroma / pré-filtrage ANN).
+
+    Si un `registry` est fourni, les identifiants source -> parents -> enfants sont enregistrés
+    à l'indexation (suppression et remplacement de documents, voir rag_engine/documents.py).
+    `bm25_index_path` désigne l'index BM25 persisté du même corpus (un par namespace).
     """
-    
-    def __init__(self, embeddings, breakpoint_threshold_type: str = "percentile", 
-                 breakpoint_threshold_amount: int = 90, **kwargs):
-        super().__init__(**kwargs)
-        self._semantic_chunker = SemanticChunker(
-            embeddings=embeddings,
-            breakpoint_threshold_type=breakpoint_threshold_type,
-            breakpoint_threshold_amount=breakpoint_threshold_amount
+    registry: Optional[Any] = None  # SourceRegistry
+    bm25_index_path: str = BM25_INDEX_PATH
+
+    def _split_docs_for_adding(self, documents: List[Document], ids: Optional[List[str]] = None, *,
+                               add_to_docstore: bool = True):
+        """Découpe groupée : les phrases de tout le lot de parents sont embeddées ensemble."""
+        if not hasattr(self.child_splitter, "iter_split_documents"):
+            return super()._split_docs_for_adding(documents, ids, add_to_docstore=add_to_docstore)
+        if self.parent_splitter is not None:
+            documents = self.parent_splitter.split_documents(documents)
+        if ids is None:
+            if not add_to_docstore:
+                raise ValueError("If IDs are not passed in, `add_to_docstore` MUST be True")
+            ids = [str(uuid.uuid4()) for _ in documents]
+        elif len(documents) != len(ids):
+            raise ValueError("Got uneven list of documents and ids.")
+
+        docs = []
+        for doc_id, sub_docs in zip(ids, self.child_splitter.iter_split_documents(documents)):
+            for sub_doc in sub_docs:
+                if self.child_metadata_fields is not None:
+                    sub_doc.metadata = {k: sub_doc.metadata[k] for k in self.child_metadata_fields}
+                sub_doc.metadata[self.id_key] = doc_id
+            docs.extend(sub_docs)
+        return docs, list(zip(ids, documents))
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None,
+                      add_to_docstore: bool = True, **kwargs: Any) -> None:
+        if self.registry is None:
+            return super().add_documents(documents, ids=ids, add_to_docstore=add_to_docstore, **kwargs)
+
+        docs, full_docs = self._split_docs_for_adding(documents, ids, add_to_docstore=add_to_docstore)
+        child_ids = [str(uuid.uuid4()) for _ in docs]
+        # Correspondance enregistrée AVANT l'écriture : une entrée sans document est inoffensive,
+        # un document sans entrée ne pourrait plus être supprimé
+        self.registry.record(
+            [(doc_id, doc.metadata.get("source", "")) for doc_id, doc in full_docs],
+            [(child_id, doc.metadata[self.id_key]) for child_id, doc in zip(child_ids, docs)],
         )
+        self.vectorstore.add_documents(docs, ids=child_ids, **kwargs)
+        if add_to_docstore:
+            self.docstore.mset(full_docs)
+
+    def _search_kwargs(self) -> Dict[str, Any]:
+        search_kwargs = dict(self.search_kwargs)
+        where = get_retrieval_filter()
+        if where:
+            search_kwargs["filter"] = where
+        search_kwargs["k"] = get_degradation().scale_k(search_kwargs.get("k", 4))
+        return search_kwargs
+
+    def _parent_ids(self, sub_docs: List[Document]) -> List[str]:
+        ids = []
+        for d in sub_docs:
+            if self.id_key in d.metadata and d.metadata[self.id_key] not in ids:
+                ids.append(d.metadata[self.id_key])
+        return ids
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        search_kwargs = self._search_kwargs()
+        if self.search_type == SearchType.mmr:
+            sub_docs = self.vectorstore.max_marginal_relevance_search(query, **search_kwargs)
+        else:
+            sub_docs = self.vectorstore.similarity_search(query, **search_kwargs)
+
+        docs = self.docstore.mget(self._parent_ids(sub_docs))
+        return [d for d in docs if d is not None]
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        search_kwargs = self._search_kwargs()
+        if self.search_type == SearchType.mmr:
+            sub_docs = await run_in("io", self.vectorstore.max_marginal_relevance_search, query, **search_kwargs)
+        else:
+            sub_docs = await asimilarity_search(self.vectorstore, query, **search_kwargs)
+
+        docs = await amget(self.docstore, self._parent_ids(sub_docs))
+        return [d for d in docs if d is not None]
+
+class FilteredBM25Retriever(BM25Retriever):
+    """
+    BM25Retriever qui restreint les candidats au filtre de la requête AVANT le calcul des scores.
+    
+    Seuls les documents retenus par les postings de métadonnées sont scorés (`get_batch_scores`),
+    le coût est donc proportionnel à la sélectivité du filtre.
+    """
+    filter_fields: List[str] = list(METADATA_FILTER_FIELDS)
+    _postings: Optional[MetadataPostings] = PrivateAttr(default=None)
+    _metadatas: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+    _loaded_mtime: float = PrivateAttr(default=0.0)
+
+    def _get_postings(self) -> MetadataPostings:
+        # Construits une seule fois (les documents ne changent pas : un upload remplace le retriever)
+        if self._postings is None:
+            postings = MetadataPostings(self.filter_fields)
+            for row, doc in enumerate(self.docs):
+                postings.add(row, doc.metadata)
+            self._metadatas = [doc.metadata for doc in self.docs]
+            self._postings = postings
+        return self._postings
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if not self.docs:
+            return []
+        k = get_degradation().scale_k(self.k)
+        processed_query = self.preprocess_func(query)
+        where = get_retrieval_filter()
+        if not where:
+            return self.vectorizer.get_top_n(processed_query, self.docs, n=k)
+
+        mask = self._get_postings().mask(where, self._metadatas)
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return []
+
+        scores = np.asarray(self.vectorizer.get_batch_scores(processed_query, rows.tolist()))
+        top = np.argsort(-scores)[:k]
+        return [self.docs[rows[i]] for i in top]
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # Scoring rank_bm25 en Python pur : hors de la boucle d'événements
+        return await run_in("cpu", self._get_relevant_documents, query, run_manager=run_manager.get_sync())
+
+class RankTrackingEnsembleRetriever(EnsembleRetriever):
+    """
+    EnsembleRetriever qui conserve, pour chaque document fusionné, son rang dans chaque recherche
+    (`retrieval_ranks`) et son score de fusion RRF (`fusion_score`).
     
-    def split_text(self, text: str) -> List[str]:
-        """Découpe le texte en utilisant SemanticChunker."""
-        # SemanticChunker travaille avec des Documents, on crée un doc temporaire
-        docs = self._semantic_chunker.create_documents([text])
-        return [doc.page_content for doc in docs]
+    Ces signaux bon marché permettent au reranking en cascade d'accepter directement les
+    documents sur lesquels BM25 et le vectoriel sont d'accord.
+    Les documents retournés sont des copies : les documents gardés en mémoire par BM25 ne sont pas modifiés.
+    """
+    leg_names: List[str] = ["bm25", "dense"]
+
+    def weighted_reciprocal_rank(self, doc_lists: List[List[Document]]) -> List[Document]:
+        fused = super().weighted_reciprocal_rank(doc_lists)
+
+        def key(doc):
+            return doc.page_content if self.id_key is None else doc.metadata[self.id_key]
+
+        ranks = {}
+        scores = {}
+        for name, weight, docs in zip(self.leg_names, self.weights, doc_lists):
+            for rank, doc in enumerate(docs, start=1):
+                ranks.setdefault(key(doc), {}).setdefault(name, rank)
+                scores[key(doc)] = scores.get(key(doc), 0.0) + weight / (rank + self.c)
+
+        return [
+            Document(
+                page_content=doc.page_content,
+                metadata={**doc.metadata, "retrieval_ranks": ranks.get(key(doc), {}), "fusion_score": scores.get(key(doc), 0.0)},
+                id=doc.id,
+            )
+            for doc in fused
+        ]
+
+class DeadlineAwareCompressionRetriever(ContextualCompressionRetriever):
+    """
+    ContextualCompressionRetriever dont le reranking peut être sauté quand le délai
+    de la requête est trop court (voir rag_engine/admission.py).
+    Les candidats sont alors renvoyés dans l'ordre de la fusion, tronqués à SEARCH_K.
+    """
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        degradation = get_degradation()
+        if not degradation.skip_rerank:
+            return super()._get_relevant_documents(query, run_manager=run_manager)
+        docs = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return docs[:degradation.scale_k(SEARCH_K)]
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        degradation = get_degradation()
+        if not degradation.skip_rerank:
+            return await super()._aget_relevant_documents(query, run_manager=run_manager)
+        docs = await self.base_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return docs[:degradation.scale_k(SEARCH_K)]
 
 class ChildRerankingRetriever(BaseRetriever):
     """
@@ -52,19 +228,40 @@ class ChildRerankingRetriever(BaseRetriever):
     parent_retriever: ParentDocumentRetriever
     compressor: Any # BgeRerankCompressor
     
+    def _search_kwargs(self) -> Dict[str, Any]:
+        search_kwargs = {"k": self.parent_retriever.search_kwargs.get("k", 4)}
+        where = get_retrieval_filter()
+        if where:
+            search_kwargs["filter"] = where
+        return search_kwargs
+
     def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
         # 1. Récupérer les enfants (candidats)
-        search_kwargs = self.parent_retriever.search_kwargs
-        k = search_kwargs.get("k", 4)
-        
-        children = self.parent_retriever.vectorstore.similarity_search(query, k=k)
+        children = self.parent_retriever.vectorstore.similarity_search(query, **self._search_kwargs())
         
         # 2. Reranking des enfants (avec filtrage par score)
         if not children:
             return []
             
         reranked_children = self.compressor.compress_documents(children, query)
-        
+        parent_ids, parent_best_scores = self._best_parents(reranked_children)
+        if not parent_ids:
+            return []
+        return self._with_scores(self.parent_retriever.docstore.mget(parent_ids), parent_ids, parent_best_scores)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        children = await asimilarity_search(self.parent_retriever.vectorstore, query, **self._search_kwargs())
+        if not children:
+            return []
+        reranked_children = await self.compressor.acompress_documents(children, query)
+        parent_ids, parent_best_scores = self._best_parents(reranked_children)
+        if not parent_ids:
+            return []
+        parents = await amget(self.parent_retriever.docstore, parent_ids)
+        return self._with_scores(parents, parent_ids, parent_best_scores)
+
+    def _best_parents(self, reranked_children: List[Document]):
         # 3. Récupération des parents uniques avec le meilleur score enfant
         parent_ids = []
         parent_best_scores = {}  # Garde le meilleur score pour chaque parent
@@ -83,12 +280,10 @@ class ChildRerankingRetriever(BaseRetriever):
                 if doc_id not in seen_ids:
                     parent_ids.append(doc_id)
                     seen_ids.add(doc_id)
-        
-        # 4. Fetch des parents et ajout du score de pertinence
-        if not parent_ids:
-            return []
-            
-        parents = self.parent_retriever.docstore.mget(parent_ids)
+        return parent_ids, parent_best_scores
+
+    def _with_scores(self, parents, parent_ids: List[str], parent_best_scores: Dict[str, float]) -> List[Document]:
+        # 4. Ajout du score de pertinence aux parents
         final_parents = []
         for parent, doc_id in zip(parents, parent_ids):
             if parent is not None:
@@ -98,21 +293,25 @@ class ChildRerankingRetriever(BaseRetriever):
                 
         return final_parents
 
-def get_vectorstore():
+def get_vectorstore(backend: str = VECTOR_BACKEND, collection_name: str = COLLECTION_NAME,
+                    embeddings_cache_dir: str = EMBEDDINGS_CACHE_DIR, index_dir: str = ANN_INDEX_DIR):
     """
-    Récupère ou initialise la base vectorielle Chroma avec Cache d'Embeddings.
+    Récupère ou initialise la base vectorielle (Chroma ou index ANN local) avec Cache d'Embeddings.
     
     Vector Store: Base de données optimisée pour stocker et rechercher des vecteurs (représentations mathématiques du texte).
     Embedding: Processus de conversion d'un texte en un vecteur numérique de dimension fixe, capturant son sens sémantique.
+
+    Les deux backends exposent la même interface `VectorStore` (y compris `filter=` au format
+    `where` de Chroma) et se branchent donc tels quels dans `ParentDocumentRetriever`.
     """
     # 1. Modèle d'embedding de base
-    base_embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    base_embeddings = get_embeddings(EMBEDDING_MODEL)
     
     # 2. Configuration du cache pour les embeddings
-    if not os.path.exists(EMBEDDINGS_CACHE_DIR):
-        os.makedirs(EMBEDDINGS_CACHE_DIR)
+    if not os.path.exists(embeddings_cache_dir):
+        os.makedirs(embeddings_cache_dir)
         
-    store = LocalFileStore(EMBEDDINGS_CACHE_DIR)
+    store = LocalFileStore(embeddings_cache_dir)
     
     cached_embeddings = CacheBackedEmbeddings.from_bytes_store(
         base_embeddings, 
@@ -120,25 +319,57 @@ def get_vectorstore():
         namespace=EMBEDDING_MODEL
     )
     
-    print(f"⚡ Cache d'embeddings activé : {EMBEDDINGS_CACHE_DIR}")
+    print(f"⚡ Cache d'embeddings activé : {embeddings_cache_dir}")
+
+    if backend == "local":
+        return get_local_ann_store(cached_embeddings, index_dir=index_dir, collection_name=collection_name)
 
     return Chroma(
-        collection_name="full_documents",
+        collection_name=collection_name,
         persist_directory=PERSIST_DIR, 
         embedding_function=cached_embeddings
     )
 
-def get_docstore():
+def get_local_ann_store(embeddings, index_dir: str = ANN_INDEX_DIR, collection_name: str = COLLECTION_NAME):
+    """
+    Initialise l'index ANN local (HNSW ou IVF).
+    
+    Au premier démarrage, si une base Chroma existe déjà, ses vecteurs sont importés en masse
+    (sans recalcul des embeddings). Les démarrages suivants rechargent les fichiers en mmap.
+    """
+    ann_kwargs = dict(
+        index_dir=index_dir,
+        index_type=ANN_INDEX_TYPE,
+        M=HNSW_M,
+        ef_construction=HNSW_EF_CONSTRUCTION,
+        ef_search=HNSW_EF_SEARCH,
+        nlist=IVF_NLIST,
+        nprobe=IVF_NPROBE,
+        filter_fields=METADATA_FILTER_FIELDS,
+    )
+    has_index = os.path.exists(os.path.join(index_dir, "meta.json"))
+    has_chroma = os.path.exists(PERSIST_DIR) and os.listdir(PERSIST_DIR)
+
+    if not has_index and has_chroma:
+        try:
+            return LocalANNVectorStore.from_chroma(PERSIST_DIR, collection_name, embeddings, **ann_kwargs)
+        except Exception as e:
+            print(f"⚠️ Import depuis Chroma impossible ({e}), création d'un index vide.")
+
+    print(f"🧭 Index ANN local ({ANN_INDEX_TYPE}) : {index_dir}")
+    return LocalANNVectorStore(embedding=embeddings, **ann_kwargs)
+
+def get_docstore(doc_store_dir: str = DOC_STORE_DIR):
     """
     Récupère ou initialise le stockage des documents parents.
     
     DocStore: Système de stockage persistant (clé-valeur) conservant les documents originaux complets, par opposition aux vecteurs.
     """
-    if not os.path.exists(DOC_STORE_DIR):
-        os.makedirs(DOC_STORE_DIR)
+    if not os.path.exists(doc_store_dir):
+        os.makedirs(doc_store_dir)
     
     # Stockage physique (bytes) sur le disque
-    fs = LocalFileStore(DOC_STORE_DIR)
+    fs = LocalFileStore(doc_store_dir)
     
     # Wrapper pour gérer la sérialisation des Documents (Document -> bytes)
     return EncoderBackedStore(
@@ -161,7 +392,173 @@ def get_all_documents_from_store(docstore):
             docs.append(res)
     return docs
 
-def get_retriever(vectorstore, docstore):
+BM25_CLASSES = (BM25Retriever, ArrayBM25Retriever)
+
+def _use_array_bm25() -> bool:
+    if BM25_BACKEND == "array" and not HAS_SCIPY:
+        print("⚠️ SciPy non disponible. Fallback sur BM25Retriever (rank_bm25).")
+        return False
+    return BM25_BACKEND == "array"
+
+def _iter_docstore_records(docstore, keys, batch_size: int = 1000):
+    """(id, texte, métadonnées) des parents, lus par lots : le corpus n'est jamais entièrement en mémoire."""
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        for key, doc in zip(batch, docstore.mget(batch)):
+            if doc:
+                yield key, doc.page_content, doc.metadata
+
+def _empty_bm25():
+    if _use_array_bm25():
+        return ArrayBM25Retriever.from_records([])
+    return FilteredBM25Retriever(vectorizer=None, docs=[])
+
+def bm25_size(bm25_retriever) -> int:
+    if isinstance(bm25_retriever, ArrayBM25Retriever):
+        return bm25_retriever.num_docs
+    return len(bm25_retriever.docs)
+
+def load_or_build_bm25(docstore, index_path: str = BM25_INDEX_PATH):
+    """
+    Charge l'index BM25 persisté s'il correspond exactement au contenu du docstore
+    (et au moteur configuré), sinon le reconstruit depuis le docstore et le sauvegarde.
+    
+    Évite de désérialiser tous les parents à chaque démarrage.
+    """
+    keys = sorted(docstore.yield_keys())
+    if not keys:
+        return None
+    use_array = _use_array_bm25()
+    expected_class = ArrayBM25Retriever if use_array else FilteredBM25Retriever
+
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, "rb") as f:
+                cached = pickle.load(f)
+            if (cached.get("keys") == keys and isinstance(cached["retriever"], expected_class)
+                    and cached.get("tokenizer") == TOKENIZER_VERSION):
+                print(f"⚡ Index BM25 chargé depuis {index_path}")
+                bm25_retriever = cached["retriever"]
+                if use_array:
+                    bm25_retriever.attach(docstore)
+                bm25_retriever._loaded_mtime = os.path.getmtime(index_path)
+                return bm25_retriever
+        except Exception as e:
+            print(f"⚠️ Index BM25 illisible ({e}), reconstruction...")
+
+    if use_array:
+        bm25_retriever = ArrayBM25Retriever.from_records(_iter_docstore_records(docstore, keys), docstore=docstore)
+    else:
+        docs = [doc for doc in docstore.mget(keys) if doc]
+        bm25_retriever = FilteredBM25Retriever.from_documents(docs)
+    _persist_bm25(bm25_retriever, keys, index_path)
+    return bm25_retriever
+
+def _persist_bm25(bm25_retriever, keys, index_path: str = BM25_INDEX_PATH):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"keys": keys, "retriever": bm25_retriever, "tokenizer": TOKENIZER_VERSION}, f)
+    os.replace(tmp_path, index_path)
+    bm25_retriever._loaded_mtime = os.path.getmtime(index_path)
+
+def _extract_bm25(retriever):
+    """Retourne (ensemble, position) du retriever BM25 dans la structure, ou (None, None)."""
+    if isinstance(retriever, ContextualCompressionRetriever):
+        return _extract_bm25(retriever.base_retriever)
+    if isinstance(retriever, EnsembleRetriever):
+        for i, r in enumerate(retriever.retrievers):
+            if isinstance(r, BM25_CLASSES):
+                return retriever, i
+    return None, None
+
+def _swap_bm25(ensemble, position, bm25_retriever):
+    bm25_retriever.k = ensemble.retrievers[position].k
+    ensemble.retrievers[position] = bm25_retriever
+
+def refresh_bm25(retriever, full: bool = False):
+    """
+    Met à jour l'index BM25 après une modification du docstore (upload, suppression...) et le persiste,
+    pour que les autres workers puissent le recharger via `sync_bm25`.
+
+    Avec le moteur "array", seuls les parents ajoutés sont lus et tokenisés (les ids sont uniques :
+    un parent modifié est supprimé puis ré-ajouté). `full=True` reconstruit tout l'index, pour une
+    modification en place des parents (migration de métadonnées).
+    """
+    ensemble, position = _extract_bm25(retriever)
+    parent_retriever = _extract_parent_retriever(retriever)
+    if parent_retriever is None:
+        return
+    index_path = getattr(parent_retriever, "bm25_index_path", BM25_INDEX_PATH)
+    current = ensemble.retrievers[position] if ensemble is not None else None
+    if not full and isinstance(current, ArrayBM25Retriever) and current.can_update and _use_array_bm25():
+        docstore = parent_retriever.docstore
+        keys = sorted(docstore.yield_keys())
+        if keys:
+            known = set(current._doc_ids)
+            live = set(keys)
+            added = [key for key in keys if key not in known]
+            bm25_retriever = current.updated(_iter_docstore_records(docstore, added),
+                                             [doc_id for doc_id in current._doc_ids if doc_id not in live])
+            _persist_bm25(bm25_retriever, keys, index_path)
+            _swap_bm25(ensemble, position, bm25_retriever)
+            return
+    if full and os.path.exists(index_path):
+        # Les clés n'ont pas changé : l'index persisté serait rechargé tel quel
+        os.remove(index_path)
+    bm25_retriever = load_or_build_bm25(parent_retriever.docstore, index_path)
+    if bm25_retriever is None:
+        if ensemble is not None:
+            # Dernier document supprimé : index vide, persisté pour les autres workers
+            bm25_retriever = _empty_bm25()
+            _persist_bm25(bm25_retriever, [], index_path)
+            _swap_bm25(ensemble, position, bm25_retriever)
+        return
+    if ensemble is None:
+        # Premier document indexé : l'hybride sera activé au prochain chargement du retriever
+        return
+    _swap_bm25(ensemble, position, bm25_retriever)
+
+def _bm25_is_stale(retriever, index_path: Optional[str] = None) -> bool:
+    ensemble, position = _extract_bm25(retriever)
+    if index_path is None:
+        index_path = getattr(_extract_parent_retriever(retriever), "bm25_index_path", BM25_INDEX_PATH)
+    if ensemble is None or not os.path.exists(index_path):
+        return False
+    return os.path.getmtime(index_path) > ensemble.retrievers[position]._loaded_mtime
+
+def sync_bm25(retriever, index_path: Optional[str] = None):
+    """
+    Recharge l'index BM25 si un autre worker l'a mis à jour sur disque (déploiement multi-workers).
+    Coût : un simple `stat` quand rien n'a changé.
+    """
+    if not _bm25_is_stale(retriever, index_path):
+        return
+    ensemble, position = _extract_bm25(retriever)
+    parent_retriever = _extract_parent_retriever(retriever)
+    if index_path is None:
+        index_path = getattr(parent_retriever, "bm25_index_path", BM25_INDEX_PATH)
+    with open(index_path, "rb") as f:
+        bm25_retriever = pickle.load(f)["retriever"]
+    if isinstance(bm25_retriever, ArrayBM25Retriever):
+        bm25_retriever.attach(parent_retriever.docstore)
+    bm25_retriever._loaded_mtime = os.path.getmtime(index_path)
+    _swap_bm25(ensemble, position, bm25_retriever)
+    print("🔄 Index BM25 rechargé (mis à jour par un autre worker)")
+
+# Un seul rechargement par index quand plusieurs requêtes voient le même fichier modifié
+_bm25_reloads = SingleFlight()
+
+async def async_sync_bm25(retriever, index_path: Optional[str] = None):
+    """
+    `sync_bm25` pour la boucle d'événements : seul le `stat` y reste, la désérialisation
+    de l'index (pickle de tout le corpus) passe dans l'executor "io".
+    """
+    if not _bm25_is_stale(retriever, index_path):
+        return
+    key = index_path or getattr(_extract_parent_retriever(retriever), "bm25_index_path", BM25_INDEX_PATH)
+    await _bm25_reloads.run(key, lambda: run_in("io", sync_bm25, retriever, index_path))
+
+def get_retriever(vectorstore, docstore, registry=None, bm25_index_path: str = BM25_INDEX_PATH, compressor=None):
     """
     Retourne le retriever final avec architecture optimisée:
     
@@ -172,47 +569,57 @@ def get_retriever(vectorstore, docstore):
     - Les recherches par mot-clé (ex: "eytan") sont bien prises en compte par BM25
     - Les recherches sémantiques sont gérées par le vectoriel
     - Le reranker filtre les résultats non pertinents APRÈS la fusion
+
+    `registry`, `bm25_index_path` et `compressor` permettent de construire le retriever d'un
+    namespace en partageant le reranker déjà chargé (voir rag_engine/namespaces.py).
     """
     # 1. Configuration du ParentDocumentRetriever (Base Vectorielle)
-    base_embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    base_embeddings = get_embeddings(EMBEDDING_MODEL)
     child_splitter = SemanticTextSplitter(
         embeddings=base_embeddings,
         breakpoint_threshold_type="percentile",
         breakpoint_threshold_amount=SEMANTIC_CHUNKER_THRESHOLD
     )
 
-    parent_retriever = ParentDocumentRetriever(
+    parent_retriever = FilteredParentDocumentRetriever(
         vectorstore=vectorstore,
         docstore=docstore,
         child_splitter=child_splitter,
-        search_kwargs={"k": SEARCH_K * 3}  # On récupère plus de candidats pour le reranking final
+        search_kwargs={"k": SEARCH_K * 3},  # On récupère plus de candidats pour le reranking final
+        registry=registry or get_registry(),
+        bm25_index_path=bm25_index_path
     )
 
     # 2. Construction du retriever de base (vectoriel ou hybride)
     base_retriever = parent_retriever
     
     if USE_HYBRID_SEARCH:
-        existing_docs = get_all_documents_from_store(docstore)
+        bm25_retriever = load_or_build_bm25(docstore, bm25_index_path)
         
-        if existing_docs:
-            print(f"🔀 Activation de la Recherche Hybride (BM25 + Vector) - {len(existing_docs)} documents")
-            bm25_retriever = BM25Retriever.from_documents(existing_docs)
+        if bm25_retriever is not None:
+            print(f"🔀 Activation de la Recherche Hybride (BM25 + Vector) - {bm25_size(bm25_retriever)} documents")
             bm25_retriever.k = SEARCH_K * 2  # Plus de candidats BM25
             
             # Ensemble: BM25 (40%) + Vectoriel (60%)
-            base_retriever = EnsembleRetriever(
+            base_retriever = RankTrackingEnsembleRetriever(
                 retrievers=[bm25_retriever, parent_retriever],
-                weights=[0.4, 0.6]  # BM25 renforcé pour les recherches par mot-clé
+                weights=[0.4, 0.6],  # BM25 renforcé pour les recherches par mot-clé
+                leg_names=["bm25", "dense"]
             )
         else:
             print("⚠️ Pas de documents pour BM25, retour au vectoriel seul.")
 
     # 3. Application du Reranker SUR LE RÉSULTAT FINAL (filtrage + réordonnancement)
     if USE_RERANKER:
-        print(f"✨ Activation du Reranker BGE FINAL (Top {SEARCH_K}, seuil: {MIN_RELEVANCE_SCORE})")
-        compressor = BgeRerankCompressor(top_n=SEARCH_K)
+        # Un reranker déjà chargé peut être fourni (partagé entre namespaces)
+        if compressor is None and USE_RERANK_CASCADE:
+            print(f"✨ Activation du Reranker en cascade FINAL (Top {SEARCH_K}, seuil: {MIN_RELEVANCE_SCORE})")
+            compressor = CascadeRerankCompressor(top_n=SEARCH_K)
+        elif compressor is None:
+            print(f"✨ Activation du Reranker BGE FINAL (Top {SEARCH_K}, seuil: {MIN_RELEVANCE_SCORE})")
+            compressor = BgeRerankCompressor(top_n=SEARCH_K)
         
-        final_retriever = ContextualCompressionRetriever(
+        final_retriever = DeadlineAwareCompressionRetriever(
             base_compressor=compressor,
             base_retriever=base_retriever
         )
@@ -248,6 +655,21 @@ def _extract_parent_retriever(retriever):
     return None
 
 
+def _extract_compressor(retriever):
+    """Extrait le compresseur (reranker) final, s'il existe."""
+    if isinstance(retriever, ContextualCompressionRetriever):
+        return retriever.base_compressor
+    return None
+
+
+def get_rerank_stats(retriever):
+    """Statistiques du reranker (répartition par étage pour la cascade), ou None."""
+    compressor = _extract_compressor(retriever)
+    if compressor is not None and hasattr(compressor, "get_stats"):
+        return compressor.get_stats()
+    return None
+
+
 def index_documents(retriever, documents):
     """
     Indexe les documents dans le ParentDocumentRetriever.
@@ -266,18 +688,20 @@ def index_documents(retriever, documents):
     batch_size = 100
     total_batches = (len(documents) + batch_size - 1) // batch_size
     
-    for i in range(0, len(documents), batch_size):
-        batch = documents[i:i + batch_size]
-        batch_num = i // batch_size + 1
-        batch_start = time.time()
-        
-        print(f"   ↳ Indexation du lot {batch_num}/{total_batches} ({len(batch)} documents)...")
-        parent_retriever.add_documents(batch, ids=None)
-        
-        batch_end = time.time()
-        elapsed = batch_end - start_time
-        eta = (elapsed / batch_num) * (total_batches - batch_num)
-        print(f"   ↳ Lot {batch_num} terminé en {batch_end - batch_start:.2f}s. Temps écoulé: {elapsed:.2f}s, ETA: {eta:.2f}s")
+    # Index ANN local : écrit sur disque une seule fois pour tout le job
+    with deferred_persist(parent_retriever.vectorstore):
+        for i in range(0, len(documents), batch_size):
+            batch = documents[i:i + batch_size]
+            batch_num = i // batch_size + 1
+            batch_start = time.time()
+            
+            print(f"   ↳ Indexation du lot {batch_num}/{total_batches} ({len(batch)} documents)...")
+            parent_retriever.add_documents(batch, ids=None)
+            
+            batch_end = time.time()
+            elapsed = batch_end - start_time
+            eta = (elapsed / batch_num) * (total_batches - batch_num)
+            print(f"   ↳ Lot {batch_num} terminé en {batch_end - batch_start:.2f}s. Temps écoulé: {elapsed:.2f}s, ETA: {eta:.2f}s")
 
     total_time = time.time() - start_time
     print(f"✅ Indexation terminée en {total_time:.2f}s.")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -7,12 +7,27 @@ class ChatRequest(BaseModel):
     question: str
     history: List[dict] = [] # Liste de {"role": "user"|"assistant", "content": "..."}
     session_id: Optional[int] = None
+    # Filtres optionnels pour restreindre la recherche
+    sources: Optional[List[str]] = None # Noms de fichiers (ex: ["contrat.pdf"])
+    header_path_prefix: Optional[str] = None # Préfixe de chemin de titres (ex: "Contrat > Article 4")
+    deadline_ms: Optional[int] = Field(default=None, gt=0) # Délai de la requête (défaut : CHAT_DEADLINE_S)
+    namespaces: Optional[List[str]] = None # Corpus interrogés en parallèle (défaut : namespace par défaut)
 
 # Modèle de données pour la réponse
 class ChatResponse(BaseModel):
     answer: str
     context: List[str] = []
     session_id: int
+    degradations: List[str] = [] # Étapes sautées pour tenir le délai (ex: "skipped_rerank")
+
+# Modèle de données pour une requête par lots (évaluation, rapports)
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    sources: Optional[List[str]] = None
+    header_path_prefix: Optional[str] = None
+    namespaces: Optional[List[str]] = None # Corpus interrogés (défaut : namespace par défaut)
+    persist: bool = False # Enregistrer chaque question/réponse comme une session de chat
+    max_concurrency: Optional[int] = None # Appels LLM simultanés (défaut : BATCH_LLM_CONCURRENCY)
 
 # Modèle pour une session de chat (liste)
 class ChatSessionSchema(BaseModel):
@@ -0,0 +1,31 @@
+import asyncio
+
+from rag_engine.admission import AdmissionController
+
+
+def test_background_yields_to_waiting_requests():
+    admission = AdmissionController(max_concurrency=1, max_queue=4)
+    order = []
+
+    async def interactive(name: str, hold: float):
+        async with admission.admit():
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def background():
+        async with admission.admit_background():
+            order.append("lot")
+
+    async def scenario():
+        first = asyncio.ensure_future(interactive("chat 1", 0.1))
+        await asyncio.sleep(0.01)
+        # Le lot arrive avant la deuxième requête interactive, mais passe après elle
+        batch = asyncio.ensure_future(background())
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(interactive("chat 2", 0.1))
+        await asyncio.gather(first, batch, second)
+
+    asyncio.run(scenario())
+    assert order == ["chat 1", "chat 2", "lot"]
+    stats = admission.get_stats()
+    assert stats["background_admitted"] == 1 and stats["running"] == 0
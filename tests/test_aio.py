@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from rag_engine.aio import lag_benchmark, run_in
+
+
+def _blocking_search(query: str):
+    # Recherche synchrone (docstore, modèle) : 20 ms de travail bloquant
+    time.sleep(0.02)
+    return [Document(page_content=query)]
+
+
+class OffloadingRetriever(BaseRetriever):
+    """Le travail bloquant passe par les executors dédiés, comme les retrievers du RAG."""
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return _blocking_search(query)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        return await run_in("io", _blocking_search, query)
+
+
+class BlockingRetriever(OffloadingRetriever):
+    """Régression simulée : le travail bloquant s'exécute dans la boucle."""
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        return _blocking_search(query)
+
+
+QUERIES = [f"préavis {i}" for i in range(60)]
+
+
+def test_offloaded_work_keeps_loop_lag_low():
+    result = asyncio.run(lag_benchmark(OffloadingRetriever(), QUERIES, concurrency=8))
+    assert result["queries"] == 60
+    assert result["loop_lag_p99_ms"] < 25
+
+
+def test_monitor_detects_blocking_work_in_the_loop():
+    result = asyncio.run(lag_benchmark(BlockingRetriever(), QUERIES, concurrency=8))
+    assert result["loop_lag_max_ms"] >= 50
@@ -0,0 +1,114 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from rag_engine.ann_store import LocalANNVectorStore
+
+
+def _texts(n):
+    return [f"clause {i} du contrat de bail" for i in range(n)]
+
+
+def _metadatas(n):
+    return [{"source": f"/data/doc{i % 5}.pdf"} for i in range(n)]
+
+
+def _exact_ids(store, query, k, source=None):
+    embedding = store.embeddings
+    vectors = np.asarray(embedding.embed_documents(store._texts), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = np.asarray(embedding.embed_query(query), dtype=np.float32)
+    q /= np.linalg.norm(q)
+    rows = [
+        r for r in range(len(store._ids))
+        if not store._deleted[r] and (source is None or store._metadatas[r]["source"] == source)
+    ]
+    rows.sort(key=lambda r: -float(vectors[r] @ q))
+    return [store._ids[r] for r in rows[:k]]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalANNVectorStore(DeterministicFakeEmbedding(size=16), str(tmp_path / "ann"), index_type="ivf")
+
+
+def test_add_then_search_matches_exact_search(store):
+    store.add_texts(_texts(40), _metadatas(40), ids=[f"id{i}" for i in range(40)])
+    results = store.similarity_search("résiliation du bail", k=5)
+    assert [d.id for d in results] == _exact_ids(store, "résiliation du bail", 5)
+
+    filtered = store.similarity_search("résiliation du bail", k=3, filter={"source": "/data/doc2.pdf"})
+    assert [d.id for d in filtered] == _exact_ids(store, "résiliation du bail", 3, "/data/doc2.pdf")
+
+
+def test_filtered_hnsw_search_falls_back_to_exact(tmp_path):
+    pytest.importorskip("hnswlib")
+    store = LocalANNVectorStore(
+        DeterministicFakeEmbedding(size=16), str(tmp_path / "ann"), index_type="hnsw", brute_force_threshold=0,
+    )
+    metadatas = [{"source": "/data/rare.pdf" if i < 2 else "/data/common.pdf"} for i in range(60)]
+    store.add_texts(_texts(60), metadatas, ids=[f"id{i}" for i in range(60)])
+
+    # Seules 2 lignes passent le filtre alors que k=5 : le graphe ne peut pas remplir le résultat
+    results = store.similarity_search("bail", k=5, filter={"source": "/data/rare.pdf"})
+    assert [d.id for d in results] == _exact_ids(store, "bail", 5, "/data/rare.pdf")
+    assert {d.id for d in results} == {"id0", "id1"}
+
+
+def test_delete_then_compact_keeps_remaining_ids(store):
+    ids = [f"id{i}" for i in range(30)]
+    store.add_texts(_texts(30), _metadatas(30), ids=ids)
+    store.delete(ids[:10])
+
+    assert store.compact() == 10
+    assert [doc_id for doc_id, _, _ in store.iter_records()] == ids[10:]
+    assert [d.id for d in store.get_by_ids(ids)] == ids[10:]
+    results = store.similarity_search("bail", k=30)
+    assert {d.id for d in results} == set(ids[10:])
+
+
+def test_persist_reload_round_trip(tmp_path):
+    index_dir = str(tmp_path / "ann")
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalANNVectorStore(embedding, index_dir, index_type="ivf")
+    store.add_texts(_texts(20), _metadatas(20), ids=[f"id{i}" for i in range(20)])
+    store.add_texts(["clause ajoutée"], [{"source": "/data/new.pdf"}], ids=["new"])
+    store.delete(["id3"])
+
+    reloaded = LocalANNVectorStore(embedding, index_dir, index_type="ivf")
+    assert len(reloaded) == 20
+    assert list(reloaded.iter_records()) == list(store.iter_records())
+    assert [d.id for d in reloaded.similarity_search("bail", k=4)] == [
+        d.id for d in store.similarity_search("bail", k=4)
+    ]
+    assert [d.id for d in reloaded.similarity_search("bail", filter={"source": "/data/new.pdf"})] == ["new"]
+
+
+def test_persist_appends_instead_of_rewriting(tmp_path):
+    index_dir = str(tmp_path / "ann")
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalANNVectorStore(embedding, index_dir, index_type="ivf")
+    store.add_texts(_texts(10), _metadatas(10), ids=[f"id{i}" for i in range(10)])
+    records_mtime = os.stat(os.path.join(index_dir, "records.json")).st_mtime_ns
+
+    store.add_texts(["clause ajoutée"], [{"source": "/data/new.pdf"}], ids=["new"])
+    assert os.stat(os.path.join(index_dir, "records.json")).st_mtime_ns == records_mtime
+    with open(os.path.join(index_dir, "records_appended.jsonl"), encoding="utf-8") as f:
+        assert [json.loads(line)["id"] for line in f] == ["new"]
+    assert np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r").shape == (11, 16)
+
+    # Une ligne de journal tronquée (écriture interrompue) est ignorée au rechargement
+    with open(os.path.join(index_dir, "records_appended.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"id": "partiel"')
+    reloaded = LocalANNVectorStore(embedding, index_dir, index_type="ivf")
+    assert len(reloaded) == 11
+    assert reloaded.get_by_ids(["new"])[0].page_content == "clause ajoutée"
+
+    # `compact` réécrit tout et repart d'un journal vide
+    reloaded.delete(["id0"])
+    reloaded.compact()
+    assert not os.path.exists(os.path.join(index_dir, "records_appended.jsonl"))
+    assert len(LocalANNVectorStore(embedding, index_dir, index_type="ivf")) == 10
@@ -0,0 +1,163 @@
+import json
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.stores import InMemoryStore
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+pytest.importorskip("scipy")
+pytest.importorskip("langchain_groq")  # Importé par la chaîne RAG
+
+from langchain_classic.retrievers import EnsembleRetriever  # noqa: E402
+
+from config import SEARCH_K  # noqa: E402
+from rag_engine import batch  # noqa: E402
+from rag_engine.ann_store import LocalANNVectorStore  # noqa: E402
+from rag_engine.batch import BatchAnswerer, _dense_search_many  # noqa: E402
+from rag_engine.bm25 import ArrayBM25Retriever  # noqa: E402
+from rag_engine.filters import retrieval_filter  # noqa: E402
+from rag_engine.namespaces import FanOutRetriever  # noqa: E402
+from rag_engine.vector_store import FilteredParentDocumentRetriever  # noqa: E402
+
+EMBEDDING = DeterministicFakeEmbedding(size=16)
+QUESTIONS = ["préavis de résiliation", "montant du loyer", "clause pénale", "dépôt de garantie"]
+
+
+class FakeQAChain:
+    async def ainvoke(self, inputs):
+        if inputs["input"] == "panne":
+            raise RuntimeError("LLM indisponible")
+        return f"Réponse : {inputs['input']} ({len(inputs['context'])} documents)"
+
+
+@pytest.fixture(autouse=True)
+def fake_models(monkeypatch):
+    monkeypatch.setattr(batch, "get_embeddings", lambda model_name: EMBEDDING)
+    monkeypatch.setattr(batch, "create_llm", lambda: None)
+    monkeypatch.setattr(batch, "create_qa_chain", lambda llm: FakeQAChain())
+
+
+def _hybrid_retriever(index_dir, prefix):
+    parent = FilteredParentDocumentRetriever(
+        vectorstore=LocalANNVectorStore(EMBEDDING, str(index_dir), index_type="ivf"),
+        docstore=InMemoryStore(),
+        child_splitter=RecursiveCharacterTextSplitter(chunk_size=60, chunk_overlap=0),
+        search_kwargs={"k": 6},
+    )
+    topics = ["préavis de résiliation du bail", "montant du loyer mensuel", "clause pénale en cas de retard",
+              "dépôt de garantie restitué", "entretien des parties communes"]
+    parent.add_documents([
+        Document(page_content=f"{prefix} {i} : {topics[i % len(topics)]}, article {i}",
+                 metadata={"source": f"/data/{prefix}{i % 2}.pdf"})
+        for i in range(20)
+    ])
+    keys = sorted(parent.docstore.yield_keys())
+    bm25 = ArrayBM25Retriever.from_records(
+        ((key, doc.page_content, doc.metadata) for key, doc in zip(keys, parent.docstore.mget(keys))),
+        docstore=parent.docstore, k=4,
+    )
+    return EnsembleRetriever(retrievers=[bm25, parent], weights=[0.5, 0.5])
+
+
+def _contents(lists):
+    return [[doc.page_content for doc in docs] for docs in lists]
+
+
+def test_retrieve_many_matches_one_query_at_a_time(tmp_path):
+    retriever = _hybrid_retriever(tmp_path / "ann", "bail")
+    answerer = BatchAnswerer(retriever)
+
+    expected = [retriever.invoke(q)[:SEARCH_K] for q in QUESTIONS]
+    assert _contents(answerer.retrieve_many(QUESTIONS)) == _contents(expected)
+
+    where = {"source": "/data/bail1.pdf"}
+    with retrieval_filter(where):
+        expected = [retriever.invoke(q)[:SEARCH_K] for q in QUESTIONS]
+    results = answerer.retrieve_many(QUESTIONS, where)
+    assert _contents(results) == _contents(expected)
+    assert all(doc.metadata["source"] == "/data/bail1.pdf" for docs in results for doc in docs)
+
+
+def test_bm25_invoke_many_matches_invoke(tmp_path):
+    bm25 = _hybrid_retriever(tmp_path / "ann", "bail").retrievers[0]
+    assert _contents(bm25.invoke_many(QUESTIONS)) == _contents([bm25.invoke(q) for q in QUESTIONS])
+    with retrieval_filter({"source": "/data/bail0.pdf"}):
+        assert _contents(bm25.invoke_many(QUESTIONS)) == _contents([bm25.invoke(q) for q in QUESTIONS])
+
+
+def test_dense_search_uses_public_api_without_batched_search():
+    class SingleVectorStore:
+        def __init__(self):
+            self.calls = []
+
+        def similarity_search_by_vector(self, embedding, k=4, filter=None):
+            self.calls.append((embedding, k, filter))
+            return [Document(page_content=f"résultat {len(self.calls)}")]
+
+    store = SingleVectorStore()
+    results = _dense_search_many(store, [[1.0], [2.0]], 3, {"source": "a.pdf"})
+    assert _contents(results) == [["résultat 1"], ["résultat 2"]]
+    assert store.calls == [([1.0], 3, {"source": "a.pdf"}), ([2.0], 3, {"source": "a.pdf"})]
+
+
+def test_retrieve_many_merges_namespaces(tmp_path):
+    retrievers = [_hybrid_retriever(tmp_path / "rh", "rh"), _hybrid_retriever(tmp_path / "jur", "jur")]
+    fanout = FanOutRetriever(retrievers=retrievers, names=["rh", "juridique"])
+    answerer = BatchAnswerer(fanout)
+    assert answerer.retrievers == retrievers
+
+    per_namespace = [BatchAnswerer(r).retrieve_many(QUESTIONS) for r in retrievers]
+    expected = [fanout._merge([results[i] for results in per_namespace]) for i in range(len(QUESTIONS))]
+    results = answerer.retrieve_many(QUESTIONS)
+    assert _contents(results) == _contents(expected)
+    assert {doc.metadata["namespace"] for docs in results for doc in docs} == {"rh", "juridique"}
+
+
+def test_cli_writes_one_ndjson_line_per_question(tmp_path, monkeypatch):
+    from rag_engine import service
+
+    retriever = _hybrid_retriever(tmp_path / "ann", "bail")
+    monkeypatch.setattr(service, "setup_rag_system", lambda: (None, retriever))
+    questions_path, output_path = tmp_path / "questions.txt", tmp_path / "reponses.ndjson"
+    questions_path.write_text("\n".join(QUESTIONS + ["panne"]) + "\n", encoding="utf-8")
+    monkeypatch.setattr("sys.argv", ["batch", str(questions_path), str(output_path)])
+
+    batch.main()
+
+    lines = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert sorted(line["index"] for line in lines) == list(range(len(QUESTIONS) + 1))
+    by_question = {line["question"]: line for line in lines}
+    assert by_question["panne"]["error"] == "LLM indisponible" and "answer" not in by_question["panne"]
+    for question in QUESTIONS:
+        line = by_question[question]
+        assert line["answer"].startswith(f"Réponse : {question}")
+        assert len(line["context"]) == len(line["sources"]) > 0
+
+
+def test_chat_batch_endpoint_streams_ndjson_and_resolves_namespaces(tmp_path, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    os.environ.setdefault("DATABASE_URL", "sqlite://")  # database.py crée son moteur à l'import
+    from fastapi.testclient import TestClient
+
+    import main
+    from rag_engine.namespaces import NamespaceManager
+
+    retriever = _hybrid_retriever(tmp_path / "ann", "bail")
+    monkeypatch.setattr(main, "rag_system", object())
+    monkeypatch.setattr(main, "retriever", retriever)
+    monkeypatch.setattr(main, "namespace_manager", NamespaceManager(retriever, None))
+    monkeypatch.setattr(main, "batch_answerers", {})
+    client = TestClient(main.app)
+
+    response = client.post("/chat/batch", json={"questions": QUESTIONS, "namespaces": ["default"]})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == list(range(len(QUESTIONS)))
+    assert all(line["answer"].startswith("Réponse : ") for line in lines)
+
+    response = client.post("/chat/batch", json={"questions": QUESTIONS, "namespaces": ["inexistant"]})
+    assert response.status_code == 404
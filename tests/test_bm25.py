@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+from rag_engine.bm25 import ArrayBM25Retriever, tokenize
+from rag_engine.filters import retrieval_filter
+
+
+def _records(start: int, stop: int):
+    return [(f"p{i}", f"contrat {i} clause de résiliation préavis {'loyer' * (i % 3)}", {"source": f"/data/doc{i % 2}.pdf"})
+            for i in range(start, stop)]
+
+
+def test_incremental_update_matches_full_rebuild():
+    index = ArrayBM25Retriever.from_records(_records(0, 30))
+    removed = ["p3", "p10", "p29"]
+    updated = index.updated(_records(30, 45), removed)
+
+    expected = ArrayBM25Retriever.from_records([r for r in _records(0, 45) if r[0] not in removed])
+    assert updated._doc_ids == expected._doc_ids
+    assert updated._metadatas == expected._metadatas
+    for query in ("résiliation", "loyer préavis", "contrat 31"):
+        assert np.allclose(updated.score(query), expected.score(query))
+    # L'index d'origine est intact (requêtes en cours)
+    assert index.num_docs == 30
+
+
+def test_index_pickled_without_raw_frequencies_is_not_updatable():
+    index = ArrayBM25Retriever.from_records(_records(0, 3))
+    state = index.__getstate__()
+    del state["__pydantic_private__"]["_tf"]
+    legacy = ArrayBM25Retriever.__new__(ArrayBM25Retriever)
+    legacy.__setstate__(state)
+    assert not legacy.can_update
+
+
+def test_aux_plurals_match_their_singular():
+    for plural, singular in [("travaux", "travail"), ("journaux", "journal"), ("bureaux", "bureau"),
+                             ("baux", "bail"), ("généraux", "général")]:
+        assert tokenize(plural) == tokenize(singular), plural
+    assert tokenize("contrats") == tokenize("contrat")
+
+
+def test_filtered_top_k_only_returns_allowed_rows():
+    index = ArrayBM25Retriever.from_records(
+        [(f"p{i}", f"clause de résiliation {i}", {"source": "/data/rare.pdf" if i in (4, 17) else "/data/doc.pdf"})
+         for i in range(30)]
+    )
+    unfiltered = dict(index.top_k("résiliation", 30))
+    for k in (1, 5):
+        with retrieval_filter({"source": "/data/doc.pdf"}):
+            top = index.top_k("résiliation", k)
+        assert len(top) == k
+        assert all(index._metadatas[row]["source"] == "/data/doc.pdf" for row, _ in top)
+        assert all(np.isclose(score, unfiltered[row]) for row, score in top)
+
+    # Moins de k lignes passent le filtre : seulement elles, jamais de complément hors filtre
+    with retrieval_filter({"source": "/data/rare.pdf"}):
+        assert [row for row, _ in index.top_k("résiliation", 10)] == [4, 17]
+    with retrieval_filter({"source": "/data/absent.pdf"}):
+        assert index.top_k("résiliation", 10) == []
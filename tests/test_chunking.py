@@ -0,0 +1,61 @@
+import random
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+pytest.importorskip("langchain_experimental")
+
+from rag_engine.chunking import SemanticTextSplitter  # noqa: E402
+
+
+class RecordingEmbeddings(Embeddings):
+    """Vecteurs déterministes (hash du texte) ; garde la taille de chaque appel à l'encodeur."""
+
+    def __init__(self):
+        self._fake = DeterministicFakeEmbedding(size=32)
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return self._fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._fake.embed_query(text)
+
+
+def _parents(count, sentences, seed=0):
+    rng = random.Random(seed)
+    words = ["bail", "loyer", "préavis", "garantie", "clause", "résiliation", "charges", "travaux", "assurance"]
+    return [
+        " ".join(f"{' '.join(rng.choices(words, k=rng.randint(4, 9))).capitalize()} {p}-{s}."
+                 for s in range(sentences))
+        for p in range(count)
+    ]
+
+
+def _split(texts, **kwargs):
+    embeddings = RecordingEmbeddings()
+    splitter = SemanticTextSplitter(embeddings, breakpoint_threshold_amount=70, child_target_chars=0, **kwargs)
+    return list(splitter.iter_split_texts(texts)), embeddings.calls
+
+
+def test_batched_matches_semantic_chunker():
+    texts = _parents(8, 12) + ["Une seule phrase."] + _parents(3, 2, seed=1)
+    legacy, legacy_calls = _split(texts, batched=False)
+    batched, batched_calls = _split(texts, batched=True, embed_batch_size=1000)
+
+    assert batched == legacy
+    assert any(len(chunks) > 1 for chunks in legacy)
+    # Un appel par parent (sauf la phrase unique) contre un seul pour tout le lot
+    assert len(legacy_calls) == len(texts) - 1 and batched_calls == [sum(legacy_calls)]
+
+
+def test_batch_boundary_inside_a_parent():
+    # 10 phrases par parent, lots d'au moins 15 : la limite tombe au milieu du 2e, du 4e... parent
+    texts = _parents(5, 10, seed=2)
+    legacy, _ = _split(texts, batched=False)
+    batched, calls = _split(texts, batched=True, embed_batch_size=15)
+
+    assert batched == legacy
+    # Un parent n'est jamais coupé entre deux appels : les lots contiennent des parents entiers
+    assert calls == [20, 20, 10]
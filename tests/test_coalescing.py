@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models import FakeListLLM
+
+from rag_engine.coalescing import SingleFlight, make_flight_key
+
+
+def _slow_llm() -> FakeListLLM:
+    # Réponse après 200 ms, comme un vrai appel au LLM ; `i` compte les appels
+    return FakeListLLM(responses=[f"réponse {i}" for i in range(100)], sleep=0.2)
+
+
+def test_identical_concurrent_calls_run_once():
+    llm = _slow_llm()
+    flight = SingleFlight()
+    key = make_flight_key("Quel est le préavis ?", [])
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run(key, lambda: llm.ainvoke("préavis")) for _ in range(20)))
+
+    answers = asyncio.run(scenario())
+    assert answers == ["réponse 0"] * 20
+    assert llm.i == 1
+    stats = flight.get_stats()
+    assert stats["computations"] == 1 and stats["coalesced"] == 19 and stats["in_flight"] == 0
+
+
+def test_normalized_question_shares_the_flight():
+    assert make_flight_key("Quel est  le PRÉAVIS ?", []) == make_flight_key("quel est le préavis ?", [])
+
+
+def test_different_keys_are_not_merged():
+    llm = _slow_llm()
+    flight = SingleFlight()
+    keys = [make_flight_key("préavis", []), make_flight_key("préavis", [], {"source": "/data/a.pdf"}),
+            make_flight_key("préavis", [{"role": "user", "content": "bonjour"}]),
+            make_flight_key("préavis", [], deadline_ms=500)]
+    assert len(set(keys)) == 4
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run(key, lambda: llm.ainvoke("préavis")) for key in keys))
+
+    assert sorted(asyncio.run(scenario())) == ["réponse 0", "réponse 1", "réponse 2", "réponse 3"]
+    assert llm.i == 4
+
+
+def test_leader_exception_reaches_every_follower():
+    flight = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        raise RuntimeError("LLM indisponible")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run("k", failing) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert calls == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "LLM indisponible" for r in results)
+    # La clé est libérée : l'appel suivant relance le calcul
+    with pytest.raises(RuntimeError):
+        asyncio.run(flight.run("k", failing))
+    assert calls == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_flight():
+    llm = _slow_llm()
+    flight = SingleFlight()
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.run("k", lambda: llm.ainvoke("préavis")))
+        second = asyncio.ensure_future(flight.run("k", lambda: llm.ainvoke("préavis")))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "réponse 0"
+    assert llm.i == 1
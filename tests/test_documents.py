@@ -0,0 +1,169 @@
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.stores import InMemoryStore
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from rag_engine import documents, router
+from rag_engine.ann_store import LocalANNVectorStore
+from rag_engine.registry import SourceRegistry
+from rag_engine.vector_store import FilteredParentDocumentRetriever
+
+
+class FakeRouter:
+    """Un parent par ligne du fichier ; un fichier contenant "ERREUR" fait échouer le traitement."""
+
+    def route_and_process(self, path):
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        if "ERREUR" in content:
+            raise RuntimeError("parseur en panne")
+        return [Document(page_content=line, metadata={"source": path}) for line in content.splitlines() if line]
+
+
+class FlakyDocstore(InMemoryStore):
+    """Docstore dont la prochaine suppression échoue (arrêt du processus en pleine suppression)."""
+
+    fail_next_delete = False
+
+    def mdelete(self, keys):
+        if self.fail_next_delete:
+            self.fail_next_delete = False
+            raise RuntimeError("interruption")
+        super().mdelete(keys)
+
+
+class FakeParseCache:
+    dropped = []
+
+    def drop(self, file_hash):
+        self.dropped.append(file_hash)
+
+    def prune(self, live_hashes):
+        return 0
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(router, "DocumentRouter", FakeRouter)
+    monkeypatch.setattr(documents, "ParseCache", FakeParseCache)
+    monkeypatch.setattr(documents, "live_file_hashes_all", lambda: set())
+    FakeParseCache.dropped = []
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    retriever = FilteredParentDocumentRetriever(
+        vectorstore=LocalANNVectorStore(DeterministicFakeEmbedding(size=16), str(tmp_path / "ann"), index_type="ivf"),
+        docstore=FlakyDocstore(),
+        child_splitter=RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0),
+        registry=SourceRegistry(str(tmp_path / "doc_map.db")),
+        bm25_index_path=str(tmp_path / "bm25.pkl"),
+    )
+    return retriever, str(data_dir)
+
+
+def _upload(data_dir, name, content):
+    path = os.path.join(data_dir, f".uploading-{name}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def _live_children(retriever):
+    return [child_id for child_id, _, _ in retriever.vectorstore.iter_records()]
+
+
+def test_replace_source_swaps_versions(corpus):
+    retriever, data_dir = corpus
+    result = documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "v1 a\nv1 b\n"), data_dir)
+    source = result["source"]
+    assert result["fragments"] == 2
+    assert open(source, encoding="utf-8").read() == "v1 a\nv1 b\n"
+    first_hash = retriever.registry.file_hash(source)
+
+    result = documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "v2 a\n"), data_dir)
+    assert result["removed_parents"] == 2
+    parents = retriever.docstore.mget(retriever.registry.parent_ids(source))
+    assert [d.page_content for d in parents] == ["v2 a"]
+    assert len(_live_children(retriever)) == 1
+    # Le hash enregistré est celui du fichier promu, et le cache de l'ancienne version est purgé
+    assert retriever.registry.file_hash(source) not in (None, first_hash)
+    assert FakeParseCache.dropped == [first_hash]
+    assert os.listdir(data_dir) == ["bail.txt"]
+
+
+def test_failed_processing_keeps_old_version_and_removes_upload(corpus):
+    retriever, data_dir = corpus
+    source = documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "v1\n"), data_dir)["source"]
+
+    with pytest.raises(RuntimeError):
+        documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "ERREUR\n"), data_dir)
+    with pytest.raises(ValueError):
+        documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", ""), data_dir)
+
+    assert os.listdir(data_dir) == ["bail.txt"]
+    assert open(source, encoding="utf-8").read() == "v1\n"
+    assert [d.page_content for d in retriever.docstore.mget(retriever.registry.parent_ids(source))] == ["v1"]
+
+
+def test_failed_indexing_does_not_promote_upload(corpus, monkeypatch):
+    retriever, data_dir = corpus
+    source = documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "v1\n"), data_dir)["source"]
+
+    def broken_index(*args, **kwargs):
+        raise RuntimeError("indexation impossible")
+
+    monkeypatch.setattr(documents, "index_documents", broken_index)
+    with pytest.raises(RuntimeError):
+        documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "v2\n"), data_dir)
+    assert os.listdir(data_dir) == ["bail.txt"]
+    assert open(source, encoding="utf-8").read() == "v1\n"
+
+
+def test_delete_source_removes_every_store(corpus):
+    retriever, data_dir = corpus
+    source = documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "a\nb\n"), data_dir)["source"]
+    documents.replace_source(retriever, "autre.txt", _upload(data_dir, "autre.txt", "c\n"), data_dir)
+
+    result = documents.delete_source(retriever, "bail.txt", data_dir=data_dir)
+    assert result == {"source": source, "removed_parents": 2, "removed_children": 2}
+    assert not os.path.exists(source)
+    assert [s["source"] for s in documents.list_sources(retriever)] == [os.path.join(data_dir, "autre.txt")]
+    assert len(list(retriever.docstore.yield_keys())) == 1
+    assert len(_live_children(retriever)) == 1
+    with pytest.raises(KeyError):
+        documents.delete_source(retriever, "bail.txt", data_dir=data_dir)
+
+
+def test_interrupted_delete_is_replayed_from_journal(corpus):
+    retriever, data_dir = corpus
+    documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "a\nb\n"), data_dir)
+    parent_ids = retriever.registry.parent_ids(os.path.join(data_dir, "bail.txt"))
+
+    retriever.docstore.fail_next_delete = True
+    with pytest.raises(RuntimeError):
+        documents.delete_source(retriever, "bail.txt", remove_file=False, data_dir=data_dir)
+    assert sorted(retriever.registry.pending_deletes()) == sorted(parent_ids)
+    assert len(_live_children(retriever)) == 2
+
+    assert documents.resume_pending_deletes(retriever) == 2
+    assert retriever.registry.pending_deletes() == []
+    assert retriever.registry.count_parents() == 0
+    assert list(retriever.docstore.yield_keys()) == []
+    assert _live_children(retriever) == []
+
+
+def test_vacuum_removes_orphans(corpus):
+    retriever, data_dir = corpus
+    documents.replace_source(retriever, "bail.txt", _upload(data_dir, "bail.txt", "a\nb\n"), data_dir)
+    # Parent et enfant écrits hors de la table de correspondance (indexation interrompue)
+    retriever.docstore.mset([("orphelin", Document(page_content="orphelin"))])
+    retriever.vectorstore.add_texts(["enfant orphelin"], [{"doc_id": "inconnu"}], ids=["enfant-orphelin"])
+
+    stats = documents.vacuum(retriever)
+    assert stats["orphan_parents"] == 1
+    assert stats["orphan_children"] == 1
+    assert stats["compacted_vectors"] == 1
+    assert "orphelin" not in set(retriever.docstore.yield_keys())
+    assert len(_live_children(retriever)) == 2
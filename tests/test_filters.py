@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.documents.compressor import BaseDocumentCompressor
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.stores import InMemoryStore
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from rag_engine.ann_store import LocalANNVectorStore
+from rag_engine.documents import backfill_header_paths
+from rag_engine.filters import build_where_filter, retrieval_filter
+from rag_engine.vector_store import FilteredBM25Retriever, FilteredParentDocumentRetriever
+
+
+def _docs():
+    return [
+        Document(page_content=f"contrat {i} clause de résiliation article {i}",
+                 metadata={"source": f"/data/doc{i % 2}.pdf", "header_path": "Contrat > Article 4"})
+        for i in range(20)
+    ]
+
+
+@pytest.fixture
+def parent_retriever(tmp_path):
+    vectorstore = LocalANNVectorStore(DeterministicFakeEmbedding(size=16), str(tmp_path / "ann"), index_type="ivf")
+    retriever = FilteredParentDocumentRetriever(
+        vectorstore=vectorstore,
+        docstore=InMemoryStore(),
+        child_splitter=RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0),
+        search_kwargs={"k": 6},
+        bm25_index_path=str(tmp_path / "bm25.pkl"),
+    )
+    retriever.add_documents(_docs())
+    return retriever
+
+
+def test_async_dense_leg_applies_filter(parent_retriever):
+    with retrieval_filter({"source": "/data/doc1.pdf"}):
+        sync_docs = parent_retriever.invoke("résiliation")
+        async_docs = asyncio.run(parent_retriever.ainvoke("résiliation"))
+    assert async_docs
+    assert {d.metadata["source"] for d in async_docs} == {"/data/doc1.pdf"}
+    assert [d.page_content for d in async_docs] == [d.page_content for d in sync_docs]
+
+
+def test_bm25_filter_restricts_candidates():
+    bm25 = FilteredBM25Retriever.from_documents(_docs(), k=5)
+    with retrieval_filter({"source": "/data/doc0.pdf"}):
+        first = bm25.invoke("clause article 4")
+        second = asyncio.run(bm25.ainvoke("clause article 4"))
+    assert first and {d.metadata["source"] for d in first} == {"/data/doc0.pdf"}
+    assert [d.page_content for d in first] == [d.page_content for d in second]
+
+
+def test_migrate_headers_enables_prefix_filter(parent_retriever):
+    where = build_where_filter(header_path_prefix="Contrat > Article 4")
+    with retrieval_filter(where):
+        assert parent_retriever.invoke("résiliation") == []
+
+    stats = backfill_header_paths(parent_retriever)
+    assert stats["parents"] == 20 and stats["children"] == 20
+    with retrieval_filter(where):
+        assert parent_retriever.invoke("résiliation")
+    # Idempotente
+    assert backfill_header_paths(parent_retriever)["parents"] == 0
+
+
+def test_refresh_bm25_is_incremental(parent_retriever, monkeypatch):
+    from rag_engine import vector_store
+
+    monkeypatch.setattr(vector_store, "BM25_BACKEND", "array")
+    bm25 = vector_store.load_or_build_bm25(parent_retriever.docstore, parent_retriever.bm25_index_path)
+    ensemble = vector_store.EnsembleRetriever(retrievers=[bm25, parent_retriever], weights=[0.5, 0.5])
+    read = []
+    real_records = vector_store._iter_docstore_records
+    monkeypatch.setattr(vector_store, "_iter_docstore_records",
+                        lambda docstore, keys: (read.extend(keys), real_records(docstore, keys))[1])
+
+    parent_retriever.add_documents([Document(page_content="avenant au bail commercial", metadata={"source": "/data/new.pdf"})])
+    vector_store.refresh_bm25(ensemble)
+    assert len(read) == 1
+    assert ensemble.retrievers[0].num_docs == 21
+    assert ensemble.retrievers[0].invoke("avenant")[0].metadata["source"] == "/data/new.pdf"
+
+
+def test_async_sync_bm25_reloads_in_executor(parent_retriever, monkeypatch):
+    from rag_engine import vector_store
+
+    monkeypatch.setattr(vector_store, "BM25_BACKEND", "array")
+    bm25 = vector_store.load_or_build_bm25(parent_retriever.docstore, parent_retriever.bm25_index_path)
+    ensemble = vector_store.EnsembleRetriever(retrievers=[bm25, parent_retriever], weights=[0.5, 0.5])
+    bm25._loaded_mtime -= 10  # Fichier plus récent : mis à jour par un autre worker
+
+    asyncio.run(vector_store.async_sync_bm25(ensemble))
+    assert ensemble.retrievers[0] is not bm25
+    assert not vector_store._bm25_is_stale(ensemble)
+
+
+def test_async_skip_rerank_returns_fusion_order(parent_retriever):
+    from rag_engine.admission import Degradation, degradation_scope
+    from rag_engine.vector_store import DeadlineAwareCompressionRetriever
+
+    class FailingCompressor(BaseDocumentCompressor):
+        def compress_documents(self, documents, query, callbacks=None):
+            raise AssertionError("le reranking aurait dû être sauté")
+
+    retriever = DeadlineAwareCompressionRetriever(base_compressor=FailingCompressor(), base_retriever=parent_retriever)
+    with degradation_scope(Degradation(skip_rerank=True)):
+        sync_docs = retriever.invoke("résiliation")
+        # Régression : sans `_aget_relevant_documents`, la voie async rerankait malgré la dégradation
+        async_docs = asyncio.run(retriever.ainvoke("résiliation"))
+    assert async_docs and [d.page_content for d in async_docs] == [d.page_content for d in sync_docs]
@@ -0,0 +1,86 @@
+import json
+import time
+
+from langchain_core.documents import Document
+
+from rag_engine import inference, reranker
+from rag_engine.inference import BucketedReranker, select_backend
+from rag_engine.reranker import BgeRerankCompressor, RerankScoreCache
+
+
+def test_bucketed_reranker_returns_scores_in_input_order():
+    batches = []
+
+    def score_batch(batch):
+        batches.append([len(q) + len(p) for q, p in batch])
+        return [float(len(p)) for _, p in batch]
+
+    pairs = [["question", "x" * n] for n in (50, 3, 400, 12, 7, 90, 1)]
+    scores = BucketedReranker(score_batch, batch_size=3).compute_score(pairs)
+
+    assert scores == [float(len(p)) for _, p in pairs]
+    # Lots formés par longueur croissante
+    flat = [length for batch in batches for length in batch]
+    assert flat == sorted(flat) and [len(b) for b in batches] == [3, 3, 1]
+
+
+def _autotune_env(monkeypatch, tmp_path):
+    path = tmp_path / "autotune.json"
+    monkeypatch.setattr(inference, "INFERENCE_AUTOTUNE_FILE", str(path))
+    monkeypatch.setattr(inference, "INFERENCE_BACKEND", "auto")
+    monkeypatch.setattr(inference, "has_cuda", lambda: False)
+    monkeypatch.setattr(inference, "_available_backends", lambda: ["torch", "onnx"])
+    return path
+
+
+def test_autotune_result_is_written_then_reused(monkeypatch, tmp_path):
+    path = _autotune_env(monkeypatch, tmp_path)
+    loads = []
+
+    def loader(model_name, backend):
+        loads.append(backend)
+        return {"torch": 0.01, "onnx": 0.0}[backend]
+
+    backend, model = select_backend("reranker", "bge", loader, time.sleep)
+    assert (backend, model) == ("onnx", 0.0) and loads == ["torch", "onnx"]
+    assert list(json.loads(path.read_text()).values()) == ["onnx"]
+
+    # Démarrage suivant : choix relu dans le fichier, aucun modèle chargé ni chronométré
+    loads.clear()
+    assert select_backend("reranker", "bge", loader, time.sleep) == ("onnx", None)
+    assert loads == []
+
+
+def test_autotune_file_written_elsewhere_is_read(monkeypatch, tmp_path):
+    path = _autotune_env(monkeypatch, tmp_path)
+    key = f"embeddings:e5:{inference._host_fingerprint()}"
+    path.write_text(json.dumps({key: "torch-int8"}))
+
+    def loader(model_name, backend):
+        raise AssertionError("aucun benchmark attendu")
+
+    assert select_backend("embeddings", "e5", loader, lambda m: None) == ("torch-int8", None)
+
+
+def test_rerank_cache_key_includes_backend(monkeypatch):
+    calls = {"torch": 0, "onnx": 0}
+
+    def make(backend, score):
+        def score_batch(batch):
+            calls[backend] += len(batch)
+            return [score] * len(batch)
+        return BucketedReranker(score_batch, backend=backend)
+
+    monkeypatch.setattr(reranker, "_shared_score_cache", RerankScoreCache(max_size=100))
+    docs = [Document(page_content="préavis de trois mois"), Document(page_content="loyer mensuel")]
+
+    monkeypatch.setattr(reranker, "load_reranker", lambda model_name: make("torch", 1.0))
+    torch_scores = BgeRerankCompressor(model_name="bge", min_score=None).score("préavis", docs)
+    monkeypatch.setattr(reranker, "load_reranker", lambda model_name: make("onnx", 2.0))
+    onnx = BgeRerankCompressor(model_name="bge", min_score=None)
+    onnx_scores = onnx.score("préavis", docs)
+
+    # Même modèle, même requête : l'exécution ONNX ne reçoit pas les scores mis en cache par torch
+    assert torch_scores == [1.0, 1.0] and onnx_scores == [2.0, 2.0]
+    assert calls == {"torch": 2, "onnx": 2}
+    assert onnx.score("préavis", docs) == [2.0, 2.0] and calls["onnx"] == 2
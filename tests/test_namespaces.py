@@ -0,0 +1,26 @@
+import pytest
+from langchain_core.documents import Document
+
+pytest.importorskip("langchain_groq")  # Importé par la chaîne RAG
+
+from rag_engine.namespaces import FanOutRetriever  # noqa: E402
+
+
+def _doc(text: str, score=None) -> Document:
+    return Document(page_content=text, metadata={} if score is None else {"relevance_score": score})
+
+
+def test_merge_sorts_scored_docs_even_when_some_lack_a_score():
+    fanout = FanOutRetriever(retrievers=[], names=["rh", "juridique"], k=5)
+    merged = fanout._merge([
+        [_doc("rh 1", 2.0), _doc("rh 2"), _doc("rh 3")],
+        [_doc("jur 1", 7.0), _doc("jur 2", 1.0), _doc("jur 3")],
+    ])
+    assert [d.page_content for d in merged] == ["jur 1", "rh 1", "jur 2", "rh 2", "jur 3"]
+    assert [d.metadata["namespace"] for d in merged[:2]] == ["juridique", "rh"]
+
+
+def test_merge_interleaves_without_scores():
+    fanout = FanOutRetriever(retrievers=[], names=["a", "b"], k=4)
+    merged = fanout._merge([[_doc("a1"), _doc("a2")], [_doc("b1"), _doc("b2"), _doc("b3")]])
+    assert [d.page_content for d in merged] == ["a1", "b1", "a2", "b2"]
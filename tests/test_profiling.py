@@ -0,0 +1,90 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from rag_engine.profiling import Profiler
+
+TOKEN = "jeton-de-test"
+
+
+def _busy(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def _parse_collapsed(content):
+    """Format "collapsed stacks" : une ligne `thread;f1;...;fN nombre` par pile distincte."""
+    stacks = {}
+    for line in content.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        frames = stack.split(";")
+        assert int(count) > 0 and len(frames) >= 2 and all(frames)
+        stacks[stack] = int(count)
+    return stacks
+
+
+def test_disabled_without_admin_token():
+    profiler = Profiler(enabled=True, admin_token=None)
+    assert not profiler.enabled and not profiler.is_admin(None)
+    assert profiler.start_request("/chat", requested=True) is None
+
+
+def test_cpu_window_produces_collapsed_stacks():
+    profiler = Profiler(enabled=True, admin_token=TOKEN)
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy, args=(stop,), name="calcul")
+    worker.start()
+    try:
+        profile_id = asyncio.run(profiler.cpu_window(0.3))
+    finally:
+        stop.set()
+        worker.join()
+
+    stacks = _parse_collapsed(profiler.get_profile(profile_id))
+    busy = [stack for stack in stacks if stack.startswith("calcul;") and "_busy (tests/test_profiling.py" in stack]
+    assert busy and sum(stacks[s] for s in busy) > 0
+    assert profiler.list_profiles()[0]["kind"] == "window"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    pytest.importorskip("langchain_groq")  # Importé par la chaîne RAG
+    os.environ.setdefault("DATABASE_URL", "sqlite://")  # database.py crée son moteur à l'import
+    from fastapi.testclient import TestClient
+
+    import main
+
+    def use(profiler):
+        monkeypatch.setattr(main, "profiler", profiler)
+        return TestClient(main.app)
+
+    return use
+
+
+def test_admin_endpoints_hidden_without_token(client):
+    http = client(Profiler(enabled=True, admin_token=None))
+    assert http.get("/admin/profiles").status_code == 404
+    assert http.get("/admin/profiles", headers={"X-Admin-Token": TOKEN}).status_code == 404
+    assert http.post("/admin/memory/snapshots").status_code == 404
+    response = http.get("/health?profile=1", headers={"X-Admin-Token": TOKEN})
+    assert "X-Profile-Id" not in response.headers
+
+
+def test_admin_endpoints_require_the_right_token(client):
+    profiler = Profiler(enabled=True, admin_token=TOKEN)
+    http = client(profiler)
+    assert http.get("/admin/profiles").status_code == 403
+    assert http.get("/admin/profiles", headers={"X-Admin-Token": "mauvais"}).status_code == 403
+    assert "X-Profile-Id" not in http.get("/health?profile=1", headers={"X-Admin-Token": "mauvais"}).headers
+    assert profiler.list_profiles() == []
+
+    response = http.get("/health?profile=1", headers={"X-Admin-Token": TOKEN})
+    assert response.headers["X-Profile-Id"] == profiler.list_profiles()[0]["id"]
+    response = http.post("/admin/profiles/cpu?seconds=0.1", headers={"X-Admin-Token": TOKEN})
+    assert response.status_code == 200
+    assert response.headers["content-disposition"].endswith('.folded"')
+    _parse_collapsed(response.text)
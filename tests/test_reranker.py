@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from rag_engine import reranker
+from rag_engine.reranker import CascadeRerankCompressor, RerankScoreCache, bypass_score_cache
+
+
+class FakeCrossEncoder:
+    """Score = nombre de mots de la requête présents dans le passage."""
+
+    def __init__(self):
+        self.pairs = 0
+
+    def compute_score(self, pairs):
+        self.pairs += len(pairs)
+        return [float(sum(w in text for w in query.split())) for query, text in pairs]
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    monkeypatch.setattr(reranker, "load_reranker", lambda model_name: FakeCrossEncoder())
+    monkeypatch.setattr(reranker, "_shared_score_cache", RerankScoreCache(max_size=100))
+    return CascadeRerankCompressor(top_n=5, min_score=None, accept_score=5.0)
+
+
+def _candidates():
+    docs = []
+    for i in range(12):
+        # Les deux premiers sont en tête des deux recherches, avec une nette marge de fusion
+        ranks = {"bm25": i + 1, "dense": i + 1} if i < 2 else {"bm25": i + 1}
+        fusion = 0.05 if i < 2 else 0.01
+        docs.append(Document(page_content=f"doc {i} " + ("préavis résiliation" if i % 3 == 0 else "autre"),
+                             metadata={"retrieval_ranks": ranks, "fusion_score": fusion}))
+    return docs
+
+
+def test_tier1_accepts_and_others_fill_top_n(cascade):
+    result = cascade.compress_documents(_candidates(), "préavis résiliation")
+    assert len(result) == 5
+    assert [d.metadata["rerank_tier"] for d in result[:2]] == [1, 1]
+    assert all("relevance_score" in d.metadata for d in result)
+    scores = [d.metadata["relevance_score"] for d in result]
+    assert scores[:2] == [5.0, 5.0] and max(scores[2:]) <= 5.0
+    # Les acceptés ne passent pas par les modèles
+    assert cascade._small._reranker.pairs == 10
+
+
+def test_tier1_acceptance_skips_the_big_model(monkeypatch):
+    models = {"small": FakeCrossEncoder(), "big": FakeCrossEncoder()}
+    monkeypatch.setattr(reranker, "load_reranker", lambda model_name: models[model_name])
+    monkeypatch.setattr(reranker, "_shared_score_cache", RerankScoreCache(max_size=100))
+
+    cascade = CascadeRerankCompressor(small_model_name="small", big_model_name="big", top_n=2, min_score=None)
+    result = cascade.compress_documents(_candidates(), "préavis résiliation")
+    assert [d.page_content for d in result] == [d.page_content for d in _candidates()[:2]]
+    assert models["small"].pairs == 0 and models["big"].pairs == 0
+
+    # top_n plus grand : les acceptés ne sont jamais envoyés au grand modèle
+    cascade = CascadeRerankCompressor(small_model_name="small", big_model_name="big", top_n=5,
+                                      min_score=None, small_margin=100.0)
+    result = cascade.compress_documents(_candidates(), "préavis résiliation")
+    assert models["big"].pairs == cascade.big_slice
+    assert [d.metadata["rerank_tier"] for d in result] == [1, 1, 3, 3, 3]
+    stats = cascade.get_stats()
+    assert stats["clock"] == "perf_counter" and stats["tiers"][3]["count"] == 1
+
+
+def test_async_matches_sync(cascade):
+    sync = cascade.compress_documents(_candidates(), "préavis résiliation")
+    result = asyncio.run(cascade.acompress_documents(_candidates(), "préavis résiliation"))
+    assert [d.page_content for d in result] == [d.page_content for d in sync]
+
+
+def test_no_agreement_reranks_everything(cascade):
+    docs = [Document(page_content=d.page_content, metadata={"retrieval_ranks": {"bm25": 1}}) for d in _candidates()]
+    result = cascade.compress_documents(docs, "préavis résiliation")
+    assert len(result) == 5 and all(d.metadata["rerank_tier"] > 1 for d in result)
+
+
+def test_disk_cache_is_bounded(tmp_path):
+    db_path = str(tmp_path / "rerank_cache.db")
+    cache = RerankScoreCache(max_size=10, db_path=db_path, max_disk_rows=50)
+    cache.set_many({f"old{i}": float(i) for i in range(40)})
+    assert cache.get_many(["old0"]) == {"old0": 0.0}  # Relue : devient récente
+    cache.set_many({f"new{i}": float(i) for i in range(40)})
+
+    rows = cache._db.execute("SELECT COUNT(*) FROM rerank_scores").fetchone()[0]
+    assert rows <= 50 and cache.disk_evictions > 0
+    # Un cache rouvert retrouve les entrées récentes ; "old0" a survécu grâce à sa lecture
+    reopened = RerankScoreCache(max_size=10, db_path=db_path, max_disk_rows=50)
+    assert reopened.get_many(["old0", "new39", "old1"]) == {"old0": 0.0, "new39": 39.0}
+
+
+def test_bypass_leaves_cache_untouched(cascade):
+    with bypass_score_cache():
+        cascade.compress_documents(_candidates(), "warmup")
+    assert reranker._shared_score_cache.get_stats()["size"] == 0
+    cascade.compress_documents(_candidates(), "warmup")
+    assert reranker._shared_score_cache.get_stats()["size"] > 0
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+from langchain_core.documents import Document
+
+from rag_engine.complexity import RoutingPlan
+from rag_engine.router import DocumentRouter
+
+
+class RecordingPipeline:
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def process(self, file_path, pages=None):
+        return [Document(page_content=f"{self.kind} {pages}", metadata={"source": file_path})]
+
+    def process_many(self, jobs):
+        return [self.process(*job) for job in jobs]
+
+
+def _router(monkeypatch, plan: RoutingPlan) -> DocumentRouter:
+    router = DocumentRouter.__new__(DocumentRouter)
+    router.text_pipeline = RecordingPipeline("text")
+    router.vision_pipeline = RecordingPipeline("vision")
+    monkeypatch.setattr(router, "_analyze_complexity", lambda file_path: plan)
+    return router
+
+
+def test_segments_follow_page_order():
+    plan = RoutingPlan(text_pages=[0, 1, 4], vision_pages=[2, 3, 5])
+    assert plan.segments() == [("text", [0, 1]), ("vision", [2, 3]), ("text", [4]), ("vision", [5])]
+
+
+def test_mixed_pdf_keeps_page_order(monkeypatch):
+    router = _router(monkeypatch, RoutingPlan(text_pages=[0, 3], vision_pages=[1, 2]))
+    expected = ["text [0]", "vision [1, 2]", "text [3]"]
+    assert [d.page_content for d in router.route_and_process("a.pdf")] == expected
+    many = router.route_and_process_many(["a.pdf", "notes.txt", "a.pdf"])
+    assert [d.page_content for d in many] == expected + ["text None"] + expected
+
+
+def test_single_pipeline_passes_whole_document(monkeypatch):
+    router = _router(monkeypatch, RoutingPlan(vision_pages=[0, 1, 2]))
+    assert [d.page_content for d in router.route_and_process("a.pdf")] == ["vision None"]
+
+
+def test_rulings_ignore_operators_inside_text():
+    pypdf = pytest.importorskip("pypdf")
+    from pypdf.generic import DecodedStreamObject, NameObject
+
+    from rag_engine.complexity import _count_rulings
+
+    writer = pypdf.PdfWriter()
+    page = writer.add_blank_page(600, 800)
+    stream = DecodedStreamObject()
+    stream.set_data(b"BT /F1 12 Tf (l re l re) Tj ET 10 10 m 100 10 l S 0 0 50 50 re f")
+    page[NameObject("/Contents")] = writer._add_object(stream)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    assert _count_rulings(pypdf.PdfReader(buffer).pages[0]) == 2
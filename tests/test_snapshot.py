@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import tarfile
+import threading
+
+import pytest
+
+from rag_engine import snapshot
+from rag_engine.documents import _write_lock
+
+
+@pytest.fixture
+def components(tmp_path, monkeypatch):
+    paths = {
+        "doc_store": str(tmp_path / "data" / "doc_store"),
+        "bm25_index.pkl": str(tmp_path / "data" / "bm25_index.pkl"),
+        "ann_index": str(tmp_path / "data" / "ann_index"),
+    }
+    monkeypatch.setattr(snapshot, "COMPONENTS", paths)
+    monkeypatch.setattr(snapshot, "DOC_STORE_DIR", paths["doc_store"])
+    return paths
+
+
+def _write(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def _read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+def _corpus(paths, version: str) -> None:
+    _write(os.path.join(paths["doc_store"], "parent"), version)
+    _write(paths["bm25_index.pkl"], version)
+    _write(os.path.join(paths["ann_index"], "vectors.npy"), version)
+
+
+def test_import_roundtrip(components, tmp_path):
+    _corpus(components, "nouveau")
+    archive = str(tmp_path / "snapshot.tar")
+    snapshot.export_snapshot(archive)
+    _corpus(components, "ancien")
+
+    snapshot.import_snapshot(archive)
+    assert _read(components["bm25_index.pkl"]) == "nouveau"
+    assert _read(os.path.join(components["ann_index"], "vectors.npy")) == "nouveau"
+    assert not [name for name in os.listdir(tmp_path / "data") if ".snapshot" in name]
+
+
+def test_failed_swap_keeps_previous_index(components, tmp_path, monkeypatch):
+    _corpus(components, "nouveau")
+    archive = str(tmp_path / "snapshot.tar")
+    snapshot.export_snapshot(archive)
+    _corpus(components, "ancien")
+
+    real_replace, calls = os.replace, []
+
+    def failing_replace(src, dst):
+        calls.append(dst)
+        if dst == components["ann_index"] and src.endswith(".snapshot_incoming"):
+            raise OSError("disque plein")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(snapshot.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        snapshot.import_snapshot(archive)
+    monkeypatch.setattr(snapshot.os, "replace", real_replace)
+
+    # doc_store et bm25 avaient déjà été remplacés : ils sont restaurés
+    assert components["doc_store"] in calls
+    assert _read(os.path.join(components["doc_store"], "parent")) == "ancien"
+    assert _read(components["bm25_index.pkl"]) == "ancien"
+    assert _read(os.path.join(components["ann_index"], "vectors.npy")) == "ancien"
+    assert not [name for name in os.listdir(tmp_path / "data") if ".snapshot" in name]
+
+
+def test_interrupted_swap_is_rolled_back_at_startup(components, tmp_path):
+    _corpus(components, "nouveau")
+    archive = str(tmp_path / "snapshot.tar")
+    snapshot.export_snapshot(archive)
+    _corpus(components, "ancien")
+
+    # Arrêt du processus après le remplacement du premier composant
+    staging = str(tmp_path / "staging")
+    _corpus({name: os.path.join(staging, name) for name in components}, "nouveau")
+    snapshot._stage_components(staging, list(components))
+    with open(snapshot._swap_journal_path(), "w") as f:
+        f.write('{"components": ["doc_store", "bm25_index.pkl", "ann_index"]}')
+    os.replace(components["doc_store"], components["doc_store"] + snapshot.BACKUP_SUFFIX)
+    os.replace(components["doc_store"] + ".snapshot_incoming", components["doc_store"])
+
+    assert snapshot.recover_interrupted_import()
+    assert _read(os.path.join(components["doc_store"], "parent")) == "ancien"
+    assert _read(components["bm25_index.pkl"]) == "ancien"
+    assert not snapshot.recover_interrupted_import()
+
+
+def test_manifest_hashes_the_archived_bytes(components, tmp_path):
+    _corpus(components, "contenu")
+    archive = str(tmp_path / "snapshot.tar")
+    manifest = snapshot.export_snapshot(archive)
+
+    with tarfile.open(archive) as tar:
+        assert json.load(tar.extractfile(snapshot.MANIFEST_NAME)) == manifest
+        archived = {
+            member.name: hashlib.sha256(tar.extractfile(member).read()).hexdigest()
+            for member in tar.getmembers() if member.name != snapshot.MANIFEST_NAME
+        }
+    assert archived == manifest["files"] and len(archived) == 3
+
+
+def test_export_waits_for_corpus_writes(components, tmp_path):
+    _corpus(components, "contenu")
+    archive = str(tmp_path / "snapshot.tar")
+    with _write_lock:
+        exporter = threading.Thread(target=snapshot.export_snapshot, args=(archive,))
+        exporter.start()
+        exporter.join(0.2)
+        # Une suppression ou un upload en cours : l'export attend qu'il se termine
+        assert exporter.is_alive() and not os.path.exists(archive)
+    exporter.join(5)
+    assert not exporter.is_alive() and os.path.exists(archive)
@@ -0,0 +1,27 @@
+from rag_engine.pipelines.parsers import BaseParser, ParseCache, file_sha256
+from rag_engine.pipelines.vision_pipeline import VisionPipeline
+
+
+class OfflineParser(BaseParser):
+    """Parseur sans clé : ne doit être appelé que sur un échec du cache."""
+    name = "offline"
+
+    def is_available(self) -> bool:
+        return False
+
+    def parse(self, file_path, pages=None):
+        raise AssertionError("parseur indisponible appelé")
+
+
+def test_cached_parse_is_used_without_parser(tmp_path):
+    path = tmp_path / "contrat.pdf"
+    path.write_bytes(b"%PDF-1.4 contenu")
+    cache = ParseCache(str(tmp_path / "parse_cache"))
+    parser = OfflineParser()
+    file_hash = file_sha256(str(path))
+    cache.set(file_hash, ParseCache.make_key(file_hash, parser), ["# Contrat\n## Article 4\nPréavis de trois mois."])
+
+    docs = VisionPipeline(parser=parser, cache=cache).process(str(path))
+    assert [d.metadata["pipeline"] for d in docs] == ["vision"]
+    assert docs[0].metadata["header_path"] == "Contrat > Article 4"
+    assert cache.hits == 1